@@ -4,11 +4,14 @@
 Lookup a list of DOI, refs #11958 (#note-9).
 """
 
+import collections
 import json
+import shutil
 import sys
+import tempfile
 from urllib.parse import quote_plus
 
-import requests
+from siskin.utils import URLCache
 
 solr = "http://localhost:8983/solr/biblio"
 
@@ -123,12 +126,15 @@ dois = [
 
 
 if __name__ == '__main__':
-    for doi in dois:
-        url = "%s/select?wt=json&q=%s" % (solr, quote_plus('"%s"' % doi))
-        r = requests.get(url)
-        if r.status_code >= 400:
-            raise RuntimeError("%s at %s" % (r.status_code, url))
-        resp = json.loads(r.text)
+    links = collections.OrderedDict(("%s/select?wt=json&q=%s" % (solr, quote_plus('"%s"' % doi)), doi) for doi in dois)
+    cachedir = tempfile.mkdtemp(prefix='siskin-')
+    try:
+        results = dict(URLCache(directory=cachedir, max_tries=3).get_many(links, workers=8))
+    finally:
+        shutil.rmtree(cachedir)
+
+    for url, doi in links.items():
+        resp = json.loads(results[url])
         isils = set()
         for doc in resp['response']['docs']:
             if not 'institution' in doc:
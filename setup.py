@@ -124,16 +124,20 @@ setup(name='siskin',
               'assets/87/*',
           ]},
       scripts=[
+          'bin/taskblocks',
           'bin/taskcat',
           'bin/taskchecksetup',
           'bin/taskcleanup',
           'bin/taskconfig',
+          'bin/taskd',
+          'bin/taskdedup',
           'bin/taskdeps',
           'bin/taskdeps-dot',
           'bin/taskdir',
           'bin/taskdo',
           'bin/taskdocs',
           'bin/taskdu',
+          'bin/taskfacetqa',
           'bin/taskgc',
           'bin/taskhash',
           'bin/taskhead',
@@ -142,6 +146,7 @@ setup(name='siskin',
           'bin/taskimportcache',
           'bin/taskinspect',
           'bin/taskless',
+          'bin/tasklookup',
           'bin/taskls',
           'bin/tasknames',
           'bin/taskopen',
@@ -149,11 +154,13 @@ setup(name='siskin',
           'bin/taskps',
           'bin/taskredo',
           'bin/taskrm',
+          'bin/taskstats',
           'bin/taskstatus',
           'bin/tasktags',
           'bin/tasktree',
           'bin/taskversion',
           'bin/taskwc',
+          'bin/taskzstd',
       ],
       entry_points={
         'console_scripts': [
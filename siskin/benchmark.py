@@ -28,8 +28,8 @@ Provides a basic benchmark decorator. Usage:
     def run():
         print('Running...')
 
-Just logs the output. Could be extended to send this information to some
-service if available.
+Logs the output and records resource usage in the metrics store, see
+siskin.metrics.
 """
 
 import functools
@@ -37,6 +37,8 @@ import logging
 from builtins import object
 from timeit import default_timer
 
+from siskin import metrics
+
 logger = logging.getLogger('gluish')
 
 
@@ -98,8 +100,14 @@ def timed(method):
         """
         Benchmark decorator.
         """
-        with Timer() as timer:
-            result = method(*args, **kwargs)
+        measurement, obj = metrics.Measurement(), args[0] if args else None
+        try:
+            with Timer() as timer:
+                result = method(*args, **kwargs)
+        except Exception:
+            metrics.record(measurement.finish(task=obj, method=method.__name__, status='failure'))
+            raise
+        metrics.record(measurement.finish(task=obj, method=method.__name__))
         klass = args[0].__class__.__name__
         fun = method.__name__
 
@@ -112,4 +120,6 @@ def timed(method):
             logger.debug(red(msg))
         return result
 
+    # Task runs measured here are not measured again by the task events.
+    _timed.timed = True
     return _timed
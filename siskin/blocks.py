@@ -0,0 +1,359 @@
+# coding: utf-8
+# pylint: disable=C0301,C0103
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Block index for compressed JSON lines files, for parallel scans and random
+access by record number.
+
+Compressed outputs are sequences of independently compressed blocks: gzip
+members (written by BlockedGzipWriter, similar to BGZF, but with blocks cut
+at line boundaries) or frames of seekable zstd files, see siskin.seekable.
+The index maps record ordinals to compressed offsets and is stored next to
+the file, as FILE.idx:
+
+    # siskin block index 1	123456789
+    0	40122	0	4193011	0	4194297
+    40122	40020	4193011	4191225	4194297	4194255
+    ...
+
+Columns are first record, number of records, compressed offset and size,
+decompressed offset and size; the header contains the size of the indexed
+file, an index of a file with a different size is ignored.
+
+    >>> blocks = load_index('file.ldj.gz')
+    >>> for line in lines('file.ldj.gz', start=1000000, stop=1000010):
+    ...     pass
+    >>> for part in split('file.ldj.gz', 4):  # e.g. one per process
+    ...     for line in part:
+    ...         pass
+
+Files written by other tools (e.g. a single gzip member from pigz) can be
+indexed as well, but consist of a single block, and thus cannot be split.
+"""
+
+import bisect
+import collections
+import gzip
+import logging
+import os
+import shutil
+import zlib
+
+import luigi
+from siskin import seekable
+
+logger = logging.getLogger('siskin')
+
+BLOCK_SIZE = 1 << 22
+HEADER = '# siskin block index 1'
+
+Block = collections.namedtuple('Block', 'record records offset size doffset dsize')
+
+
+class BlockedGzipWriter(seekable.SeekableWriter):
+    """
+    Write data to a binary file object as a sequence of gzip members, cut at
+    line boundaries and compressed in parallel. The result is a regular gzip
+    file.
+    """
+    def __init__(self, fileobj, block_size=BLOCK_SIZE, level=6, workers=None):
+        super(BlockedGzipWriter, self).__init__(fileobj, frame_size=block_size, level=level, workers=workers)
+
+    def _compress(self, data):
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def _write_trailer(self):
+        pass
+
+
+class BlockedGzipFormat(luigi.format.Format):
+    """
+    Blocked gzip format for luigi targets. Reading uses unpigz or gzip,
+    writing happens in process.
+    """
+    input = 'bytes'
+    output = 'bytes'
+
+    def __init__(self, block_size=BLOCK_SIZE, level=6):
+        self.block_size = block_size
+        self.level = level
+
+    def pipe_reader(self, input_pipe):
+        return luigi.format.InputPipeProcessWrapper(seekable.cat_command('.gz').split(), input_pipe)
+
+    def pipe_writer(self, output_pipe):
+        return BlockedGzipWriter(output_pipe, block_size=self.block_size, level=self.level)
+
+
+BlockedGzip = BlockedGzipFormat()
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+def _gzip_members(handle, bufsize=1 << 20):
+    """
+    Yield compressed offset and size, decompressed size, number of newlines
+    and the last byte of each gzip member in a file.
+    """
+    offset, pos, data = 0, 0, b''
+    decomp, dsize, newlines, last = zlib.decompressobj(31), 0, 0, b''
+    while True:
+        if not data:
+            data = handle.read(bufsize)
+            if not data:
+                break
+        out = decomp.decompress(data)
+        if out:
+            dsize, newlines, last = dsize + len(out), newlines + out.count(b'\n'), out[-1:]
+        if not decomp.eof:
+            pos, data = pos + len(data), b''
+            continue
+        pos += len(data) - len(decomp.unused_data)
+        yield offset, pos - offset, dsize, newlines, last
+        offset, data = pos, decomp.unused_data
+        decomp, dsize, newlines, last = zlib.decompressobj(31), 0, 0, b''
+        if data.strip(b'\x00') == b'' and not handle.peek(1):
+            break  # trailing padding
+    if pos > offset and not decomp.eof:
+        raise RuntimeError('truncated gzip file')
+
+
+def _zstd_frames(path, workers=None):
+    """
+    Yield compressed offset and size, decompressed size, number of newlines
+    and the last byte of each frame of a seekable zstd file.
+    """
+    reader = seekable.SeekableReader(path)
+    for frame, data in zip(reader.frames, reader.chunks(workers=workers)):
+        yield frame.offset, frame.size, frame.dsize, data.count(b'\n'), data[-1:]
+
+
+def build_index(path, workers=None):
+    """
+    Return the list of blocks of a blocked gzip or seekable zstd file. This
+    decompresses the whole file once. Adjacent blocks are merged, if a line
+    spans them.
+    """
+    if path.endswith('.zst'):
+        parts = _zstd_frames(path, workers=workers)
+    elif path.endswith('.gz'):
+        handle = open(path, 'rb')
+        parts = _gzip_members(handle)
+    else:
+        raise ValueError('cannot index %s, expected .gz or .zst file' % path)
+    blocks, pending, record, doffset = [], None, 0, 0
+    for offset, size, dsize, newlines, last in parts:
+        if pending is None:
+            pending = [offset, 0, 0, 0]
+        pending[1] += size
+        pending[2] += dsize
+        pending[3] += newlines
+        if last == b'\n':
+            blocks.append(Block(record, pending[3], pending[0], pending[1], doffset, pending[2]))
+            record, doffset, pending = record + pending[3], doffset + pending[2], None
+    if pending is not None and pending[2] > 0:
+        # Last line without newline.
+        blocks.append(Block(record, pending[3] + 1, pending[0], pending[1], doffset, pending[2]))
+    if path.endswith('.gz'):
+        handle.close()
+    return blocks
+
+
+def write_index(path, blocks):
+    """
+    Write the index for a file atomically to FILE.idx.
+    """
+    with luigi.LocalTarget(index_path(path)).open('w') as output:
+        output.write('%s\t%d\n' % (HEADER, os.path.getsize(path)))
+        for block in blocks:
+            output.write('\t'.join(str(v) for v in block) + '\n')
+
+
+def read_index(path):
+    """
+    Return the list of blocks from the index of a file or None, if there is
+    no index or it does not match the file.
+    """
+    filename = index_path(path)
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as handle:
+        header = handle.readline().rstrip('\n').split('\t')
+        if header[0] != HEADER or len(header) != 2 or int(header[1]) != os.path.getsize(path):
+            logger.debug('ignoring outdated index %s', filename)
+            return None
+        return [Block(*map(int, line.split('\t'))) for line in handle if line.strip()]
+
+
+def load_index(path, build=True, save=True):
+    """
+    Return the blocks of a file, from the index, if possible. Otherwise the
+    index is built (if build is set) and saved, if save is set and the
+    directory is writable.
+    """
+    blocks = read_index(path)
+    if blocks is not None or not build:
+        return blocks
+    blocks = build_index(path)
+    if save:
+        try:
+            write_index(path, blocks)
+        except (IOError, OSError) as err:
+            logger.debug('could not save index for %s: %s', path, err)
+    return blocks
+
+
+def open_blocks(path, blocks):
+    """
+    Return a binary file object, starting at the first of a contiguous list
+    of blocks. For gzip files, it does not stop at the last block.
+    """
+    if path.endswith('.zst'):
+        reader = seekable.SeekableReader(path)
+        first, last = blocks[0], blocks[-1]
+        frames = [f for f in reader.frames if first.doffset <= f.doffset < last.doffset + last.dsize]
+        return reader.open(frames=frames)
+    handle = open(path, 'rb')
+    handle.seek(blocks[0].offset)
+    return gzip.GzipFile(fileobj=handle, mode='rb')
+
+
+class BlockRange(object):
+    """
+    A contiguous range of blocks of a file, iterating over it yields lines.
+    Instances are picklable, e.g. to be passed to worker processes.
+    """
+    def __init__(self, path, blocks):
+        self.path = path
+        self.blocks = blocks
+
+    @property
+    def record(self):
+        """
+        Ordinal of the first record in this range.
+        """
+        return self.blocks[0].record if self.blocks else 0
+
+    @property
+    def records(self):
+        return sum(block.records for block in self.blocks)
+
+    def __iter__(self):
+        if not self.blocks:
+            return
+        remaining = sum(block.dsize for block in self.blocks)
+        handle = open_blocks(self.path, self.blocks)
+        raw = getattr(handle, 'fileobj', None)
+        try:
+            for line in handle:
+                yield line
+                remaining -= len(line)
+                if remaining <= 0:
+                    return
+        finally:
+            handle.close()
+            if raw is not None:
+                raw.close()
+
+    def __repr__(self):
+        return '<BlockRange %s records %d-%d>' % (self.path, self.record, self.record + self.records)
+
+
+def split(path, n, blocks=None):
+    """
+    Split a file into at most n ranges of about the same decompressed size,
+    to be read independently. The number of ranges is limited by the number
+    of blocks.
+    """
+    blocks = load_index(path) if blocks is None else blocks
+    total = sum(block.dsize for block in blocks)
+    ranges, current, size = [], [], 0
+    for block in blocks:
+        current.append(block)
+        size += block.dsize
+        if size * n >= total * (len(ranges) + 1) and len(ranges) < n - 1:
+            ranges.append(BlockRange(path, current))
+            current = []
+    if current or not ranges:
+        ranges.append(BlockRange(path, current))
+    return ranges
+
+
+def lines(path, start=0, stop=None, blocks=None):
+    """
+    Yield lines (records) with ordinals from start up to stop, only
+    decompressing the blocks needed.
+    """
+    blocks = load_index(path) if blocks is None else blocks
+    selected = [b for b in blocks if b.record + b.records > start and (stop is None or b.record < stop)]
+    record = selected[0].record if selected else start
+    for line in BlockRange(path, selected):
+        if stop is not None and record >= stop:
+            return
+        if record >= start:
+            yield line
+        record += 1
+
+
+def read_at(path, offset, size, blocks=None):
+    """
+    Read size bytes at a decompressed offset of a blocked gzip, seekable
+    zstd or uncompressed file.
+    """
+    if not path.endswith(('.gz', '.zst')):
+        with open(path, 'rb') as handle:
+            handle.seek(offset)
+            return handle.read(size)
+    if path.endswith('.zst') and blocks is None:
+        return seekable.SeekableReader(path).read(offset, size)
+    blocks = load_index(path) if blocks is None else blocks
+    i = bisect.bisect_right([b.doffset for b in blocks], offset) - 1
+    if i < 0 or offset >= blocks[i].doffset + blocks[i].dsize:
+        return b''
+    handle = open_blocks(path, blocks[i:i + 1])
+    raw = getattr(handle, 'fileobj', None)
+    try:
+        skip = offset - blocks[i].doffset
+        while skip > 0:
+            skipped = len(handle.read(min(skip, 1 << 22)))
+            if not skipped:
+                return b''
+            skip -= skipped
+        return handle.read(size)
+    finally:
+        handle.close()
+        if raw is not None:
+            raw.close()
+
+
+def is_indexable(path):
+    return path.endswith('.gz') or (path.endswith('.zst') and seekable.is_seekable(path))
+
+
+def compress_command():
+    """
+    Return a shell command, that compresses stdin to blocked gzip on stdout.
+    """
+    return 'taskblocks' if shutil.which('taskblocks') else 'pigz -c'
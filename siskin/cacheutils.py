@@ -1,5 +1,5 @@
 # coding: utf-8
-# pylint: disable=F0401,C0111,W0232,E1101,E1103,C0301,C0103,W0614,W0401
+# pylint: disable=F0401,C0111,W0232,E1101,E1103,C0301,C0103
 
 # Copyright 2015 by Leipzig University Library, http://ub.uni-leipzig.de
 #                   The Finc Authors, http://finc.info
@@ -22,20 +22,156 @@
 #
 # @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
 """
-Module exists, so we do not have to do star (*) imports in utils.py.
+A static task registry, mapping task names to module names.
+
+The command line entry points (e.g. taskdo and friends) need to know, in which
+module a task is defined. Importing all modules takes a few seconds, so
+instead we parse the source files and look for subclasses of luigi tasks,
+without importing anything.
+
+The registry is cached per user (under $XDG_CACHE_HOME/siskin or
+~/.cache/siskin) together with the modification time and size of each file.
+Only files that changed since the last run are parsed again. It is safe to
+remove the cache file at any time.
+
+Keep this module free of heavy imports, as it is used on every command line
+invocation.
 """
 
+import ast
+import glob
+import importlib
 import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger('siskin')
+
+# Names of base classes, which make a class a task.
+TASK_BASES = set(['Task', 'WrapperTask', 'ExternalTask', 'BaseTask'])
+
+# Bump, if the cache layout or the scanning rules change.
+REGISTRY_FORMAT = 1
+
+
+def task_registry_path():
+    """
+    Return the per-user path to the task registry cache file.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'siskin', 'task_registry.json')
+
+
+def package_modules():
+    """
+    Yield (module name, filename) tuples for all modules, that may contain tasks.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    for package in ('', 'sources', 'workflows'):
+        for filename in sorted(glob.glob(os.path.join(root, package, '*.py'))):
+            name = os.path.basename(filename)[:-3]
+            if name == '__init__' or name.startswith('test_'):
+                continue
+            yield '.'.join(v for v in ('siskin', package, name) if v), filename
+
+
+def _base_name(node):
+    """
+    Return a dotted name for a base class expression, e.g. "luigi.Task", or None.
+    """
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        prefix = _base_name(node.value)
+        return node.attr if prefix is None else '%s.%s' % (prefix, node.attr)
+    return None
+
+
+def scan_classes(filename):
+    """
+    Return a list of [classname, [basename, ...]] for all top level classes
+    defined in a Python source file.
+    """
+    with open(filename, 'rb') as handle:
+        tree = ast.parse(handle.read(), filename=filename)
+    classes = []
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            classes.append([node.name, [name for name in map(_base_name, node.bases) if name]])
+    return classes
+
+
+def resolve_tasks(files):
+    """
+    Given a dictionary mapping module names to scanned classes, return a
+    dictionary mapping task names to module names. A class is a task, if one
+    of its bases is a luigi task or another task found in the files.
+    """
+    tasks = {}
+    while True:
+        found = len(tasks)
+        for module in sorted(files):
+            for name, bases in files[module]['classes']:
+                if name in tasks:
+                    continue
+                if any(base.split('.')[-1] in TASK_BASES or base.split('.')[-1] in tasks for base in bases):
+                    tasks[name] = module
+        if len(tasks) == found:
+            break
+    return dict((name, module) for name, module in tasks.items() if name[0].isupper())
+
+
+def get_task_registry(path=None):
+    """
+    Return a dictionary mapping task names to module names. The registry is
+    loaded from the cache file and refreshed, if any source file changed.
+    """
+    path = path or task_registry_path()
+    cached = {}
+    try:
+        with open(path) as handle:
+            cached = json.load(handle)
+    except (IOError, OSError, ValueError) as err:
+        logger.debug("no usable task registry at %s: %s", path, err)
+    if cached.get('format') != REGISTRY_FORMAT:
+        cached = {}
+
+    previous, files = cached.get('files', {}), {}
+    for module, filename in package_modules():
+        st = os.stat(filename)
+        entry = previous.get(module)
+        if entry and entry['mtime'] == st.st_mtime and entry['size'] == st.st_size:
+            files[module] = entry
+        else:
+            files[module] = {'mtime': st.st_mtime, 'size': st.st_size, 'classes': scan_classes(filename)}
+
+    if cached and files == previous:
+        return cached['tasks']
 
-from luigi.task import Register
-from siskin.sources import *
-from siskin.workflows import *
+    registry = {'format': REGISTRY_FORMAT, 'files': files, 'tasks': resolve_tasks(files)}
+    try:
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), delete=False) as output:
+            json.dump(registry, output)
+        os.replace(output.name, path)
+        logger.debug("updated task registry at %s", path)
+    except (IOError, OSError) as err:
+        logger.debug("could not write task registry to %s: %s", path, err)
+    return registry['tasks']
 
 
-def _write_task_import_cache(path):
+def import_task_module(taskname):
     """
-    Write dictionary of task name module name mappings to given path.
+    Import the module, which defines the task and return it. If the task is
+    not found in the registry (e.g. a task from luigi or gluish), import all
+    sources and workflows and return None.
     """
-    with open(path, 'w') as output:
-        task_import_cache = dict([(name, Register.get_task_cls(name).__module__) for name in Register.task_names() if name[0].isupper()])
-        json.dump(task_import_cache, output)
+    registry = get_task_registry()
+    if taskname in registry:
+        return importlib.import_module(registry[taskname])
+    for module, _ in package_modules():
+        if module.startswith(('siskin.sources.', 'siskin.workflows.')):
+            importlib.import_module(module)
+    return None
@@ -0,0 +1,254 @@
+# coding: utf-8
+# pylint: disable=C0301,C0103
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Content addressed storage for task artifacts.
+
+Many dated tasks produce the same bytes week after week. With deduplication
+enabled for a task (see DefaultTask.DEDUPLICATE or the [core] dedup option),
+a finished output is fingerprinted and stored once under core.home:
+
+    $HOME/.cas/objects/3f/3f2a...c1
+
+The dated output path becomes a hardlink to that object, so an identical
+file costs no additional space. Objects are made read-only, since all links
+share the same inode.
+
+An object, that is not linked from anywhere else (link count one) is
+garbage and can be removed, e.g. after taskgc removed old outputs:
+
+    $ taskdedup report
+    $ taskdedup gc
+
+Results of expensive steps can also be reused by a fingerprint of their
+inputs, see ResultCache.
+
+"""
+
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+
+from siskin.configuration import Config
+from siskin.utils import compare_files
+
+logger = logging.getLogger('siskin')
+
+
+def default_root():
+    """
+    Return the root directory of the store, below core.home.
+    """
+    config = Config.instance()
+    home = config.get('core', 'home', fallback=os.path.join(tempfile.gettempdir(), 'siskin-data'))
+    return os.path.join(home, '.cas')
+
+
+def file_digest(path, blocksize=1 << 20):
+    """
+    Return the sha256 hexdigest of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        while True:
+            data = handle.read(blocksize)
+            if not data:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+
+class ArtifactStore(object):
+    """
+    Stores files by content, deduplicated via hardlinks.
+
+    >>> store = ArtifactStore()
+    >>> store.add('/data/28/DOAJDownloadDump/date-2021-01-04.json.gz')
+    '/data/.cas/objects/3f/3f2a...'
+    """
+    def __init__(self, root=None):
+        self.root = root or default_root()
+
+    def object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def objects(self):
+        """
+        Yield the paths of all objects.
+        """
+        base = os.path.join(self.root, 'objects')
+        if not os.path.exists(base):
+            return
+        for shard in sorted(os.listdir(base)):
+            for name in sorted(os.listdir(os.path.join(base, shard))):
+                yield os.path.join(base, shard, name)
+
+    def add(self, path):
+        """
+        Store a file and replace it with a hardlink to the stored object.
+        Returns the object path or None, if the file could not be linked,
+        e.g. because the store is on a different filesystem.
+        """
+        digest = file_digest(path)
+        target = self.object_path(digest)
+        try:
+            if os.path.exists(target):
+                if os.path.samefile(target, path):
+                    return target
+                if not compare_files(target, path):
+                    raise RuntimeError('digest collision or corrupt object: %s %s' % (target, path))
+                # Link next to the file first, then atomically replace it.
+                tmp = '%s.cas-%s' % (path, digest[:8])
+                os.link(target, tmp)
+                os.replace(tmp, path)
+                logger.debug('deduplicated %s via %s', path, target)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.link(path, target)
+                mode = os.stat(target).st_mode
+                os.chmod(target, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+                logger.debug('stored %s as %s', path, target)
+        except OSError as err:
+            if err.errno in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                logger.warning('cannot deduplicate %s: %s', path, err)
+                return None
+            raise
+        return target
+
+    def report(self):
+        """
+        Return a dictionary with the number of objects, links and orphans
+        (objects without any link), the bytes stored on disk and the bytes
+        saved by deduplication.
+        """
+        stats = dict(objects=0, links=0, orphans=0, stored=0, saved=0, garbage=0)
+        for path in self.objects():
+            st = os.stat(path)
+            links = st.st_nlink - 1
+            stats['objects'] += 1
+            stats['links'] += links
+            stats['stored'] += st.st_size
+            if links == 0:
+                stats['orphans'] += 1
+                stats['garbage'] += st.st_size
+            else:
+                stats['saved'] += st.st_size * (links - 1)
+        return stats
+
+    def gc(self, dry_run=False):
+        """
+        Remove objects, which are not linked from any output anymore. Returns
+        the list of removed (or, with dry_run, removable) objects.
+        """
+        removed = []
+        for path in self.objects():
+            if os.stat(path).st_nlink > 1:
+                continue
+            removed.append(path)
+            if not dry_run:
+                os.remove(path)
+                logger.debug('removed orphaned object %s', path)
+        return removed
+
+
+def fingerprint(paths=(), **params):
+    """
+    Return a sha256 hexdigest over the contents of files and parameters,
+    which must be JSON serializable.
+    """
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8'))
+    for path in paths:
+        digest.update(file_digest(path).encode('ascii'))
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    Reuse results of previous runs, keyed by a fingerprint of everything that
+    determines the result.
+
+    >>> cache = ResultCache()
+    >>> key = fingerprint([input_path], command='span-tag ...')
+    >>> if not cache.get(key, output_path):
+    ...     ...  # compute output_path
+    ...     cache.put(key, output_path)
+
+    Results are hardlinked, a cached result with a link count of one is not
+    used by any output anymore and can be removed with gc.
+    """
+    def __init__(self, root=None):
+        self.root = root or os.path.join(default_root(), 'results')
+
+    def result_path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key, path):
+        """
+        Link (or copy) a cached result to path, returns False, if there is
+        no result for the key.
+        """
+        cached = self.result_path(key)
+        if not os.path.exists(cached):
+            return False
+        tmp = '%s.result-%s' % (path, key[:8])
+        try:
+            os.link(cached, tmp)
+        except OSError:
+            shutil.copyfile(cached, tmp)
+        os.replace(tmp, path)
+        logger.debug('reused %s for %s', cached, path)
+        return True
+
+    def put(self, key, path):
+        """
+        Store a result. Failures are logged, but not raised.
+        """
+        cached = self.result_path(key)
+        try:
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            if not os.path.exists(cached):
+                os.link(path, cached)
+        except OSError as err:
+            logger.warning('cannot cache %s: %s', path, err)
+
+    def gc(self, dry_run=False):
+        """
+        Remove results, that are not linked from any output anymore.
+        """
+        removed = []
+        if not os.path.exists(self.root):
+            return removed
+        for shard in sorted(os.listdir(self.root)):
+            for name in sorted(os.listdir(os.path.join(self.root, shard))):
+                path = os.path.join(self.root, shard, name)
+                if os.stat(path).st_nlink > 1:
+                    continue
+                removed.append(path)
+                if not dry_run:
+                    os.remove(path)
+        return removed
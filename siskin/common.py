@@ -25,6 +25,7 @@
 Common tasks.
 """
 
+import collections
 import datetime
 import email.utils as eut
 import hashlib
@@ -40,6 +41,8 @@ import luigi
 from gluish.common import Executable
 from gluish.format import TSV
 from gluish.utils import shellout
+from siskin import ndjson
+from siskin.benchmark import timed
 from siskin.task import DefaultTask
 from siskin.utils import iterfiles, random_string
 
@@ -215,3 +218,80 @@ class RedmineDownloadAttachments(CommonTask):
 
     def output(self):
         return luigi.LocalTarget(path=self.path(ext='filelist'), format=TSV)
+
+
+def intermediate_schema_projections(docs, stats):
+    """
+    Project a batch of intermediate schema documents. Returns the DOIs, all
+    other projections are counted in stats, with (name, value) keys.
+    """
+    dois = []
+    for doc in docs:
+        doi = doc.get('doi')
+        if doi and '10.' in doi:
+            doi = doi[doi.index('10.'):].strip()
+            dois.append(doi)
+            stats[('prefix', doi.split('/', 1)[0])] += 1
+        for key in ('rft.issn', 'rft.eissn'):
+            for issn in doc.get(key) or []:
+                stats[('issn', issn.strip())] += 1
+        for name in doc.get('finc.mega_collection') or []:
+            stats[('collection', name)] += 1
+        stats[('format', (doc.get('finc.source_id', ''), doc.get('finc.format', '')))] += 1
+    return dois
+
+
+class IntermediateSchemaProjections(object):
+    """
+    Mixin for tasks that decompress an intermediate schema file once and
+    write a number of projections at the same time:
+
+    * doi: sorted list of unique DOIs
+    * issn: sorted list of unique ISSNs (from rft.issn and rft.eissn)
+    * prefix: DOI prefix and number of records
+    * collection: collection name and number of records
+    * format: source id, format and number of records
+
+    This is not a task by itself. Combine it with a source task (listed
+    second, so run and output are taken from here) and require the
+    intermediate schema file, e.g.
+
+        class JstorProjections(IntermediateSchemaProjections, JstorTask):
+            date = ClosestDateParameter(default=datetime.date.today())
+
+            def requires(self):
+                return JstorIntermediateSchema(date=self.date)
+    """
+    workers = luigi.IntParameter(default=4, significant=False, description='number of worker processes')
+
+    @timed
+    def run(self):
+        _, stopover = tempfile.mkstemp(prefix='siskin-')
+        stats = ndjson.transform(self.input().path, stopover, intermediate_schema_projections, workers=self.workers, ordered=False, batch=True)
+        self.record_count = stats['records.in']
+
+        output = shellout("LC_ALL=C sort -S25% -u {input} > {output}", input=stopover)
+        os.remove(stopover)
+        luigi.LocalTarget(output).move(self.output().get('doi').path)
+
+        counts = collections.defaultdict(dict)
+        for key, count in stats.items():
+            if isinstance(key, tuple):
+                counts[key[0]][key[1]] = count
+
+        with self.output().get('issn').temporary_path() as path:
+            with open(path, 'w') as output:
+                for issn in sorted(counts['issn']):
+                    output.write('%s\n' % issn)
+        for name in ('prefix', 'collection', 'format'):
+            with self.output().get(name).temporary_path() as path:
+                with open(path, 'w') as output:
+                    for value, count in sorted(counts[name].items()):
+                        value = value if isinstance(value, tuple) else (value, )
+                        output.write('\t'.join([str(v) for v in value] + [str(count)]) + '\n')
+
+    def output(self):
+        return {
+            name: luigi.LocalTarget(path=self.path(ext='%s.tsv' % name), format=TSV)
+            for name in ('doi', 'issn', 'prefix', 'collection', 'format')
+        }
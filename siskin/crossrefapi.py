@@ -0,0 +1,547 @@
+# coding: utf-8
+# pylint: disable=C0301,C0103
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Client for the Crossref REST API, for concurrent harvesting of /works.
+
+All requests of a client share a single rate limit (siskin.utils.TokenBucket),
+which is lowered, if the API announces a stricter limit via the
+X-Rate-Limit-Limit and X-Rate-Limit-Interval headers. Failed requests (HTTP
+429, 5xx or connection errors) are retried with exponential backoff.
+
+A harvesting window is split into smaller windows, until each has at most
+max_records records (or spans a single day), based on the total-results
+reported for a request with zero rows. The windows are then harvested
+concurrently, each with its own cursor:
+
+    >>> client = CrossrefClient(mailto='a@b.com', rate=10)
+    >>> with open('works.ldj.gz', 'wb') as output:
+    ...     harvest(client, datetime.date(2021, 1, 1), datetime.date(2021, 2, 1), output, workers=4)
+
+The output contains one API response per line, each as a separate gzip
+member, in window order, as written by CrossrefHarvestChunkWithCursor.
+Alternatively, the items are split off the responses while harvesting and
+written one per line, with the rest of each response (cursor, total-results
+and so on) written to a separate, small file:
+
+    >>> harvest(client, begin, end, output, envelopes=open('works.envelopes', 'wb'))
+
+Cursor walks are sorted by date and checkpointed after every page, so an
+interrupted harvest can continue where it stopped, see harvest_window.
+
+Member names for DOI prefixes are looked up concurrently and kept in a file,
+see MemberCache:
+
+    >>> cache = MemberCache('/path/to/members.tsv', ttl=2592000)
+    >>> cache.resolve(client, ['10.1016', '10.1007'], workers=4)
+    {'10.1007': 'Springer Science and Business Media LLC', '10.1016': 'Elsevier BV'}
+
+Configuration:
+
+    [crossref]
+
+    api-url = https://api.crossref.org
+    mailto = team@example.com
+    rate = 10
+    member-cache = /path/to/members.tsv
+    member-cache-ttl = 2592000
+
+"""
+
+import collections
+import concurrent.futures
+import datetime
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import urllib.parse
+import zlib
+
+import backoff
+import requests
+
+from siskin.configuration import Config
+from siskin.utils import TokenBucket
+
+logger = logging.getLogger('siskin')
+
+API_URL = 'https://api.crossref.org'
+
+Window = collections.namedtuple('Window', 'begin end count')
+
+
+class CrossrefClient(object):
+    """
+    A thread-safe client for the Crossref API, with a shared rate limit.
+    Defaults are taken from the crossref section of the configuration.
+    """
+    def __init__(self, api_url=None, mailto=None, rate=None, max_tries=10, timeout=300):
+        config = Config.instance()
+        self.api_url = (api_url or config.get('crossref', 'api-url', fallback=API_URL)).rstrip('/')
+        self.mailto = mailto or config.get('crossref', 'mailto', fallback=None)
+        self.rate = float(rate or config.get('crossref', 'rate', fallback=10))
+        self.bucket = TokenBucket(self.rate)
+        self.max_tries = max_tries
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def session(self):
+        """
+        Return a requests session for the current thread.
+        """
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def url(self, path, params=None):
+        """
+        Return the URL for an API path and parameters, with mailto, if
+        configured (https://git.io/vFyN5).
+        """
+        params = dict(params or {})
+        if self.mailto:
+            params['mailto'] = self.mailto
+        return '%s%s?%s' % (self.api_url, path, urllib.parse.urlencode(params))
+
+    def _adapt(self, headers):
+        """
+        Lower the rate, if the API announces a lower limit, e.g. "50" per "1s".
+        """
+        try:
+            limit = float(headers['X-Rate-Limit-Limit'])
+            interval = float(re.sub('s$', '', headers['X-Rate-Limit-Interval']))
+        except (KeyError, TypeError, ValueError):
+            return
+        if interval > 0 and limit / interval < self.bucket.rate:
+            logger.debug('lowering crossref rate to %s requests per second', limit / interval)
+            self.bucket.update(limit / interval)
+
+    def get(self, path, params=None):
+        """
+        Return the response body of an API request as bytes. Raises
+        RuntimeError, if the request failed after all retries.
+        """
+        url = self.url(path, params)
+
+        @backoff.on_exception(backoff.expo, (RuntimeError, requests.exceptions.RequestException), max_tries=self.max_tries)
+        def fetch():
+            self.bucket.acquire()
+            r = self.session().get(url, timeout=self.timeout)
+            self._adapt(r.headers)
+            if r.status_code == 429 or r.status_code >= 500:
+                raise RuntimeError('%s on %s' % (r.status_code, url))
+            if r.status_code >= 400:
+                raise ValueError('%s on %s' % (r.status_code, url))
+            return r.content
+
+        try:
+            return fetch()
+        except requests.exceptions.RequestException as err:
+            raise RuntimeError('failed to fetch %s: %s' % (url, err))
+
+    def count(self, filter):
+        """
+        Return the number of works matching a filter.
+        """
+        content = json.loads(self.get('/works', {'rows': 0, 'filter': filter}))
+        return content['message']['total-results']
+
+
+class MemberCache(object):
+    """
+    Names of members by DOI prefix, stored as TSV (prefix, name, time of
+    lookup) at path. Entries older than ttl seconds are looked up again.
+    Prefixes unknown to the API are cached as well, with an empty name.
+    """
+    def __init__(self, path, ttl=2592000):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as handle:
+                for line in handle:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) != 3:
+                        continue
+                    self.entries[fields[0]] = (fields[1], float(fields[2]))
+
+    def save(self):
+        """
+        Write all entries to the file, atomically.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=directory, encoding='utf-8', delete=False) as output:
+            for prefix, (name, fetched) in sorted(self.entries.items()):
+                output.write('%s\t%s\t%.0f\n' % (prefix, name, fetched))
+        os.chmod(output.name, 0o644)
+        os.rename(output.name, self.path)
+
+    def resolve(self, client, prefixes, workers=4):
+        """
+        Return a dictionary from prefix to member name (None, if unknown).
+        Missing and stale prefixes are looked up concurrently, the new
+        entries are saved, even if a lookup fails.
+        """
+        now, result, missing = time.time(), {}, []
+        for prefix in sorted(set(prefixes)):
+            entry = self.entries.get(prefix)
+            if entry is not None and entry[1] >= now - self.ttl:
+                result[prefix] = entry[0] or None
+            else:
+                missing.append(prefix)
+        if not missing:
+            return result
+        logger.debug('looking up %d of %d prefixes', len(missing), len(result) + len(missing))
+
+        def fetch(prefix):
+            try:
+                message = json.loads(client.get('/members/%s' % urllib.parse.quote(prefix)))['message']
+            except (ValueError, KeyError, TypeError):
+                return ''
+            return ' '.join((message.get('primary-name') or '').split())
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                for prefix, name in zip(missing, executor.map(fetch, missing)):
+                    self.entries[prefix] = (name, now)
+                    result[prefix] = name or None
+        finally:
+            self.save()
+        return result
+
+
+def date_filter(begin, end, kind='deposit'):
+    """
+    Return a filter for a window, begin and end inclusive, e.g. for deposit,
+    index or update dates.
+    """
+    return 'from-{kind}-date:{begin},until-{kind}-date:{end}'.format(kind=kind, begin=begin, end=end)
+
+
+def plan_windows(client, begin, end, kind='deposit', max_records=500000):
+    """
+    Return a list of windows covering begin to end (inclusive), each with at
+    most max_records works, unless it spans a single day. Without
+    max_records, the window is not split.
+    """
+    if max_records is None:
+        return [Window(begin, end, None)]
+    windows, stack = [], [(begin, end)]
+    while stack:
+        begin, end = stack.pop()
+        count = client.count(date_filter(begin, end, kind=kind))
+        if count <= max_records or begin >= end:
+            windows.append(Window(begin, end, count))
+            continue
+        middle = begin + datetime.timedelta(days=(end - begin).days // 2)
+        # Pushed in reverse, so windows are in date order.
+        stack.append((middle + datetime.timedelta(days=1), end))
+        stack.append((begin, middle))
+    logger.debug('planned %d windows with %d works', len(windows), sum(w.count for w in windows))
+    return windows
+
+
+# Sort field and item date field for each kind of date filter.
+SORT_FIELDS = {'deposit': 'deposited', 'index': 'indexed', 'update': 'updated'}
+
+
+class Checkpoint(object):
+    """
+    Progress of a cursor walk, stored as JSON in a file: the last committed
+    cursor, pages, items, the size of the output (and of the envelopes, if
+    items are split) and the date of the last item seen. Saved atomically.
+    """
+    def __init__(self, path, window, kind, split=False):
+        self.path = path
+        self.state = {
+            'begin': str(window.begin),
+            'end': str(window.end),
+            'kind': kind,
+            'split': split,
+            'since': str(window.begin),
+            'cursor': '*',
+            'pages': 0,
+            'items': 0,
+            'offset': 0,
+            'envelopes': 0,
+            'last': None,
+            'done': False,
+        }
+        if os.path.exists(path):
+            with open(path) as handle:
+                state = json.load(handle)
+            if all(state.get(k, False) == self.state[k] for k in ('begin', 'end', 'kind', 'split')):
+                self.state = state
+            else:
+                logger.warning('ignoring checkpoint for a different window: %s', path)
+
+    def __getitem__(self, key):
+        return self.state[key]
+
+    def update(self, **kwargs):
+        self.state.update(kwargs)
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(self.path)), delete=False) as output:
+            json.dump(self.state, output)
+        os.rename(output.name, self.path)
+
+
+def _item_date(item, field):
+    """
+    Return the date of an item as YYYY-MM-DD or None.
+    """
+    value = item.get(field) or {}
+    if value.get('date-time'):
+        return value['date-time'][:10]
+    try:
+        return '%04d-%02d-%02d' % tuple(value['date-parts'][0])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+_WS = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+
+
+def _member(text, pos):
+    """
+    Return the next key of an object and the position of its value or None
+    and the position after the object, starting after "{" or a value.
+    """
+    pos = _WS.match(text, pos).end()
+    if text[pos] == '}':
+        return None, pos + 1
+    if text[pos] == ',':
+        pos = _WS.match(text, pos + 1).end()
+    key, pos = _DECODER.raw_decode(text, pos)
+    if not isinstance(key, str):
+        raise ValueError('expected key at %d' % pos)
+    pos = _WS.match(text, pos).end()
+    if text[pos] != ':':
+        raise ValueError('expected colon at %d' % pos)
+    return key, _WS.match(text, pos + 1).end()
+
+
+def _expect(text, pos, c):
+    pos = _WS.match(text, pos).end()
+    if text[pos] != c:
+        raise ValueError('expected %s at %d' % (c, pos))
+    return pos + 1
+
+
+def split_response(body, envelope):
+    """
+    Yield the message items of an API response as lines of JSON (bytes),
+    as they were sent. The response is not parsed as a whole, items are
+    decoded one at a time, only to find their end. Everything else is
+    stored in dictionary envelope, with the number of items under
+    message.items; the envelope is complete after the last item.
+    """
+    text = body.decode('utf-8') if isinstance(body, bytes) else body
+    pos = _expect(text, 0, '{')
+    while True:
+        key, pos = _member(text, pos)
+        if key is None:
+            return
+        if key != 'message':
+            envelope[key], pos = _DECODER.raw_decode(text, pos)
+            continue
+        message = envelope['message'] = {}
+        pos = _expect(text, pos, '{')
+        while True:
+            key, pos = _member(text, pos)
+            if key is None:
+                break
+            if key != 'items':
+                message[key], pos = _DECODER.raw_decode(text, pos)
+                continue
+            message['items'] = 0
+            pos = _WS.match(text, _expect(text, pos, '[')).end()
+            if text[pos] == ']':
+                pos += 1
+                continue
+            while True:
+                _, end = _DECODER.raw_decode(text, pos)
+                item = text[pos:end]
+                if '\n' in item:
+                    item = json.dumps(json.loads(item))
+                yield item.encode('utf-8')
+                message['items'] += 1
+                pos = _WS.match(text, end).end()
+                if text[pos] == ']':
+                    pos += 1
+                    break
+                if text[pos] != ',':
+                    raise ValueError('expected comma at %d' % pos)
+                pos = _WS.match(text, pos + 1).end()
+
+
+def harvest_window(client, window, path, kind='deposit', rows=1000, split=False):
+    """
+    Walk a window with a cursor, in date order, and write each response as a
+    line into a separate gzip member to a file at path. After each page, the
+    progress is saved to path.checkpoint. If a checkpoint exists, the file is
+    truncated to the last committed page and the walk continues from there.
+    If the cursor has expired, a new walk starts at the date of the last item
+    seen, so items of that day may be written again. Returns a Counter with
+    the number of pages and items.
+
+    With split set, the items of a response are written one per line
+    instead, as they are read from the response (see split_response), and
+    the rest of each response, together with the cursor used, as a line to
+    path.envelopes.
+    """
+    checkpoint = Checkpoint(path + '.checkpoint', window, kind, split=split)
+    if checkpoint['done']:
+        return collections.Counter(pages=checkpoint['pages'], items=checkpoint['items'])
+    if checkpoint['pages']:
+        logger.debug('resuming %s at page %d, offset %d', path, checkpoint['pages'], checkpoint['offset'])
+    field = SORT_FIELDS.get(kind, 'deposited')
+    sidecar = None
+    if split:
+        sidecar = open(path + '.envelopes', 'r+b' if os.path.exists(path + '.envelopes') else 'wb')
+        sidecar.truncate(checkpoint['envelopes'])
+        sidecar.seek(checkpoint['envelopes'])
+    try:
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as output:
+            output.truncate(checkpoint['offset'])
+            output.seek(checkpoint['offset'])
+            while True:
+                params = {
+                    'rows': rows,
+                    'filter': date_filter(checkpoint['since'], window.end, kind=kind),
+                    'sort': field,
+                    'order': 'asc',
+                    'cursor': checkpoint['cursor'],
+                }
+                try:
+                    body = client.get('/works', params)
+                except ValueError as err:
+                    if checkpoint['cursor'] == '*':
+                        raise
+                    since = checkpoint['last'] or checkpoint['since']
+                    logger.warning('cursor failed (%s), restarting walk at %s', err, since)
+                    checkpoint.update(since=since, cursor='*')
+                    continue
+                if split:
+                    envelope, last = {'cursor': checkpoint['cursor']}, None
+                    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+                    for item in split_response(body, envelope):
+                        if last is not None:
+                            output.write(compressor.compress(last + b'\n'))
+                        last = item
+                    if last is None:
+                        break
+                    output.write(compressor.compress(last + b'\n'))
+                    output.write(compressor.flush())
+                    message, last = envelope['message'], json.loads(last)
+                    count = message['items']
+                else:
+                    message = json.loads(body)['message']
+                    if not message['items']:
+                        break
+                    output.write(gzip.compress(body.rstrip(b'\n') + b'\n'))
+                    last, count = message['items'][-1], len(message['items'])
+                if 'next-cursor' not in message:
+                    raise RuntimeError('missing key: next-cursor')
+                output.flush()
+                os.fsync(output.fileno())
+                if sidecar is not None:
+                    sidecar.write(json.dumps(envelope).encode('utf-8') + b'\n')
+                    sidecar.flush()
+                    os.fsync(sidecar.fileno())
+                checkpoint.update(cursor=message['next-cursor'],
+                                  pages=checkpoint['pages'] + 1,
+                                  items=checkpoint['items'] + count,
+                                  offset=output.tell(),
+                                  envelopes=sidecar.tell() if sidecar is not None else 0,
+                                  last=_item_date(last, field) or checkpoint['last'])
+    finally:
+        if sidecar is not None:
+            sidecar.close()
+    checkpoint.update(done=True)
+    logger.debug('%s to %s: %d items in %d pages', window.begin, window.end, checkpoint['items'], checkpoint['pages'])
+    return collections.Counter(pages=checkpoint['pages'], items=checkpoint['items'])
+
+
+def harvest(client, begin, end, fileobj, kind='deposit', workers=4, rows=1000, max_records=500000, directory=None, envelopes=None):
+    """
+    Harvest works from begin to end (inclusive) into a binary file object,
+    with windows harvested concurrently. Returns a Counter with windows,
+    pages and items.
+
+    If a binary file object for envelopes is given, items are written one
+    per line and the rest of the responses go to envelopes, see
+    harvest_window.
+
+    Windows are harvested into files in directory (by default a temporary
+    directory, removed at the end). If a previous harvest into the same
+    directory failed, the same windows are used and each window continues
+    from its checkpoint. Without max_records, a single window is used.
+    """
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='siskin-')
+        try:
+            return harvest(client, begin, end, fileobj, kind=kind, workers=workers, rows=rows, max_records=max_records, directory=directory,
+                           envelopes=envelopes)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+    plan = os.path.join(directory, 'windows.json')
+    if os.path.exists(plan):
+        with open(plan) as handle:
+            windows = [Window(datetime.date.fromisoformat(b), datetime.date.fromisoformat(e), c) for b, e, c in json.load(handle)]
+    else:
+        windows = plan_windows(client, begin, end, kind=kind, max_records=max_records)
+        with open(plan + '.tmp', 'w') as output:
+            json.dump([(str(w.begin), str(w.end), w.count) for w in windows], output)
+        os.rename(plan + '.tmp', plan)
+    stats = collections.Counter(windows=len(windows))
+
+    def window_path(window):
+        return os.path.join(directory, '%s-%s.ldj.gz' % (window.begin, window.end))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(harvest_window, client, window, window_path(window), kind=kind, rows=rows, split=envelopes is not None)
+            for window in windows
+        ]
+        try:
+            for window, future in zip(windows, futures):
+                stats.update(future.result())
+                with open(window_path(window), 'rb') as handle:
+                    shutil.copyfileobj(handle, fileobj, 1 << 20)
+                if envelopes is not None:
+                    with open(window_path(window) + '.envelopes', 'rb') as handle:
+                        shutil.copyfileobj(handle, envelopes, 1 << 20)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return stats
@@ -0,0 +1,358 @@
+# coding: utf-8
+# pylint: disable=C0301,C0103,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+An optional, long running process answering task queries over a unix socket.
+
+Tools like taskoutput are called many times from shell scripts (taskcat,
+taskdir, taskrm, ...) and each call pays for importing luigi, the config and
+the task modules. With a running daemon, the tools send their query to the
+daemon, which keeps modules and task objects warm:
+
+    $ taskd start &
+    $ taskoutput AMSLService
+    /tmp/siskin-data/amsl/AMSLService/a74d3106....json.gz
+
+If no daemon is running, the same query is answered in process, so the
+daemon is never required.
+
+Clients only talk to a socket owned by the current user, which is not
+writable by group or others; otherwise queries are answered in process.
+
+Queries are single JSON lines, e.g. {"command": "output", "args":
+["AMSLService"]}, answered by a single JSON line with either a "result" or an
+"error". Supported commands are output, dir, status, deps and names.
+
+The daemon stops itself, once a task module or a config file changes, since
+the imported code would be outdated; clients fall back to in process mode
+then. By default, the socket is kept in $XDG_RUNTIME_DIR or in a private
+(0700) siskin-UID directory in the tempdir. Configure the location with:
+
+    [daemon]
+
+    socket = /path/to/private/siskin.sock
+
+"""
+
+import collections
+import datetime
+import json
+import logging
+import os
+import re
+import socket
+import socketserver
+import stat
+import tempfile
+import threading
+from io import StringIO
+
+from siskin.cacheutils import get_task_registry, import_task_module, package_modules
+from siskin.configuration import Config
+
+logger = logging.getLogger('siskin')
+
+COMMANDS = ('output', 'dir', 'status', 'deps', 'names')
+
+
+def private_dir():
+    """
+    Return a directory only accessible by the current user: $XDG_RUNTIME_DIR
+    or siskin-UID in the tempdir, created with mode 0700. Raises
+    RuntimeError, if the directory belongs to someone else or is accessible
+    by others.
+    """
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime and os.path.isdir(runtime):
+        directory = runtime
+    else:
+        directory = os.path.join(tempfile.gettempdir(), 'siskin-%d' % os.getuid())
+        try:
+            os.mkdir(directory, 0o700)
+        except FileExistsError:
+            pass
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError('insecure directory for daemon socket: %s' % directory)
+    return directory
+
+
+def socket_path():
+    """
+    Return the path to the daemon socket, per user by default.
+    """
+    config = Config.instance()
+    path = config.get('daemon', 'socket', fallback=None)
+    if path:
+        return path
+    return os.path.join(private_dir(), 'siskin.sock')
+
+
+def check_socket(path):
+    """
+    Raise OSError, unless path is a socket owned by the current user and not
+    writable by group or others, so no other user can answer queries.
+    """
+    st = os.lstat(path)
+    if not stat.S_ISSOCK(st.st_mode):
+        raise OSError('not a socket: %s' % path)
+    if st.st_uid != os.getuid():
+        raise OSError('socket %s belongs to uid %d' % (path, st.st_uid))
+    if st.st_mode & 0o022:
+        raise OSError('socket %s is writable by group or others' % path)
+
+
+def sanitize(s):
+    """
+    Slightly sanitize string.
+    """
+    s = re.sub(r"host=[^ ,]+", "host=example.com", s, 0)
+    s = re.sub(r"username=[^ ,]+", "username=xxxx", s, 0)
+    s = re.sub(r"password=[^ ,]+", "password=xxxx", s, 0)
+    return s
+
+
+def dump_deps(root):
+    """
+    Return the dependency tree of a task as string, taken from https://git.io/vp2zB.
+    """
+    g, queue = collections.defaultdict(set), [root]
+    while len(queue) > 0:
+        task = queue.pop()
+        for dep in task.deps():
+            g[task].add(dep)
+            queue.append(dep)
+
+    output = StringIO()
+
+    def dump(node, indent=0):
+        if indent == 0:
+            output.write(u'%s ── %s\n' % ('    ' * indent, node))
+        else:
+            output.write(u'%s └─ %s\n' % ('    ' * indent, node))
+        for dep in g[node]:
+            dump(dep, indent=indent + 1)
+
+    dump(root)
+    return sanitize(output.getvalue())
+
+
+class TaskQueries(object):
+    """
+    Answer task queries in process. Task objects are cached per day, since
+    many tasks default to the current date.
+    """
+    def __init__(self):
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    def task(self, args):
+        """
+        Return the task object for command line arguments, e.g. ["AIExport",
+        "--date", "2021-01-01"]. Raises RuntimeError on invalid arguments.
+        """
+        from luigi.cmdline_parser import CmdlineParser
+        from luigi.parameter import MissingParameterException
+        from luigi.task_register import TaskClassNotFoundException
+
+        if not args:
+            raise RuntimeError('task name required')
+        key = (datetime.date.today(), tuple(args))
+        if key not in self.tasks:
+            import_task_module(args[0])
+            try:
+                self.tasks[key] = CmdlineParser(args).get_task_obj()
+            except MissingParameterException as err:
+                raise RuntimeError('missing parameter: %s' % err)
+            except TaskClassNotFoundException as err:
+                raise RuntimeError(str(err))
+            except SystemExit:
+                raise RuntimeError('invalid arguments: %s' % ' '.join(args))
+        return self.tasks[key]
+
+    def output(self, args):
+        try:
+            return self.task(args).output().path
+        except AttributeError:
+            raise RuntimeError('output of task has no path')
+
+    def handle(self, command, args):
+        """
+        Run a single command and return a JSON serializable result.
+        """
+        with self.lock:
+            if command == 'output':
+                return self.output(args)
+            if command == 'dir':
+                return os.path.dirname(self.output(args))
+            if command == 'status':
+                return {'done': self.task(args).complete(), 'output': self.output(args)}
+            if command == 'deps':
+                return dump_deps(self.task(args))
+            if command == 'names':
+                return sorted(get_task_registry().keys())
+        raise RuntimeError('unknown command: %s' % command)
+
+
+def signature():
+    """
+    Modification times of all task modules and config files. If these change,
+    a running daemon is outdated.
+    """
+    paths = [filename for _, filename in package_modules()] + list(Config._config_paths)
+    return [os.stat(path).st_mtime if os.path.exists(path) else None for path in paths]
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server, holding warm task queries.
+    """
+    daemon_threads = True
+
+    def __init__(self, path):
+        self.path = path
+        self.queries = TaskQueries()
+        self.signature = signature()
+        socketserver.UnixStreamServer.__init__(self, path, Handler)
+        os.chmod(path, 0o600)
+
+    def stop(self):
+        """
+        Stop serving, may be called from a request handler.
+        """
+        threading.Thread(target=self.shutdown).start()
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """
+    Read a single JSON line query, write a single JSON line response.
+    """
+    def handle(self):
+        try:
+            query = json.loads(self.rfile.readline().decode('utf-8'))
+            command, args = query.get('command'), query.get('args', [])
+        except ValueError as err:
+            return self.respond({'error': 'invalid query: %s' % err})
+
+        if command == 'ping':
+            return self.respond({'result': os.getpid()})
+        if command == 'shutdown':
+            self.respond({'result': 'ok'})
+            return self.server.stop()
+        if signature() != self.server.signature:
+            logger.info('task modules or config changed, stopping daemon')
+            self.respond({'stale': True})
+            return self.server.stop()
+        try:
+            self.respond({'result': self.server.queries.handle(command, args)})
+        except RuntimeError as err:
+            self.respond({'error': str(err)})
+        except Exception as err:
+            logger.exception('failed to answer %s %s', command, args)
+            self.respond({'error': '%s: %s' % (err.__class__.__name__, err)})
+
+    def respond(self, response):
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+def serve(path=None):
+    """
+    Serve queries until shutdown. Raises RuntimeError, if another daemon is
+    already listening on the socket.
+    """
+    path = path or socket_path()
+    if os.path.lexists(path):
+        try:
+            check_socket(path)
+        except OSError as err:
+            raise RuntimeError('refusing to use %s: %s' % (path, err))
+        try:
+            send('ping', path=path)
+        except (IOError, OSError):
+            logger.debug('removing stale socket at %s', path)
+            os.remove(path)
+        else:
+            raise RuntimeError('daemon already running at %s' % path)
+    server = Server(path)
+    logger.info('siskin daemon listening at %s', path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def send(command, args=None, path=None, timeout=300):
+    """
+    Send a query to a running daemon and return the decoded response. Raises
+    IOError or OSError, if the daemon is not reachable or the socket is not
+    trusted, see check_socket.
+    """
+    path = path or socket_path()
+    check_socket(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps({'command': command, 'args': args or []}).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as handle:
+            line = handle.readline()
+    finally:
+        sock.close()
+    if not line:
+        raise IOError('daemon closed connection')
+    return json.loads(line.decode('utf-8'))
+
+
+_queries = None
+
+
+def query(command, args=None, path=None):
+    """
+    Answer a query, via the daemon if it is running, in process otherwise.
+    Raises RuntimeError, if the query fails.
+    """
+    global _queries
+    if command not in COMMANDS:
+        raise RuntimeError('unknown command: %s' % command)
+    try:
+        path = path or socket_path()
+    except RuntimeError as err:
+        logger.warning('not using daemon: %s', err)
+        path = None
+    if path and os.path.lexists(path):
+        try:
+            response = send(command, args=args, path=path)
+            if 'error' in response:
+                raise RuntimeError(response['error'])
+            if 'result' in response:
+                return response['result']
+        except (IOError, OSError, ValueError) as err:
+            logger.debug('daemon at %s not usable: %s', path, err)
+    if _queries is None:
+        _queries = TaskQueries()
+    return _queries.handle(command, args or [])
@@ -0,0 +1,183 @@
+# coding: utf-8
+# pylint: disable=C0301,C0103
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Differences between two JSON lines files by id, e.g. two index exports.
+
+Each record is reduced to its id, a hash of its content and its offset;
+these keys are sorted externally (LC_ALL=C sort) and merged, so memory use
+does not depend on the size of the files:
+
+    >>> with open('upserts.ldj', 'wb') as upserts, open('deletes.txt', 'wb') as deletes:
+    ...     stats = diff('previous.ldj.gz', 'current.ldj.gz', upserts, deletes, field='id')
+    >>> stats
+    Counter({'unchanged': 81232201, 'records.old': 81599213, 'records.new': 81602112, 'upserts': 369911, 'deletes': 367012, ...})
+
+Upserts are the records of the new file, that are new or changed, in file
+order; deletes are the ids only found in the old file, one per line.
+Records are compared as written, so both files should be written by the
+same tool (e.g. span-export), with keys in the same order.
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from siskin.ndjson import open_file
+
+logger = logging.getLogger('siskin')
+
+
+def content_hash(line):
+    """
+    Return a short hex digest of a record.
+    """
+    return hashlib.blake2b(line.rstrip(b'\n'), digest_size=12).hexdigest().encode('ascii')
+
+
+def _sort(path, numeric=False, buffer_size='25%'):
+    """
+    Sort a file of tab separated keys in place, bytewise by the first column
+    or numerically.
+    """
+    env = dict(os.environ, LC_ALL='C')
+    cmd = ['sort', '-S', buffer_size, '-T', os.path.dirname(os.path.abspath(path)), '-t', '\t', '-o', path]
+    cmd += ['-n'] if numeric else ['-k1,1', '-s']
+    subprocess.run(cmd + [path], env=env, check=True)
+
+
+def write_keys(path, output, field='id'):
+    """
+    Write id, content hash and offset of each record of a file as sorted,
+    tab separated lines to output (a path). Returns the number of records.
+    """
+    count, offset = 0, 0
+    with open_file(path) as handle, open(output, 'wb') as out:
+        for line in handle:
+            if line.strip():
+                value = json.loads(line).get(field)
+                if value is None:
+                    raise RuntimeError('missing %s at offset %d in %s' % (field, offset, path))
+                key = str(value).encode('utf-8')
+                if b'\t' in key or b'\n' in key:
+                    raise RuntimeError('unsupported %s at offset %d in %s: %r' % (field, offset, path, key))
+                out.write(b'%s\t%s\t%d\n' % (key, content_hash(line), offset))
+                count += 1
+            offset += len(line)
+    _sort(output)
+    return count
+
+
+def _groups(path):
+    """
+    Yield id and the list of (hash, offset) of a sorted key file.
+    """
+    current, rows = None, []
+    with open(path, 'rb') as handle:
+        for line in handle:
+            key, digest, offset = line.rstrip(b'\n').split(b'\t')
+            if key != current:
+                if rows:
+                    yield current, rows
+                current, rows = key, []
+            rows.append((digest, offset))
+    if rows:
+        yield current, rows
+
+
+def merge_keys(old, new, offsets, deletes):
+    """
+    Merge two sorted key files. Offsets of new or changed records go to
+    binary file object offsets, ids only found in old to deletes. Returns a
+    Counter.
+    """
+    stats = collections.Counter()
+    a, b = _groups(old), _groups(new)
+    x, y = next(a, None), next(b, None)
+    while x is not None or y is not None:
+        if y is None or (x is not None and x[0] < y[0]):
+            deletes.write(x[0] + b'\n')
+            stats['deletes'] += 1
+            x = next(a, None)
+        elif x is None or y[0] < x[0]:
+            for _, offset in y[1]:
+                offsets.write(offset + b'\n')
+                stats['upserts'] += 1
+                stats['upserts.new'] += 1
+            y = next(b, None)
+        else:
+            before = set(digest for digest, _ in x[1])
+            for digest, offset in y[1]:
+                if digest in before:
+                    stats['unchanged'] += 1
+                    continue
+                offsets.write(offset + b'\n')
+                stats['upserts'] += 1
+                stats['upserts.changed'] += 1
+            x, y = next(a, None), next(b, None)
+    return stats
+
+
+def copy_offsets(path, offsets, output):
+    """
+    Write the records of a file starting at the given sorted offsets (a file
+    with one offset per line) to a binary file object, in a single pass.
+    """
+    with open(offsets, 'rb') as wanted, open_file(path) as handle:
+        target, pos = wanted.readline(), 0
+        for line in handle:
+            if not target:
+                break
+            if pos == int(target):
+                output.write(line)
+                target = wanted.readline()
+            pos += len(line)
+
+
+def diff(old, new, upserts, deletes, field='id', directory=None):
+    """
+    Compare two JSON lines files by field and content. Upserts (new and
+    changed records of new) and deletes (ids) are written to binary file
+    objects. Returns a Counter with records, upserts, deletes and unchanged
+    records. Temporary key files are kept in directory, by default a
+    temporary directory.
+    """
+    tmp = tempfile.mkdtemp(prefix='siskin-', dir=directory)
+    try:
+        stats = collections.Counter()
+        paths = [os.path.join(tmp, name) for name in ('old.keys', 'new.keys', 'offsets')]
+        stats['records.old'] = write_keys(old, paths[0], field=field)
+        stats['records.new'] = write_keys(new, paths[1], field=field)
+        with open(paths[2], 'wb') as offsets:
+            stats.update(merge_keys(paths[0], paths[1], offsets, deletes))
+        _sort(paths[2], numeric=True)
+        copy_offsets(new, paths[2], upserts)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    logger.debug('%s to %s: %s', old, new, dict(stats))
+    return stats
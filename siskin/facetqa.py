@@ -0,0 +1,265 @@
+# coding: utf-8
+# pylint: disable=C0301,C0103
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Quality checks on solr facets, refs #12756.
+
+For each source id and facet field, facet values are requested page by page
+(facet.offset, facet.limit, sorted by value), so even large facets like
+author_facet are never held in memory as a whole. Each page is checked as it
+arrives; facets are queried concurrently:
+
+    >>> qa = FacetQA('http://localhost:8983/solr/biblio', workers=4)
+    >>> for entry in qa.run(SOURCE_IDS, FIELDS):
+    ...     print(json.dumps(entry))
+    {"type": "finding", "source_id": "48", "field": "author_facet", "check": "short_author", "value": "Copyright ...", "count": 14888}
+    {"type": "facet", "source_id": "48", "field": "author_facet", "values": 1022113, "pages": 103, "findings": 3, "seconds": 4.1}
+
+A check is a function, that returns False for a suspicious value, and is
+registered for one or more fields:
+
+    @check('publishDateSort')
+    def plausible_year(value):
+        ...
+
+Responses are cached by URL (see siskin.utils.URLCache), separately for each
+index generation, so a repeated run against an unchanged index sends only a
+single request.
+"""
+
+import collections
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import requests
+
+from siskin.utils import TokenBucket, URLCache
+
+logger = logging.getLogger('siskin')
+
+SOURCE_IDS = ('28', '30', '34', '48', '49', '50', '53', '55', '60', '85', '87', '89', '101', '105')
+
+FIELDS = (
+    'format',
+    'format_de15',
+    'facet_avail',
+    'access_facet',
+    'author_facet',
+    'publishDateSort',
+    'language',
+    'mega_collection',
+    'finc_class_facet',
+)
+
+# Checks by field.
+CHECKS = collections.defaultdict(list)
+
+
+def check(*fields):
+    """
+    Register a function as check for the given facet fields.
+    """
+    def register(func):
+        for field in fields:
+            CHECKS[field].append(func)
+        return func
+
+    return register
+
+
+@check('publishDateSort')
+def plausible_year(value):
+    try:
+        return 1500 < int(value) < datetime.date.today().year + 1
+    except ValueError:
+        return False
+
+
+@check('author_facet')
+def short_author(value):
+    return len(value) < 60
+
+
+@check('mega_collection')
+def no_question_marks(value):
+    return '??' not in value
+
+
+def index_generation(server, session=None):
+    """
+    Return the generation of the index of a solr core, or None, if neither
+    the replication handler nor luke report it.
+    """
+    session = session or requests.Session()
+    for path, key in (('/replication?command=indexversion&wt=json', 'generation'), ('/admin/luke?numTerms=0&wt=json', 'index')):
+        try:
+            r = session.get(server + path, timeout=60)
+            if r.status_code != 200:
+                continue
+            value = r.json().get(key)
+        except (requests.exceptions.RequestException, ValueError):
+            continue
+        if isinstance(value, dict):
+            value = value.get('version')
+        if value is not None:
+            return str(value)
+    return None
+
+
+class FacetQA(object):
+    """
+    Run facet checks against a solr core.
+    """
+    def __init__(self, server, workers=4, page_size=10000, rate=None, cache_dir=None, checks=None):
+        self.server = server.rstrip('/')
+        self.workers = workers
+        self.page_size = page_size
+        self.bucket = TokenBucket(rate) if rate else None
+        self.checks = CHECKS if checks is None else checks
+        self.session = requests.Session()
+        self.generation = index_generation(self.server, session=self.session)
+        self.cache = None
+        if cache_dir and self.generation is not None:
+            digest = hashlib.sha1(self.server.encode('utf-8')).hexdigest()[:12]
+            self.cache = URLCache(directory=os.path.join(cache_dir, digest, self.generation))
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def url(self, query, field, offset):
+        params = [
+            ('q', query),
+            ('rows', 0),
+            ('wt', 'json'),
+            ('facet', 'on'),
+            ('facet.field', field),
+            ('facet.mincount', 1),
+            ('facet.sort', 'index'),
+            ('facet.limit', self.page_size),
+            ('facet.offset', offset),
+        ]
+        return '%s/select?%s' % (self.server, urllib.parse.urlencode(params))
+
+    def get(self, url):
+        """
+        Return a parsed solr response, from the cache, if possible.
+        """
+        if self.cache is not None and self.cache.is_cached(url):
+            self._count('requests.cached')
+            return json.loads(self.cache.get(url))
+        if self.bucket is not None:
+            self.bucket.acquire()
+        self._count('requests')
+        if self.cache is not None:
+            return json.loads(self.cache.get(url))
+        try:
+            r = self.session.get(url, timeout=600)
+        except requests.exceptions.RequestException as err:
+            raise RuntimeError('request failed: %s: %s' % (err, url))
+        if r.status_code != 200:
+            raise RuntimeError('request failed with %s: %s' % (r.status_code, url))
+        return r.json()
+
+    def values(self, query, field):
+        """
+        Yield pages of (value, count) tuples of a facet.
+        """
+        offset = 0
+        while True:
+            resp = self.get(self.url(query, field, offset))
+            flat = resp['facet_counts']['facet_fields'].get(field, [])
+            page = [(flat[i], flat[i + 1]) for i in range(0, len(flat), 2)]
+            if page:
+                yield page
+            if len(page) < self.page_size:
+                return
+            offset += self.page_size
+
+    def check_facet(self, source_id, field):
+        """
+        Check all values of a facet, return the list of report entries.
+        """
+        started, findings, values, pages = time.time(), [], 0, 0
+        checks = self.checks.get(field, [])
+        for page in self.values('source_id:%s' % source_id, field):
+            pages += 1
+            values += len(page)
+            for func in checks:
+                for value, count in page:
+                    if not func(value):
+                        findings.append({'type': 'finding', 'source_id': source_id, 'field': field, 'check': func.__name__, 'value': value, 'count': count})
+        findings.append({
+            'type': 'facet',
+            'source_id': source_id,
+            'field': field,
+            'values': values,
+            'pages': pages,
+            'findings': len(findings),
+            'seconds': round(time.time() - started, 3),
+        })
+        return findings
+
+    def run(self, source_ids=SOURCE_IDS, fields=FIELDS):
+        """
+        Check all combinations of source ids and fields concurrently, yield
+        report entries as facets are done, followed by a summary.
+        """
+        started, facets, findings = time.time(), 0, 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.check_facet, str(source_id), field) for source_id in source_ids for field in fields]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    for entry in future.result():
+                        if entry['type'] == 'finding':
+                            findings += 1
+                        else:
+                            facets += 1
+                        yield entry
+            finally:
+                for future in futures:
+                    future.cancel()
+        yield {
+            'type': 'summary',
+            'server': self.server,
+            'generation': self.generation,
+            'facets': facets,
+            'findings': findings,
+            'requests': self.stats['requests'],
+            'requests.cached': self.stats['requests.cached'],
+            'seconds': round(time.time() - started, 3),
+        }
+
+
+def default_cache_dir():
+    return os.path.join(tempfile.gettempdir(), '.urlcache', 'facetqa')
@@ -0,0 +1,146 @@
+# coding: utf-8
+# pylint: disable=C0301,C0103
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Key lookup index for JSON lines files, to find single records by id.
+
+For a compressed (or plain) JSON lines file, values of a few top-level
+fields (e.g. finc.id, doi, finc.record_id) are stored in a sqlite database
+next to the file, as FILE.keys.db, together with the decompressed offset and
+length of the record. Records are then read with siskin.blocks.read_at, only
+decompressing a single block.
+
+    >>> build_lookup('file.ldj.gz', ['finc.id', 'doi'])
+    >>> lookup('file.ldj.gz', 'ai-49-aHR0cDovL2R4LmRvaS5vcmcvMTAuMTAwMi9hY3IuMjM0Njg')
+    [('finc.id', b'{"finc.format": ...}\n')]
+
+List values are indexed per element. The database records the size of the
+indexed file, a database for a file with a different size is ignored.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+
+from siskin import blocks
+from siskin.ndjson import open_file
+
+logger = logging.getLogger('siskin')
+
+
+def lookup_path(path):
+    return path + '.keys.db'
+
+
+def build_lookup(path, fields, batch_size=50000):
+    """
+    Build the lookup database for a file in a single pass and return the
+    number of records indexed. Lines that are not JSON are skipped.
+    """
+    dbpath = lookup_path(path)
+    fd, tmp = tempfile.mkstemp(prefix='siskin-', suffix='.db', dir=os.path.dirname(os.path.abspath(dbpath)))
+    os.close(fd)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)')
+        conn.execute('CREATE TABLE keys (value TEXT, field TEXT, offset INTEGER, length INTEGER)')
+        rows, offset, count, skipped = [], 0, 0, 0
+        with open_file(path) as handle:
+            for line in handle:
+                if line.strip():
+                    try:
+                        doc = json.loads(line)
+                    except ValueError:
+                        skipped += 1
+                        doc = None
+                    if not isinstance(doc, dict):
+                        doc = {}
+                    for field in fields:
+                        value = doc.get(field)
+                        for v in (value if isinstance(value, list) else [value]):
+                            if v is not None and v != '':
+                                rows.append((str(v), field, offset, len(line)))
+                    count += 1
+                offset += len(line)
+                if len(rows) >= batch_size:
+                    conn.executemany('INSERT INTO keys VALUES (?, ?, ?, ?)', rows)
+                    rows = []
+        conn.executemany('INSERT INTO keys VALUES (?, ?, ?, ?)', rows)
+        conn.execute('CREATE INDEX keys_value ON keys (value)')
+        conn.executemany('INSERT INTO meta VALUES (?, ?)', [('size', str(os.path.getsize(path))), ('fields', ','.join(fields))])
+        conn.commit()
+        conn.close()
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, dbpath)
+    except BaseException:
+        conn.close()
+        os.remove(tmp)
+        raise
+    if skipped:
+        logger.warning('skipped %d lines, that are not JSON, in %s', skipped, path)
+    logger.debug('indexed %d records of %s', count, path)
+    return count
+
+
+def has_lookup(path):
+    """
+    Return True, if there is an up-to-date lookup database for a file.
+    """
+    dbpath = lookup_path(path)
+    if not os.path.exists(dbpath):
+        return False
+    conn = sqlite3.connect('file:%s?mode=ro' % dbpath, uri=True)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()
+    finally:
+        conn.close()
+    return row is not None and int(row[0]) == os.path.getsize(path)
+
+
+def lookup(path, value, fields=None):
+    """
+    Return a list of (field, record) tuples for records of a file, that have
+    the given value in any of the indexed or the given fields, each record
+    only once. Raises RuntimeError, if there is no up-to-date lookup
+    database.
+    """
+    if not has_lookup(path):
+        raise RuntimeError('no lookup database for %s, see tasklookup --build' % path)
+    conn = sqlite3.connect('file:%s?mode=ro' % lookup_path(path), uri=True)
+    try:
+        rows = conn.execute('SELECT field, offset, length FROM keys WHERE value = ? ORDER BY offset', (value,)).fetchall()
+    finally:
+        conn.close()
+    if fields:
+        rows = [row for row in rows if row[0] in fields]
+    seen, unique = set(), []
+    for row in rows:
+        if row[1] not in seen:
+            seen.add(row[1])
+            unique.append(row)
+    index = blocks.load_index(path) if path.endswith('.gz') else None
+    return [(field, blocks.read_at(path, offset, length, blocks=index)) for field, offset, length in unique]
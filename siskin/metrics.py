@@ -0,0 +1,217 @@
+# coding: utf-8
+# pylint: disable=C0301,C0103
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Per task performance metrics, stored as JSON lines under core.home.
+
+For every run of a DefaultTask (and every method decorated with
+siskin.benchmark.timed) a line is appended, with wall and CPU time, resource
+usage of child processes (e.g. span-import), input and output sizes and, if
+the task sets `record_count`, the number of records.
+
+Peak memory (process_maxrss, process_children_maxrss, KB on Linux) is the high
+water mark of the whole worker process and its children so far, not of the
+single task: with several tasks per worker, it only ever grows.
+
+    {"task": "AILicensing", "params": {"date": "2021-01-04"}, "version":
+     "1.2.1", "wall": 1832.1, "cpu_user": 12.3, "children_user": 3201.9, ...}
+
+Use taskstats to show trends, percentiles and regressions. Configuration:
+
+    [metrics]
+
+    enabled = true
+    path = /path/to/metrics.jsonl
+
+"""
+
+import fcntl
+import json
+import logging
+import os
+import resource
+import socket
+import tempfile
+import time
+
+import luigi
+from siskin import __version__
+from siskin.configuration import Config
+
+logger = logging.getLogger('siskin')
+
+
+def metrics_path():
+    """
+    Return the path to the metrics file.
+    """
+    config = Config.instance()
+    home = config.get('core', 'home', fallback=os.path.join(tempfile.gettempdir(), 'siskin-data'))
+    return config.get('metrics', 'path', fallback=os.path.join(home, '.metrics', 'metrics.jsonl'))
+
+
+def enabled():
+    config = Config.instance()
+    return config.getboolean('metrics', 'enabled', fallback=True)
+
+
+def target_bytes(targets):
+    """
+    Return the total size of all existing local file targets.
+    """
+    total = 0
+    for target in luigi.task.flatten(targets):
+        path = getattr(target, 'path', None)
+        if isinstance(target, luigi.LocalTarget) and path and os.path.isfile(path):
+            total += os.path.getsize(path)
+    return total
+
+
+class Measurement(object):
+    """
+    Measure resource usage between creation and finish.
+
+    >>> m = Measurement()
+    >>> ...
+    >>> record(m.finish(task=task, method='run'))
+    """
+    def __init__(self):
+        self.wall = time.time()
+        self.own = resource.getrusage(resource.RUSAGE_SELF)
+        self.children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    def finish(self, task=None, method='run', status='success'):
+        """
+        Return a dictionary with the measurements and details about the task.
+        """
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        entry = {
+            'time': self.wall,
+            'host': socket.gethostname(),
+            'version': __version__,
+            'method': method,
+            'status': status,
+            'wall': round(time.time() - self.wall, 3),
+            'cpu_user': round(own.ru_utime - self.own.ru_utime, 3),
+            'cpu_sys': round(own.ru_stime - self.own.ru_stime, 3),
+            'process_maxrss': own.ru_maxrss,
+            'children_user': round(children.ru_utime - self.children.ru_utime, 3),
+            'children_sys': round(children.ru_stime - self.children.ru_stime, 3),
+            'process_children_maxrss': children.ru_maxrss,
+        }
+        if isinstance(task, luigi.Task):
+            entry.update({
+                'task': task.task_family,
+                'params': task.to_str_params(only_significant=True),
+                'input_bytes': target_bytes(task.input()),
+                'output_bytes': target_bytes(task.output()),
+                'records': getattr(task, 'record_count', None),
+            })
+        elif task is not None:
+            entry['task'] = task.__class__.__name__
+        return entry
+
+
+def record(entry, path=None):
+    """
+    Append a single entry to the metrics file. Failures are only logged.
+    """
+    if not enabled():
+        return
+    path = path or metrics_path()
+    try:
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as output:
+            fcntl.flock(output, fcntl.LOCK_EX)
+            try:
+                output.write(json.dumps(entry, sort_keys=True) + '\n')
+            finally:
+                fcntl.flock(output, fcntl.LOCK_UN)
+    except (IOError, OSError, TypeError, ValueError) as err:
+        logger.debug('could not record metrics to %s: %s', path, err)
+
+
+def load(path=None, task=None):
+    """
+    Return a list of entries, optionally only for a single task family.
+    """
+    path = path or metrics_path()
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path) as handle:
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # partial line
+            if task is None or entry.get('task') == task:
+                entries.append(entry)
+    return entries
+
+
+def percentile(values, p):
+    """
+    Nearest rank percentile of a list of numbers, p between 0 and 100.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(0, int(round(p / 100.0 * len(values) + 0.5)) - 1)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(entries, key='wall', recent=3, threshold=1.25):
+    """
+    Summarize successful runs per task: number of runs, percentiles and the
+    median of the most recent runs compared to the median of all runs before.
+    A task is flagged as regressed, if the ratio exceeds threshold.
+    """
+    grouped = {}
+    for entry in entries:
+        if entry.get('status', 'success') != 'success' or entry.get(key) is None:
+            continue
+        grouped.setdefault(entry.get('task'), []).append(entry)
+
+    summary = []
+    for task, runs in sorted(grouped.items()):
+        runs = sorted(runs, key=lambda e: e['time'])
+        values = [run[key] for run in runs]
+        before, last = values[:-recent], values[-recent:]
+        ratio = None
+        if before and percentile(before, 50):
+            ratio = percentile(last, 50) / float(percentile(before, 50))
+        summary.append({
+            'task': task,
+            'runs': len(runs),
+            'p50': percentile(values, 50),
+            'p90': percentile(values, 90),
+            'max': max(values),
+            'last': values[-1],
+            'ratio': ratio,
+            'regressed': ratio is not None and ratio > threshold,
+            'versions': sorted(set(run.get('version') for run in runs)),
+        })
+    return summary
@@ -0,0 +1,244 @@
+# coding: utf-8
+# pylint: disable=C0301,C0103,W0603
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Parallel processing of newline delimited JSON.
+
+Many conversion tasks read a line, parse it, change the document, serialize
+and write it back. The `transform` function does this with a pool of worker
+processes, in batches, keeping the input order by default:
+
+    def convert(doc, stats):
+        if not doc.get('doi'):
+            stats['skipped.no.doi'] += 1
+            return None
+        doc['x.labels'] = ['ok']
+        return doc
+
+    with self.output().open('w') as output:
+        stats = transform(self.input().path, output, convert, workers=8)
+
+The function receives a parsed document and a collections.Counter and
+returns a document, a string or bytes (written as a line), a list of those
+(written as several lines) or None (nothing is written). With batch=True,
+the function receives a list of documents at once, e.g. to aggregate values
+before writing them. Counters from all workers are summed up and returned,
+together with "records.in" and "records.out".
+
+The function must be picklable, e.g. a module level function or a
+functools.partial of one; it is sent to each worker only once. Inputs and
+outputs can be file objects or paths; paths ending in .gz or .zst are
+(de)compressed on the fly, written as blocked gzip or seekable zstd. To
+process a part of a file, pass a range from siskin.blocks.split as input.
+"""
+
+import collections
+import concurrent.futures
+import gzip
+import json
+import logging
+import os
+import shutil
+import subprocess
+import time
+import types
+
+from siskin import blocks, seekable
+
+logger = logging.getLogger('siskin')
+
+
+class _Pipe(object):
+    """
+    A file object reading from or writing to an external (de)compressor.
+    """
+    def __init__(self, cmd, path, mode):
+        self.cmd = cmd
+        if mode == 'r':
+            self.proc = subprocess.Popen(cmd + [path], stdout=subprocess.PIPE)
+            self.file = self.proc.stdout
+        else:
+            self.target = open(path, 'wb')
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=self.target)
+            self.file = self.proc.stdin
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.file.close()
+        if self.proc.wait() != 0:
+            raise RuntimeError('%s exited with %s' % (' '.join(self.cmd), self.proc.returncode))
+        if hasattr(self, 'target'):
+            self.target.close()
+
+
+def open_file(path, mode='r'):
+    """
+    Open a file for binary reading or writing ("r" or "w"), transparently
+    handling .gz and .zst files. Gzip files are written in blocks, see
+    siskin.blocks. Zstd files are written seekable and read in parallel, if
+    they are seekable, see siskin.seekable.
+    """
+    if path.endswith('.gz'):
+        if mode == 'r' and shutil.which('unpigz'):
+            return _Pipe(['unpigz', '-c'], path, mode)
+        if mode == 'w':
+            return blocks.BlockedGzipWriter(open(path, 'wb'))
+        return gzip.open(path, mode + 'b')
+    if path.endswith('.zst'):
+        if mode == 'w':
+            return seekable.SeekableWriter(open(path, 'wb'))
+        if seekable.is_seekable(path):
+            return seekable.SeekableReader(path).open()
+        if not shutil.which('zstd'):
+            raise RuntimeError('zstd required to handle %s' % path)
+        return _Pipe(['zstd', '-q', '-d', '-c'], path, mode)
+    return open(path, mode + 'b')
+
+
+def _serialize(result, out):
+    """
+    Append serialized lines of a func result to list out.
+    """
+    if result is None:
+        return
+    if isinstance(result, (list, tuple, set, types.GeneratorType)):
+        for item in result:
+            _serialize(item, out)
+        return
+    if isinstance(result, bytes):
+        out.append(result.rstrip(b'\n'))
+    elif isinstance(result, str):
+        out.append(result.rstrip('\n').encode('utf-8'))
+    else:
+        out.append(json.dumps(result).encode('utf-8'))
+
+
+_func, _batch = None, False
+
+
+def _init_worker(func, batch):
+    global _func, _batch
+    _func, _batch = func, batch
+
+
+def _process_batch(lines, func=None, batch=False):
+    """
+    Process a batch of lines, returns serialized output, counters and the
+    number of input records.
+    """
+    if func is None:
+        func, batch = _func, _batch
+    stats, out = collections.Counter(), []
+    docs = [json.loads(line) for line in lines if line.strip()]
+    if batch:
+        _serialize(func(docs, stats), out)
+    else:
+        for doc in docs:
+            _serialize(func(doc, stats), out)
+    stats['records.out'] += len(out)
+    count = len(docs)
+    data = b'\n'.join(out) + b'\n' if out else b''
+    return data, stats, count
+
+
+def _batches(handle, size):
+    batch = []
+    for line in handle:
+        batch.append(line)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def transform(input, output, func, workers=None, batch_size=2000, ordered=True, batch=False, log_every=1000000):
+    """
+    Read JSON lines from input, apply func to each document and write the
+    results to output. Input and output can be paths or binary file objects,
+    input may also be any iterable of lines.
+
+    Workers defaults to the number of CPUs, with workers set to 0 everything
+    runs in process. With ordered set to False, batches are written as soon
+    as they are done. With batch set to True, func is called with a list of
+    documents and the counter instead of a single document. Returns a
+    collections.Counter with counts collected by func and the number of
+    records read and written.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    stats = collections.Counter()
+    started, reported = time.time(), 0
+
+    def consume(result, output):
+        nonlocal reported
+        data, counts, count = result
+        output.write(data)
+        stats.update(counts)
+        stats['records.in'] += count
+        if stats['records.in'] - reported >= log_every:
+            reported = stats['records.in']
+            logger.debug('processed %d records, %.0f records/s', reported, reported / max(time.time() - started, 1e-6))
+
+    infile = open_file(input, 'r') if isinstance(input, str) else input
+    outfile = open_file(output, 'w') if isinstance(output, str) else output
+    try:
+        if not workers:
+            for lines in _batches(infile, batch_size):
+                consume(_process_batch(lines, func=func, batch=batch), outfile)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(func, batch)) as executor:
+                pending = collections.deque()
+                for lines in _batches(infile, batch_size):
+                    pending.append(executor.submit(_process_batch, lines))
+                    if len(pending) < 2 * workers:
+                        continue
+                    if ordered:
+                        consume(pending.popleft().result(), outfile)
+                    else:
+                        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in done:
+                            pending.remove(future)
+                            consume(future.result(), outfile)
+                while pending:
+                    consume(pending.popleft().result(), outfile)
+    finally:
+        if isinstance(input, str):
+            infile.close()
+        if isinstance(output, str):
+            outfile.close()
+
+    elapsed = max(time.time() - started, 1e-6)
+    logger.debug('processed %d records in %.1fs (%.0f records/s), wrote %d', stats['records.in'], elapsed, stats['records.in'] / elapsed,
+                 stats['records.out'])
+    return stats
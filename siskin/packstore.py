@@ -0,0 +1,297 @@
+# coding: utf-8
+# pylint: disable=C0301,C0103
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+A small key value store for blobs, used as an alternative URLCache backend.
+
+Values are appended to a few large segment files, a sqlite index maps keys to
+(segment, offset, length). This keeps the number of files and directories
+constant, regardless of the number of entries.
+
+    $ ls /tmp/.urlcache/pack
+    index.db  lock  segment-000000.pack  segment-000001.pack
+
+The store can be bounded in size (least recently used entries are evicted
+first) and entries can expire after a given number of seconds. Space of
+evicted entries is reclaimed by dropping or rewriting segments, see
+`PackStore.compact`.
+
+To clean the store just remove the directory.
+"""
+
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('siskin')
+
+
+class PackStore(object):
+    """
+    Append-only segment files with a sqlite index. Safe to use from multiple
+    threads and processes; writers serialize on a lock file.
+
+    >>> store = PackStore('/tmp/packstore', max_size=1 << 30, ttl=86400)
+    >>> store.put('key', b'value')
+    >>> store.get('key')
+    b'value'
+    >>> 'key' in store
+    True
+    """
+    # With a ttl, expired entries are evicted on put, at most this often (seconds).
+    evict_interval = 3600
+
+    def __init__(self, directory, max_size=None, ttl=None, segment_size=1 << 28):
+        """
+        If `max_size` (bytes) is given, least recently used entries are
+        evicted once the size of all live entries exceeds it. Entries older
+        than `ttl` seconds are considered missing and are evicted on the next
+        put, at most every `evict_interval` seconds, or on eviction by size.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.ttl = ttl
+        self.segment_size = segment_size
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+
+        self._mutex = threading.RLock()
+        # Running total of live bytes, only kept with max_size. Writers in
+        # other processes are not seen, it is resynced before evicting.
+        self._size = None
+        self._evicted = 0
+        self.conn = sqlite3.connect(os.path.join(self.directory, 'index.db'), timeout=60, check_same_thread=False, isolation_level=None)
+        with self._mutex:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    segment INTEGER NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL)
+            """)
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(entries)")]
+            if 'meta' not in columns:
+                self.conn.execute("ALTER TABLE entries ADD COLUMN meta TEXT")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS entries_segment ON entries (segment)")
+
+    def __contains__(self, key):
+        with self._mutex:
+            row = self.conn.execute("SELECT created FROM entries WHERE key = ?", (key, )).fetchone()
+        return row is not None and not self._expired(row[0])
+
+    def __len__(self):
+        with self._mutex:
+            return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _expired(self, created):
+        return self.ttl is not None and created < time.time() - self.ttl
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, 'segment-%06d.pack' % segment)
+
+    def _segments(self):
+        """
+        Return the sorted list of segment numbers found on disk.
+        """
+        segments = []
+        for name in os.listdir(self.directory):
+            match = re.match(r'^segment-([0-9]{6}).pack$', name)
+            if match:
+                segments.append(int(match.group(1)))
+        return sorted(segments)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        Exclusive access for writers, across threads and processes.
+        """
+        with self._mutex:
+            with open(os.path.join(self.directory, 'lock'), 'a') as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _append(self, data):
+        """
+        Append data (bytes or a file object) to the current segment, start a
+        new segment, if the current one is full. Must be called with lock
+        held. Returns segment number, offset and length.
+        """
+        segments = self._segments()
+        segment = segments[-1] if segments else 0
+        path = self._segment_path(segment)
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_size:
+            segment += 1
+            path = self._segment_path(segment)
+        with open(path, 'ab') as output:
+            offset = output.seek(0, os.SEEK_END)
+            if isinstance(data, bytes):
+                output.write(data)
+            else:
+                shutil.copyfileobj(data, output, 1 << 20)
+            length = output.tell() - offset
+        return segment, offset, length
+
+    def get(self, key):
+        """
+        Return the value for key as bytes or None, if the key is missing or expired.
+        """
+        with self._mutex:
+            row = self.conn.execute("SELECT segment, offset, length, created FROM entries WHERE key = ?", (key, )).fetchone()
+        if row is None:
+            return None
+        segment, offset, length, created = row
+        if self._expired(created):
+            return None
+        try:
+            with open(self._segment_path(segment), 'rb') as handle:
+                handle.seek(offset)
+                data = handle.read(length)
+        except (IOError, OSError) as err:
+            logger.debug("pack store entry for %s not readable: %s", key, err)
+            return None
+        if len(data) != length:
+            return None
+        with self._mutex:
+            self.conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+        return data
+
+    def put(self, key, data, meta=None):
+        """
+        Store data under key, replacing any previous value. Data can be bytes
+        or a file object opened in binary mode, which is copied in chunks.
+        Optionally store a small JSON serializable `meta` object alongside.
+        """
+        with self._locked():
+            if self.max_size is not None and self._size is None:
+                self._size = self.size()
+            segment, offset, length = self._append(data)
+            now = time.time()
+            replaced = self.conn.execute("SELECT length FROM entries WHERE key = ?", (key, )).fetchone()
+            self.conn.execute("INSERT OR REPLACE INTO entries (key, segment, offset, length, created, accessed, meta) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (key, segment, offset, length, now, now, None if meta is None else json.dumps(meta)))
+            if self._size is not None:
+                self._size += length - (replaced[0] if replaced else 0)
+                if self._size > self.max_size:
+                    self._size = self.size()
+        if self._size is not None and self._size > self.max_size:
+            self.evict()
+        elif self.ttl is not None and self._evicted < time.time() - self.evict_interval:
+            self.evict()
+
+    def info(self, key):
+        """
+        Return a tuple (created, meta) for a key or None, if the key is missing
+        or expired. Created is a timestamp, meta the object passed to put.
+        """
+        with self._mutex:
+            row = self.conn.execute("SELECT created, meta FROM entries WHERE key = ?", (key, )).fetchone()
+        if row is None or self._expired(row[0]):
+            return None
+        return row[0], None if row[1] is None else json.loads(row[1])
+
+    def touch(self, key):
+        """
+        Mark an entry as freshly created, e.g. after it has been revalidated.
+        """
+        with self._mutex:
+            now = time.time()
+            self.conn.execute("UPDATE entries SET created = ?, accessed = ? WHERE key = ?", (now, now, key))
+
+    def remove(self, key):
+        """
+        Remove key, if it exists. The space is reclaimed on the next compaction.
+        """
+        with self._locked():
+            row = self.conn.execute("SELECT length FROM entries WHERE key = ?", (key, )).fetchone()
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key, ))
+            if row is not None and self._size is not None:
+                self._size -= row[0]
+
+    def size(self):
+        """
+        Return the number of bytes of all live entries.
+        """
+        with self._mutex:
+            return self.conn.execute("SELECT COALESCE(SUM(length), 0) FROM entries").fetchone()[0]
+
+    def evict(self):
+        """
+        Drop expired entries, then drop least recently used entries until the
+        store is below 90% of max_size. Reclaim space afterwards.
+        """
+        with self._locked():
+            self._evicted = time.time()
+            if self.ttl is not None:
+                cursor = self.conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl, ))
+                logger.debug("pack store: evicted %d expired entries", cursor.rowcount)
+            if self.max_size is not None:
+                total, target, evicted = self.size(), int(self.max_size * 0.9), []
+                for key, length in self.conn.execute("SELECT key, length FROM entries ORDER BY accessed"):
+                    if total <= target:
+                        break
+                    evicted.append((key, ))
+                    total -= length
+                self.conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+                logger.debug("pack store: evicted %d least recently used entries", len(evicted))
+                self._size = total
+        self.compact()
+
+    def compact(self, threshold=0.5):
+        """
+        Delete segments without live entries and rewrite segments, where less
+        than `threshold` of the bytes are live. The current (last) segment is
+        never rewritten.
+        """
+        with self._locked():
+            segments = self._segments()
+            for segment in segments[:-1]:
+                path = self._segment_path(segment)
+                live = self.conn.execute("SELECT COALESCE(SUM(length), 0) FROM entries WHERE segment = ?", (segment, )).fetchone()[0]
+                if live == 0:
+                    os.remove(path)
+                    continue
+                if live >= os.path.getsize(path) * threshold:
+                    continue
+                rows = self.conn.execute("SELECT key, offset, length FROM entries WHERE segment = ?", (segment, )).fetchall()
+                with open(path, 'rb') as handle:
+                    for key, offset, length in rows:
+                        handle.seek(offset)
+                        target, target_offset, _ = self._append(handle.read(length))
+                        self.conn.execute("UPDATE entries SET segment = ?, offset = ? WHERE key = ?", (target, target_offset, key))
+                os.remove(path)
+                logger.debug("pack store: rewrote segment %s with %d live entries", segment, len(rows))
@@ -0,0 +1,385 @@
+# coding: utf-8
+# pylint: disable=C0301,C0103
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Seekable zstd files, for large intermediate artifacts.
+
+Data is compressed in independent frames of about FRAME_SIZE bytes each,
+followed by a seek table in a skippable frame, as described in the zstd
+seekable format (https://git.io/JO9iP). Any zstd decompressor can read these
+files, e.g. in shell pipelines:
+
+    $ zstd -q -d -c file.ldj.zst | jq .
+
+Since frames are independent, they can be decompressed in parallel and a
+part of the file can be read without decompressing everything before it:
+
+    >>> with SeekableWriter(open('file.ldj.zst', 'wb')) as w:
+    ...     w.write(b'...')
+    >>> r = SeekableReader('file.ldj.zst')
+    >>> for chunk in r.chunks(workers=4):
+    ...     pass
+    >>> r.read(offset=1 << 30, size=1024)
+
+Compression uses the zstandard module, if installed, otherwise the zstd
+executable. Writing a file line by line, frames are cut at line boundaries.
+
+Tasks choose the format via DefaultTask.compressed_target, see the
+[core] compression and zstd options. The taskzstd command compresses and
+decompresses in shell pipelines.
+"""
+
+import collections
+import concurrent.futures
+import io
+import logging
+import os
+import shutil
+import struct
+import subprocess
+
+import luigi
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger('siskin')
+
+FRAME_SIZE = 1 << 24
+SKIPPABLE_MAGIC = 0x184D2A5E
+SEEKABLE_MAGIC = 0x8F92EAB1
+FOOTER = struct.Struct('<IBI')
+ENTRY = struct.Struct('<II')
+
+Frame = collections.namedtuple('Frame', 'offset size doffset dsize')
+
+
+def compress(data, level=3):
+    """
+    Compress data into a single zstd frame.
+    """
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=level, write_content_size=True).compress(data)
+    if not shutil.which('zstd'):
+        raise RuntimeError('either the zstandard module or the zstd executable is required')
+    return subprocess.run(['zstd', '-q', '-c', '-%d' % level], input=data, stdout=subprocess.PIPE, check=True).stdout
+
+
+def decompress(data, size):
+    """
+    Decompress a single zstd frame, with size bytes of decompressed data.
+    """
+    if zstandard is not None:
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=size)
+    if not shutil.which('zstd'):
+        raise RuntimeError('either the zstandard module or the zstd executable is required')
+    return subprocess.run(['zstd', '-q', '-d', '-c'], input=data, stdout=subprocess.PIPE, check=True).stdout
+
+
+def seek_table(entries):
+    """
+    Return the skippable frame with the seek table for a list of compressed
+    and decompressed frame sizes.
+    """
+    table = b''.join(ENTRY.pack(*entry) for entry in entries)
+    table += FOOTER.pack(len(entries), 0, SEEKABLE_MAGIC)
+    return struct.pack('<II', SKIPPABLE_MAGIC, len(table)) + table
+
+
+class SeekableWriter(object):
+    """
+    Write data compressed in independent frames to a binary file object,
+    with up to workers frames compressed in parallel. Close writes the seek
+    table and closes the file object.
+    """
+    def __init__(self, fileobj, frame_size=FRAME_SIZE, level=3, workers=None):
+        self.fileobj = fileobj
+        self.frame_size = frame_size
+        self.level = level
+        self.workers = workers or min(os.cpu_count() or 1, 8)
+        self.closed = False
+        self._buffer, self._buffered = [], 0
+        self._entries = []
+        self._pending = collections.deque()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+
+    def write(self, data):
+        """
+        Write data, frames end after a newline, if possible.
+        """
+        if self.closed:
+            raise ValueError('write to closed file')
+        self._buffer.append(bytes(data))
+        self._buffered += len(data)
+        if self._buffered >= self.frame_size:
+            buf, start = b''.join(self._buffer), 0
+            while len(buf) - start >= self.frame_size:
+                cut = buf.rfind(b'\n', start, start + self.frame_size) + 1
+                if cut <= start:
+                    cut = start + self.frame_size
+                self._submit(buf[start:cut])
+                start = cut
+            self._buffer, self._buffered = [buf[start:]], len(buf) - start
+        return len(data)
+
+    def _compress(self, data):
+        return compress(data, self.level)
+
+    def _submit(self, data):
+        self._pending.append((self._executor.submit(self._compress, data), len(data)))
+        while len(self._pending) > 2 * self.workers:
+            self._flush_one()
+
+    def _flush_one(self):
+        future, size = self._pending.popleft()
+        frame = future.result()
+        self.fileobj.write(frame)
+        self._entries.append((len(frame), size))
+
+    def flush(self):
+        pass
+
+    def _finish(self):
+        data = b''.join(self._buffer)
+        self._buffer, self._buffered = [], 0
+        if data:
+            self._submit(data)
+        while self._pending:
+            self._flush_one()
+        self._executor.shutdown()
+        self._write_trailer()
+
+    def _write_trailer(self):
+        self.fileobj.write(seek_table(self._entries))
+
+    def close(self):
+        if self.closed:
+            return
+        self._finish()
+        self.closed = True
+        self.fileobj.close()
+
+    def abort(self):
+        self.closed = True
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type:
+            self.abort()
+        else:
+            self.close()
+
+
+def read_seek_table(fileobj):
+    """
+    Return the list of frames of a seekable zstd file or None, if the file
+    has no seek table.
+    """
+    fileobj.seek(0, os.SEEK_END)
+    end = fileobj.tell()
+    if end < FOOTER.size + 8:
+        return None
+    fileobj.seek(end - FOOTER.size)
+    count, descriptor, magic = FOOTER.unpack(fileobj.read(FOOTER.size))
+    if magic != SEEKABLE_MAGIC:
+        return None
+    width = 12 if descriptor & 0x80 else 8
+    size = count * width + FOOTER.size
+    fileobj.seek(end - size - 8)
+    skippable, length = struct.unpack('<II', fileobj.read(8))
+    if skippable != SKIPPABLE_MAGIC or length != size:
+        raise RuntimeError('invalid seek table')
+    table = fileobj.read(count * width)
+    frames, offset, doffset = [], 0, 0
+    for i in range(count):
+        csize, dsize = ENTRY.unpack_from(table, i * width)
+        frames.append(Frame(offset, csize, doffset, dsize))
+        offset, doffset = offset + csize, doffset + dsize
+    return frames
+
+
+class SeekableReader(object):
+    """
+    Read a seekable zstd file, frames are decompressed in parallel.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as handle:
+            self.frames = read_seek_table(handle)
+        if self.frames is None:
+            raise RuntimeError('not a seekable zstd file: %s' % path)
+
+    @property
+    def size(self):
+        """
+        Size of the decompressed data.
+        """
+        if not self.frames:
+            return 0
+        return self.frames[-1].doffset + self.frames[-1].dsize
+
+    def _decompress(self, frame):
+        with open(self.path, 'rb') as handle:
+            handle.seek(frame.offset)
+            return decompress(handle.read(frame.size), frame.dsize)
+
+    def chunks(self, workers=None, frames=None):
+        """
+        Yield decompressed frames in order, decompressing up to workers
+        frames at a time.
+        """
+        frames = self.frames if frames is None else frames
+        workers = workers or min(os.cpu_count() or 1, 8)
+        if workers == 1:
+            for frame in frames:
+                yield self._decompress(frame)
+            return
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = collections.deque()
+            for frame in frames:
+                pending.append(executor.submit(self._decompress, frame))
+                if len(pending) > 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def read(self, offset=0, size=-1, workers=None):
+        """
+        Read size bytes (or everything) from a decompressed offset, only
+        decompressing the frames needed.
+        """
+        end = self.size if size < 0 else min(offset + size, self.size)
+        frames = [f for f in self.frames if f.doffset < end and f.doffset + f.dsize > offset]
+        if not frames:
+            return b''
+        data = b''.join(self.chunks(workers=workers, frames=frames))
+        start = offset - frames[0].doffset
+        return data[start:start + end - offset]
+
+    def open(self, workers=None, frames=None):
+        """
+        Return a buffered binary file object over the decompressed data, of
+        all or the given frames.
+        """
+        return io.BufferedReader(_ChunkStream(self.chunks(workers=workers, frames=frames)), buffer_size=1 << 20)
+
+
+class _ChunkStream(io.RawIOBase):
+    """
+    Raw stream over an iterator of byte strings.
+    """
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._current = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._current:
+            try:
+                self._current = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._current))
+        b[:n] = self._current[:n]
+        self._current = self._current[n:]
+        return n
+
+    def close(self):
+        if hasattr(self._chunks, 'close'):
+            self._chunks.close()
+        super(_ChunkStream, self).close()
+
+
+def is_seekable(path):
+    """
+    Return True, if path is a zstd file with a seek table.
+    """
+    with open(path, 'rb') as handle:
+        try:
+            return read_seek_table(handle) is not None
+        except RuntimeError:
+            return False
+
+
+def concat(paths, fileobj):
+    """
+    Concatenate seekable zstd files into a binary file object, with a single
+    seek table, without recompressing.
+    """
+    entries = []
+    for path in paths:
+        with open(path, 'rb') as handle:
+            frames = read_seek_table(handle)
+            if frames is None:
+                raise RuntimeError('not a seekable zstd file: %s' % path)
+            handle.seek(0)
+            remaining = sum(frame.size for frame in frames)
+            while remaining > 0:
+                data = handle.read(min(remaining, 1 << 20))
+                if not data:
+                    raise RuntimeError('truncated file: %s' % path)
+                fileobj.write(data)
+                remaining -= len(data)
+        entries.extend((frame.size, frame.dsize) for frame in frames)
+    fileobj.write(seek_table(entries))
+
+
+def cat_command(path):
+    """
+    Return the shell command to write the decompressed contents of a file
+    (gzip, zstd or plain), to stdout; to be used with shellout.
+    """
+    if path.endswith('.gz'):
+        return 'unpigz -c' if shutil.which('unpigz') else 'gzip -d -c'
+    if path.endswith('.zst'):
+        return 'taskzstd -d' if shutil.which('taskzstd') else 'zstd -q -d -c'
+    return 'cat'
+
+
+class SeekableZstdFormat(luigi.format.Format):
+    """
+    Seekable zstd format for luigi targets. Reading uses the zstd
+    executable, writing happens in process.
+    """
+    input = 'bytes'
+    output = 'bytes'
+
+    def __init__(self, frame_size=FRAME_SIZE, level=3):
+        self.frame_size = frame_size
+        self.level = level
+
+    def pipe_reader(self, input_pipe):
+        return luigi.format.InputPipeProcessWrapper(['zstd', '-q', '-d', '-c'], input_pipe)
+
+    def pipe_writer(self, output_pipe):
+        return SeekableWriter(output_pipe, frame_size=self.frame_size, level=self.level)
+
+
+SeekableZstd = SeekableZstdFormat()
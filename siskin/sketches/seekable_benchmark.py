@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Compare gzip and seekable zstd for intermediate files: compression time, size
+and time to read all lines back.
+
+    $ python seekable_benchmark.py --file /tmp/intermediate-schema.ldj --workers 4
+
+Reading the zstd file is measured with the zstd executable and with
+siskin.seekable, which decompresses frames in parallel.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import time
+
+from siskin.seekable import SeekableReader, SeekableWriter
+
+
+def timed(label, func, path):
+    started = time.time()
+    func()
+    print('%-28s %8.1fs %10d MB' % (label, time.time() - started, os.path.getsize(path) // 1048576))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--file', required=True, help='uncompressed JSON lines file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    gz, zst = args.file + '.gz', args.file + '.zst'
+    gzip_cmd = 'pigz' if shutil.which('pigz') else 'gzip'
+
+    def write_zstd():
+        with open(args.file, 'rb') as handle, SeekableWriter(open(zst, 'wb'), workers=args.workers) as writer:
+            for line in handle:
+                writer.write(line)
+
+    def read_zstd():
+        with SeekableReader(zst).open(workers=args.workers) as handle:
+            for _ in handle:
+                pass
+
+    timed('compress %s' % gzip_cmd, lambda: subprocess.check_call('%s -c %s > %s' % (gzip_cmd, args.file, gz), shell=True), gz)
+    timed('compress seekable zstd', write_zstd, zst)
+    timed('decompress %s' % gzip_cmd, lambda: subprocess.check_call('%s -d -c %s > /dev/null' % (gzip_cmd, gz), shell=True), gz)
+    timed('decompress zstd', lambda: subprocess.check_call('zstd -q -d -c %s > /dev/null' % zst, shell=True), zst)
+    timed('read lines seekable', read_zstd, zst)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Benchmark siskin.utils.xmlstream against the previous cElementTree based
+implementation on a synthetic, DBLP like file.
+
+    $ python xmlstream_benchmark.py --size 4096 --workers 4
+
+Each variant runs in a separate process, so the reported peak memory (max
+RSS) is per variant. The generated file is reused, if it exists.
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from siskin.utils import xmlstream
+
+RECORD = """<article mdate="2020-01-01" key="journals/synthetic/{i}">
+<author>Author {i} A</author>
+<author>Author {i} B</author>
+<title>On the synthetic record number {i} and <i>friends</i>.</title>
+<pages>{i}-{j}</pages>
+<year>2020</year>
+<volume>{v}</volume>
+<journal>Journal of Synthetic Records</journal>
+<ee>https://doi.org/10.1234/synthetic.{i}</ee>
+<url>db/journals/synthetic/synthetic{v}.html#{i}</url>
+</article>
+<inproceedings mdate="2020-01-01" key="conf/synthetic/{i}">
+<author>Author {i} C</author>
+<title>A proceedings paper, {i}.</title>
+<booktitle>Synthetic Conference</booktitle>
+<year>2020</year>
+</inproceedings>
+"""
+
+
+def generate(filename, size):
+    """
+    Write about size bytes of records.
+    """
+    with open(filename, 'w') as output:
+        output.write('<?xml version="1.0" encoding="utf-8"?>\n<dblp>\n')
+        i = 0
+        while output.tell() < size:
+            output.write(''.join(RECORD.format(i=k, j=k + 10, v=k % 100) for k in range(i, i + 10000)))
+            i += 10000
+        output.write('</dblp>\n')
+
+
+def legacy_xmlstream(filename, tag):
+    """
+    The previous implementation, for reference.
+    """
+    def strip_ns(tag):
+        if not '}' in tag:
+            return tag
+        return tag.split('}')[1]
+
+    context = iter(ET.iterparse(filename, events=(
+        'start',
+        'end',
+    )))
+    try:
+        _, root = next(context)
+    except StopIteration:
+        return
+
+    for event, elem in context:
+        if not strip_ns(elem.tag) == tag or event == 'start':
+            continue
+
+        yield ET.tostring(elem)
+        root.clear()
+
+
+def run(variant, filename, workers):
+    """
+    Run a single variant, print records, seconds and max RSS in MB.
+    """
+    started = time.time()
+    if variant == 'legacy':
+        records = sum(1 for _ in legacy_xmlstream(filename, 'article'))
+    elif variant == 'lxml':
+        records = sum(1 for _ in xmlstream(filename, 'article'))
+    elif variant == 'lxml-dict':
+        records = sum(1 for _ in xmlstream(filename, 'article', output='dict'))
+    elif variant == 'lxml-parallel':
+        records = sum(1 for _ in xmlstream(filename, 'article', workers=workers))
+    else:
+        raise ValueError('unknown variant: %s' % variant)
+    elapsed = time.time() - started
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print('%-16s %10d records %8.1fs %8.1f MB/s %8d MB max RSS' % (variant, records, elapsed, os.path.getsize(filename) / 1048576.0 / elapsed, rss // 1024))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=2048, help='size of synthetic file in MB')
+    parser.add_argument('--file', default='/tmp/xmlstream-benchmark.xml', help='synthetic file')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--variant', help='run a single variant')
+    args = parser.parse_args()
+
+    if args.variant:
+        run(args.variant, args.file, args.workers)
+        sys.exit(0)
+
+    if not os.path.exists(args.file) or os.path.getsize(args.file) < args.size * 1048576:
+        generate(args.file, args.size * 1048576)
+    print('%s, %d MB, %d workers' % (args.file, os.path.getsize(args.file) // 1048576, args.workers))
+    for variant in ('legacy', 'lxml', 'lxml-dict', 'lxml-parallel'):
+        subprocess.check_call([sys.executable, __file__, '--variant', variant, '--file', args.file, '--workers', str(args.workers)])
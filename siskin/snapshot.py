@@ -0,0 +1,210 @@
+# coding: utf-8
+# pylint: disable=C0301,C0103
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Incremental snapshot of Crossref works, keyed by DOI.
+
+Instead of keeping the latest version of each DOI by going over all items
+harvested since 2006 on every update, harvested chunks are applied once to a
+persistent sqlite database, which holds the latest version of each work,
+compressed. Each update is a generation; a work records the generation, in
+which it last changed. The current snapshot or only the works changed since
+a given generation (a delta) can then be written out:
+
+    >>> store = Snapshot('/path/to/snapshot.db')
+    >>> generation = store.begin('2021-05-01')
+    >>> store.apply('2021-04-01-2021-05-01.ldj.gz', generation)
+    {'records.in': 1002331, 'records.new': 103322, 'records.updated': 899009, ...}
+    >>> with open('delta.ldj', 'wb') as output:
+    ...     store.export(output, since=generation - 1)
+
+Of two versions of a work, the one with the later deposited date wins, on
+equal dates the one applied last. DOIs are compared case insensitively.
+Applying the same file (by path and size) again does nothing.
+"""
+
+import collections
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+from siskin.ndjson import open_file
+
+logger = logging.getLogger('siskin')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (id INTEGER PRIMARY KEY, name TEXT, created REAL);
+CREATE TABLE IF NOT EXISTS chunks (path TEXT, size INTEGER, generation INTEGER, records INTEGER, PRIMARY KEY (path, size));
+CREATE TABLE IF NOT EXISTS works (doi TEXT PRIMARY KEY, deposited TEXT, generation INTEGER, data BLOB);
+CREATE INDEX IF NOT EXISTS works_generation ON works (generation);
+"""
+
+
+def _deposited(value):
+    """
+    Return the deposited date-time of an item as string, empty, if missing.
+    """
+    if isinstance(value, dict):
+        return value.get('date-time') or ''
+    return ''
+
+
+class Snapshot(object):
+    """
+    A DOI keyed snapshot of works in a sqlite database at path.
+    """
+    def __init__(self, path, level=6):
+        self.path = path
+        self.level = level
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def generation(self, name=None):
+        """
+        Return the latest generation or the latest one with the given name,
+        0, if there is none.
+        """
+        if name is None:
+            row = self.conn.execute('SELECT MAX(id) FROM generations').fetchone()
+        else:
+            row = self.conn.execute('SELECT MAX(id) FROM generations WHERE name = ?', (name,)).fetchone()
+        return row[0] or 0
+
+    def begin(self, name):
+        """
+        Start a new generation with a name (e.g. a date) and return it. If
+        the latest generation has the same name, it is reused.
+        """
+        row = self.conn.execute('SELECT id, name FROM generations ORDER BY id DESC LIMIT 1').fetchone()
+        if row is not None and row[1] == name:
+            return row[0]
+        with self.conn:
+            cursor = self.conn.execute('INSERT INTO generations (name, created) VALUES (?, ?)', (name, time.time()))
+        return cursor.lastrowid
+
+    def is_applied(self, path):
+        """
+        Return True, if a file has already been applied.
+        """
+        row = self.conn.execute('SELECT 1 FROM chunks WHERE path = ? AND size = ?', (os.path.abspath(path), os.path.getsize(path))).fetchone()
+        return row is not None
+
+    def apply(self, path, generation, batch_size=20000):
+        """
+        Apply a file of items (JSON lines, compressed or not), in a single
+        transaction. Returns a Counter with records in, new, updated and
+        skipped, i.e. older than the stored version or without DOI.
+        """
+        stats = collections.Counter()
+        if self.is_applied(path):
+            stats['chunks.skipped'] += 1
+            return stats
+
+        def flush(batch):
+            # Keep the last version of a DOI within the batch, too.
+            latest = {}
+            for doi, deposited, line in batch:
+                if doi not in latest or deposited >= latest[doi][0]:
+                    latest[doi] = (deposited, line)
+            known = {}
+            dois = list(latest)
+            for i in range(0, len(dois), 500):
+                part = dois[i:i + 500]
+                query = 'SELECT doi, deposited FROM works WHERE doi IN (%s)' % ','.join('?' * len(part))
+                known.update(self.conn.execute(query, part).fetchall())
+            rows = []
+            for doi, (deposited, line) in latest.items():
+                if doi in known:
+                    if deposited < known[doi]:
+                        stats['records.skipped.older'] += 1
+                        continue
+                    stats['records.updated'] += 1
+                else:
+                    stats['records.new'] += 1
+                rows.append((doi, deposited, generation, zlib.compress(line, self.level)))
+            if len(batch) > len(latest):
+                stats['records.duplicate'] += len(batch) - len(latest)
+            self.conn.executemany('INSERT OR REPLACE INTO works (doi, deposited, generation, data) VALUES (?, ?, ?, ?)', rows)
+
+        with self.conn:
+            batch = []
+            with open_file(path) as handle:
+                for line in handle:
+                    if not line.strip():
+                        continue
+                    stats['records.in'] += 1
+                    doc = json.loads(line)
+                    doi, deposited = doc.get('DOI'), doc.get('deposited')
+                    if not doi:
+                        stats['records.skipped.no.doi'] += 1
+                        continue
+                    batch.append((doi.lower(), _deposited(deposited), line.rstrip(b'\n')))
+                    if len(batch) >= batch_size:
+                        flush(batch)
+                        batch = []
+            flush(batch)
+            self.conn.execute('INSERT INTO chunks VALUES (?, ?, ?, ?)', (os.path.abspath(path), os.path.getsize(path), generation, stats['records.in']))
+        stats['chunks.applied'] += 1
+        logger.debug('applied %s to %s: %s', path, self.path, dict(stats))
+        return stats
+
+    def count(self, since=None):
+        """
+        Return the number of works, or of works changed after generation since.
+        """
+        if since is None:
+            return self.conn.execute('SELECT COUNT(*) FROM works').fetchone()[0]
+        return self.conn.execute('SELECT COUNT(*) FROM works WHERE generation > ?', (since,)).fetchone()[0]
+
+    def export(self, fileobj, since=None):
+        """
+        Write all works, or the works changed after generation since, as JSON
+        lines to a binary file object. Returns the number of works written.
+        """
+        if since is None:
+            cursor = self.conn.execute('SELECT data FROM works')
+        else:
+            cursor = self.conn.execute('SELECT data FROM works WHERE generation > ?', (since,))
+        count = 0
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            fileobj.write(b''.join(zlib.decompress(data) + b'\n' for data, in rows))
+            count += len(rows)
+        return count
@@ -0,0 +1,227 @@
+# coding: utf-8
+# pylint: disable=C0301,C0103
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Bulk indexing of JSON lines into Solr, over several connections.
+
+Documents are sent as JSON arrays of at most batch_size documents (or about
+max_bytes) to the update handler of a core, with up to workers requests at
+a time. Lines are not parsed, only joined. The reader is paused, while all
+workers are busy, so memory use is bounded.
+
+If Solr is overloaded (HTTP 503 or 429), all workers pause (for the time
+given in a Retry-After header or with exponential backoff), before the
+batch is retried; connection errors and other server errors are retried as
+well. Other client errors fail immediately, since retrying a bad document
+does not help.
+
+    >>> indexer = Indexer('http://localhost:8983/solr/ai', workers=4, commit='soft')
+    >>> with open_file('export.ldj.gz') as handle:
+    ...     indexer.index(handle)
+    >>> indexer.delete(['ai-49-abc', 'ai-49-def'])
+    >>> indexer.finish()
+    Counter({'docs': 81602112, 'batches': 16321, 'retries': 2, 'throttled': 5, ...})
+
+The commit policy is one of "none" (leave it to autoCommit), "soft" or
+"hard" (a commit after everything is sent); with commit_within, Solr is
+asked to commit each batch within that many milliseconds.
+"""
+
+import collections
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger('siskin')
+
+COMMIT_POLICIES = ('none', 'soft', 'hard')
+
+
+class Indexer(object):
+    """
+    Send documents and deletes to the update handler of a Solr core at url.
+    """
+    def __init__(self, url, batch_size=2000, max_bytes=1 << 23, workers=4, max_tries=10, timeout=600, commit='hard', commit_within=None,
+                 max_pause=60):
+        if commit not in COMMIT_POLICIES:
+            raise ValueError('commit must be one of %s, got %s' % (', '.join(COMMIT_POLICIES), commit))
+        self.url = url.rstrip('/')
+        if not self.url.endswith('/update'):
+            self.url += '/update'
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.max_tries = max_tries
+        self.timeout = timeout
+        self.commit = commit
+        self.commit_within = commit_within
+        self.max_pause = max_pause
+        self.stats = collections.Counter()
+        self.started = time.time()
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._pause = 1.0
+
+    def _wait(self):
+        """
+        Block, while indexing is paused.
+        """
+        while True:
+            with self._lock:
+                delay = self._paused_until - time.time()
+            if delay <= 0:
+                return
+            time.sleep(min(delay, 1.0))
+
+    def _throttle(self, response):
+        """
+        Pause all workers, for Retry-After seconds or an increasing delay.
+        """
+        try:
+            delay = float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            delay = None
+        with self._lock:
+            if delay is None:
+                delay = self._pause
+                self._pause = min(self._pause * 2, self.max_pause)
+            self._paused_until = max(self._paused_until, time.time() + min(delay, self.max_pause))
+            self.stats['throttled'] += 1
+        logger.debug('solr busy (%s), pausing for %.1fs', response.status_code, delay)
+
+    def post(self, body, params=None):
+        """
+        Post a JSON body to the update handler, retrying on overload and
+        server errors. Raises RuntimeError, if all attempts failed.
+        """
+        params = dict(params or {})
+        if self.commit_within:
+            params['commitWithin'] = self.commit_within
+        for attempt in range(self.max_tries):
+            self._wait()
+            try:
+                r = self.session.post(self.url, data=body, params=params, headers={'Content-Type': 'application/json'}, timeout=self.timeout)
+            except requests.exceptions.RequestException as err:
+                reason = str(err)
+                time.sleep(min(2**attempt, self.max_pause))
+            else:
+                if r.status_code < 300:
+                    with self._lock:
+                        self._pause = 1.0
+                    return
+                if r.status_code in (429, 503):
+                    self._throttle(r)
+                elif r.status_code < 500:
+                    raise RuntimeError('%s on %s: %s' % (r.status_code, self.url, r.text[:1000]))
+                else:
+                    time.sleep(min(2**attempt, self.max_pause))
+                reason = '%s: %s' % (r.status_code, r.text[:200])
+            with self._lock:
+                self.stats['retries'] += 1
+            logger.debug('retrying batch (attempt %d of %d): %s', attempt + 1, self.max_tries, reason)
+        raise RuntimeError('giving up on %s after %d attempts: %s' % (self.url, self.max_tries, reason))
+
+    def _send(self, lines, size):
+        self.post(b'[' + b','.join(lines) + b']')
+        with self._lock:
+            self.stats['docs'] += len(lines)
+            self.stats['bytes'] += size
+            self.stats['batches'] += 1
+
+    def batches(self, lines):
+        """
+        Group lines into batches of at most batch_size lines or about
+        max_bytes bytes, yield (lines, size) tuples.
+        """
+        batch, size = [], 0
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            batch.append(line)
+            size += len(line)
+            if len(batch) >= self.batch_size or size >= self.max_bytes:
+                yield batch, size
+                batch, size = [], 0
+        if batch:
+            yield batch, size
+
+    def index(self, lines, log_every=60):
+        """
+        Index documents from an iterable of JSON lines (bytes), e.g. a file.
+        """
+        reported = time.time()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = collections.deque()
+            try:
+                for batch, size in self.batches(lines):
+                    pending.append(executor.submit(self._send, batch, size))
+                    while len(pending) > 2 * self.workers or (pending and pending[0].done()):
+                        pending.popleft().result()
+                    if time.time() - reported > log_every:
+                        reported = time.time()
+                        logger.debug('indexed %d docs, %.0f docs/s', self.stats['docs'], self.throughput())
+                while pending:
+                    pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+        return self.stats
+
+    def delete(self, ids):
+        """
+        Delete documents by id, ids is an iterable of strings.
+        """
+        for batch, _ in self.batches(json.dumps(str(v).strip()).encode('utf-8') for v in ids if str(v).strip()):
+            self.post(b'{"delete": [' + b','.join(batch) + b']}')
+            self.stats['deletes'] += len(batch)
+        return self.stats
+
+    def throughput(self):
+        """
+        Documents indexed per second, so far.
+        """
+        return self.stats['docs'] / max(time.time() - self.started, 1e-6)
+
+    def finish(self):
+        """
+        Commit according to policy and return the statistics, including
+        elapsed seconds and throughput.
+        """
+        if self.commit == 'hard':
+            self.post(b'{"commit": {}}')
+        elif self.commit == 'soft':
+            self.post(b'[]', params={'softCommit': 'true'})
+        self.stats['seconds'] = round(time.time() - self.started, 3)
+        self.stats['docs/s'] = round(self.throughput(), 1)
+        logger.debug('indexed %d docs, deleted %d, in %.1fs (%.0f docs/s, %d retries)', self.stats['docs'], self.stats['deletes'], self.stats['seconds'],
+                     self.stats['docs/s'], self.stats['retries'])
+        return self.stats
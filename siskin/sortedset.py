@@ -0,0 +1,292 @@
+# coding: utf-8
+# pylint: disable=C0301,C0103
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+A compact, read-only set of strings, for lists too large for a Python set,
+e.g. all DOIs from crossref.
+
+Values are stored sorted and deduplicated in a single file, which is memory
+mapped. Strings are stored length-prefixed, with an offset table for binary
+search. ISSNs are packed into 32-bit integers.
+
+    >>> s = SortedSet.build('/tmp/dois.set', ['10.1/a', '10.1/b'])
+    >>> '10.1/a' in s
+    True
+    >>> list(s.intersection(SortedSet('/tmp/other.set')))
+    ['10.1/b']
+
+Since the file is only mapped, the pages are shared between all processes
+using the same file (or the same mapping, after a fork).
+
+Lookups use a small in-memory index of every 512th value to narrow down the
+binary search.
+
+File layout: a 32 byte header (magic, kind, count, offset of the offset
+table), the values, then the offset table. Integers are stored in native
+byte order.
+"""
+
+import array
+import bisect
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+
+logger = logging.getLogger('siskin')
+
+# Magic, followed by the byte order of the machine, that created the file.
+MAGIC = b'sortset' + (b'<' if sys.byteorder == 'little' else b'>')
+HEADER = struct.Struct('<8sBxxxxxxxQQ')
+LENGTH = struct.Struct('<I')
+
+KIND_BYTES, KIND_ISSN = 0, 1
+
+# Every n-th key is kept in memory to narrow down the binary search.
+SPARSE_INDEX_STEP = 512
+
+
+def pack_issn(value):
+    """
+    Pack an ISSN (1234-567X or 1234567X) into an integer, which sorts like
+    the ISSN string.
+    """
+    match = re.match(r'^([0-9]{4})-?([0-9]{3})([0-9Xx])$', value.strip())
+    if not match:
+        raise ValueError('invalid ISSN: %s' % value)
+    check = match.group(3).upper()
+    return int(match.group(1) + match.group(2)) * 11 + (10 if check == 'X' else int(check))
+
+
+def unpack_issn(value):
+    """
+    Return the ISSN string for a packed ISSN.
+    """
+    digits, check = divmod(value, 11)
+    return '%04d-%03d%s' % (digits // 1000, digits % 1000, 'X' if check == 10 else check)
+
+
+class _Keys(object):
+    """
+    Sequence view of the stored keys for bisect, keys are bytes or integers.
+    """
+    def __init__(self, sset):
+        self.sset = sset
+
+    def __len__(self):
+        return len(self.sset)
+
+    def __getitem__(self, i):
+        return self.sset._key(i)
+
+
+class SortedSet(object):
+    """
+    Read-only set, backed by a memory mapped file. Supports membership
+    tests, iteration in sorted order and merge scans (intersection,
+    difference) with other sorted sets of the same kind.
+    """
+    def __init__(self, path, unlink=False):
+        """
+        Open a file created with SortedSet.build. With unlink, the file is
+        removed right away, the mapping stays valid until close.
+        """
+        self.path = path
+        with open(path, 'rb') as handle:
+            self.mm = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if unlink:
+            os.remove(path)
+        magic, self.kind, self.count, table = HEADER.unpack_from(self.mm, 0)
+        if magic[:-1] != MAGIC[:-1]:
+            raise RuntimeError('not a sorted set file: %s' % path)
+        if magic != MAGIC:
+            raise RuntimeError('sorted set %s was created on a machine with different byte order' % path)
+        self._view = memoryview(self.mm)
+        if self.kind == KIND_ISSN:
+            self._table = self._view[HEADER.size:HEADER.size + 4 * self.count].cast('I')
+        else:
+            self._table = self._view[table:table + 8 * self.count].cast('Q')
+        self._sparse = None
+
+    @classmethod
+    def build(cls, path, values, issn=False, presorted=False):
+        """
+        Write values (str or bytes) to path and return the opened set. Unless
+        presorted is True, values are sorted in memory; for very large inputs
+        pass values sorted bytewise (e.g. LC_ALL=C sort), duplicates are
+        removed in any case.
+        """
+        kind = KIND_ISSN if issn else KIND_BYTES
+        if issn:
+            values = (pack_issn(v) for v in values)
+        else:
+            values = (v.encode('utf-8') if not isinstance(v, bytes) else v for v in values)
+        if not presorted:
+            values = sorted(values)
+
+        count, previous = 0, None
+        with open(path, 'wb') as output:
+            output.write(HEADER.pack(MAGIC, kind, 0, 0))
+            if kind == KIND_ISSN:
+                buf = array.array('I')
+                for value in values:
+                    if value == previous:
+                        continue
+                    if previous is not None and value < previous:
+                        raise ValueError('input not sorted: %s after %s' % (unpack_issn(value), unpack_issn(previous)))
+                    buf.append(value)
+                    previous, count = value, count + 1
+                    if len(buf) >= 1 << 16:
+                        buf.tofile(output)
+                        del buf[:]
+                buf.tofile(output)
+                table = 0
+            else:
+                with tempfile.TemporaryFile() as offsets:
+                    buf = array.array('Q')
+                    for value in values:
+                        if value == previous:
+                            continue
+                        if previous is not None and value < previous:
+                            raise ValueError('input not sorted: %r after %r' % (value, previous))
+                        buf.append(output.tell())
+                        output.write(LENGTH.pack(len(value)))
+                        output.write(value)
+                        previous, count = value, count + 1
+                        if len(buf) >= 1 << 16:
+                            buf.tofile(offsets)
+                            del buf[:]
+                    buf.tofile(offsets)
+                    output.write(b'\x00' * (-output.tell() % 8))
+                    table = output.tell()
+                    offsets.seek(0)
+                    while True:
+                        chunk = offsets.read(1 << 20)
+                        if not chunk:
+                            break
+                        output.write(chunk)
+            output.seek(0)
+            output.write(HEADER.pack(MAGIC, kind, count, table))
+        logger.debug('wrote sorted set with %d values to %s', count, path)
+        return cls(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Release the mapping.
+        """
+        self._table.release()
+        self._view.release()
+        self.mm.close()
+
+    def __len__(self):
+        return self.count
+
+    def _key(self, i):
+        """
+        Return the i-th key, bytes or an integer for ISSN sets.
+        """
+        if self.kind == KIND_ISSN:
+            return self._table[i]
+        offset = self._table[i]
+        length, = LENGTH.unpack_from(self.mm, offset)
+        return self.mm[offset + 4:offset + 4 + length]
+
+    def _encode(self, value):
+        if self.kind == KIND_ISSN:
+            return pack_issn(value) if not isinstance(value, int) else value
+        return value.encode('utf-8') if not isinstance(value, bytes) else value
+
+    def _decode(self, key):
+        if self.kind == KIND_ISSN:
+            return unpack_issn(key)
+        return key.decode('utf-8')
+
+    def _keys(self):
+        """
+        Iterate over keys in order, sequentially.
+        """
+        if self.kind == KIND_ISSN:
+            for value in self._table:
+                yield value
+            return
+        offset = HEADER.size
+        for _ in range(self.count):
+            length, = LENGTH.unpack_from(self.mm, offset)
+            yield self.mm[offset + 4:offset + 4 + length]
+            offset += 4 + length
+
+    def __contains__(self, value):
+        try:
+            key = self._encode(value)
+        except ValueError:
+            return False
+        if self._sparse is None:
+            self._sparse = [self._key(i) for i in range(0, self.count, SPARSE_INDEX_STEP)]
+        block = bisect.bisect_right(self._sparse, key) - 1
+        if block < 0:
+            return False
+        lo = block * SPARSE_INDEX_STEP
+        i = bisect.bisect_left(_Keys(self), key, lo, min(lo + SPARSE_INDEX_STEP, self.count))
+        return i < self.count and self._key(i) == key
+
+    def __iter__(self):
+        for key in self._keys():
+            yield self._decode(key)
+
+    def _merge(self, other, emit_common):
+        """
+        Merge scan over both sets, yields our values, that are (emit_common)
+        or are not (not emit_common) in other.
+        """
+        if not isinstance(other, SortedSet):
+            raise RuntimeError('merge scans require another SortedSet')
+        if other.kind != self.kind:
+            raise RuntimeError('cannot merge sorted sets of different kinds')
+        theirs = other._keys()
+        current = next(theirs, None)
+        for key in self._keys():
+            while current is not None and current < key:
+                current = next(theirs, None)
+            if (current is not None and current == key) == emit_common:
+                yield self._decode(key)
+
+    def intersection(self, other):
+        """
+        Iterate over values contained in both sets, in order.
+        """
+        return self._merge(other, True)
+
+    def difference(self, other):
+        """
+        Iterate over values not contained in other, in order.
+        """
+        return self._merge(other, False)
@@ -41,6 +41,18 @@ Configuration
 
 doi-blacklist = /tmp/siskin-data/crossref/CrossrefDOIBlacklist/output.tsv
 
+# API settings, see siskin.crossrefapi
+api-url = https://api.crossref.org
+mailto = team@example.com
+rate = 10
+
+# Member names of DOI prefixes, not in the members list, refreshed after ttl seconds
+member-cache = /tmp/siskin-data/.crossref/members.tsv
+member-cache-ttl = 2592000
+
+# Incremental snapshot, see CrossrefSnapshotUpdate
+snapshot-store = /tmp/siskin-data/49/snapshot.db
+
 """
 
 # TODO: see, if
@@ -48,19 +60,16 @@ doi-blacklist = /tmp/siskin-data/crossref/CrossrefDOIBlacklist/output.tsv
 # is usable, and how often it gets updated
 # https://www.crossref.org/blog/new-public-data-file-120-million-metadata-records/
 
+import collections
 import datetime
 import io
 import itertools
 import json
 import os
+import shutil
 import socket
 import tempfile
-import time
-import urllib.error
-import urllib.parse
-import urllib.request
 
-import requests
 from six import string_types
 
 import elasticsearch
@@ -70,12 +79,33 @@ from gluish.format import TSV, Gzip
 from gluish.intervals import monthly
 from gluish.parameter import ClosestDateParameter
 from gluish.utils import date_range, shellout
-from siskin import __version__
+from siskin import __version__, crossrefapi, ndjson
 from siskin.benchmark import timed
+from siskin.common import IntermediateSchemaProjections
 from siskin.mail import send_mail
+from siskin.seekable import cat_command
+from siskin.snapshot import Snapshot
 from siskin.sources.amsl import AMSLFilterConfig, AMSLService
 from siskin.task import DefaultTask
-from siskin.utils import URLCache, load_set_from_target
+from siskin.utils import load_set_from_target
+
+
+def prefix_collection_pairs(docs, stats):
+    """
+    Return the unique DOI prefix and collection name pairs of a batch of
+    documents, as tab separated strings.
+    """
+    pairs = set()
+    for doc in docs:
+        doi = doc.get("doi")
+        if not doi:
+            stats["err.no.doi"] += 1
+            continue
+        prefix, _ = doi.split("/", 1)
+        # Most records will have a single collection name.
+        for mega_collection in doc.get("finc.mega_collection", []):
+            pairs.add("%s\t%s" % (prefix, mega_collection))
+    return pairs
 
 
 class CrossrefTask(DefaultTask):
@@ -94,15 +124,28 @@ class CrossrefTask(DefaultTask):
 class CrossrefHarvestChunkWithCursor(CrossrefTask):
     """
     Harvest window with cursors (https://git.io/JeDC4).
+
+    With workers > 1, the window is split into smaller windows of at most
+    max_records works each, which are harvested concurrently, under a single
+    rate limit, see siskin.crossrefapi. The output format is the same.
+
+    Progress is checkpointed after every page below OUTPUT.harvest, a failed
+    harvest continues from there on the next run.
+
+    With items set, the output contains one item per line instead of one
+    response per line and the rest of the responses (cursors, total-results)
+    go to OUTPUT.envelopes, as JSON lines.
     """
     begin = luigi.DateParameter(description='start of harvesting window')
     end = luigi.DateParameter(description='end of harvesting window, inclusive')
     filter = luigi.Parameter(default='deposit', description='index, deposit, update')
+    items = luigi.BoolParameter(description='write items, one per line, instead of responses')
 
     rows = luigi.IntParameter(default=1000, significant=False)
     max_retries = luigi.IntParameter(default=10, significant=False, description='HTTP retries')
-    attempts = luigi.IntParameter(default=3, significant=False, description='number of attempts to GET an URL that failed')
-    sleep = luigi.IntParameter(default=1, significant=False, description='sleep between requests')
+    sleep = luigi.IntParameter(default=1, significant=False, description='sleep between requests, if workers is 1')
+    workers = luigi.IntParameter(default=1, significant=False, description='number of windows to harvest concurrently')
+    max_records = luigi.IntParameter(default=500000, significant=False, description='split windows with more works, if workers > 1')
 
     def run(self):
         """
@@ -120,60 +163,30 @@ class CrossrefHarvestChunkWithCursor(CrossrefTask):
         directed to a special pool of API machines that are reserved for polite
         users. (https://git.io/vFyN5), refs #9059.
         """
-        cache = URLCache(directory=os.path.join(tempfile.gettempdir(), '.urlcache'))
-        adapter = requests.adapters.HTTPAdapter(max_retries=self.max_retries)
-        cache.sess.mount('http://', adapter)
-
-        filter = "from-{self.filter}-date:{self.begin},until-{self.filter}-date:{self.end}".format(self=self)
-        rows, offset = self.rows, 0
-        cursor = '*'
-
-        with self.output().open('w') as output:
-            params = {'rows': rows, 'filter': filter}
-
-            while True:
-                params['cursor'] = cursor
-
-                # Do not fail, if user has not configured mailto, https://git.io/vFyN5.
-                if self.config.get('crossref', 'mailto', fallback=None):
-                    params['mailto'] = self.config.get('crossref', 'mailto')
-
-                url = 'https://api.crossref.org/works?%s' % (urllib.parse.urlencode(params))
-
-                for attempt in range(1, self.attempts):
-                    if not cache.is_cached(url):
-                        time.sleep(self.sleep)
-                    body = cache.get(url)
-                    try:
-                        content = json.loads(body)
-                    except ValueError as err:
-                        if attempt == self.attempts - 1:
-                            self.logger.debug('URL was %s', url)
-                            self.logger.debug(err)
-                            self.logger.debug(body[:100] + '...')
-                            raise
-
-                        cache_file = cache.get_cache_file(url)
-                        if os.path.exists(cache_file):
-                            self.logger.debug('trying to recover by removing cached entry at %s', cache_file)
-                            os.remove(cache_file)
-                    else:
-                        break
-
-                count = len(content['message']['items'])
-                self.logger.debug("%s: %s", url, count)
-                if count == 0:
-                    break
-
-                body = body + '\n'
-                if isinstance(body, string_types):
-                    body = body.encode('utf-8')
-                output.write(body)
-                offset += rows
-
-                if not 'next-cursor' in content['message']:
-                    raise RuntimeError('missing key: next-cursor')
-                cursor = content['message']['next-cursor']
+        rate = None if self.workers > 1 or not self.sleep else 1.0 / self.sleep
+        client = crossrefapi.CrossrefClient(rate=rate, max_tries=self.max_retries)
+        directory = self.output().path + '.harvest'
+        _, stopover = tempfile.mkstemp(prefix='siskin-')
+        _, envelopes = tempfile.mkstemp(prefix='siskin-')
+        with open(stopover, 'wb') as output, open(envelopes, 'wb') as sidecar:
+            stats = crossrefapi.harvest(client,
+                                        self.begin,
+                                        self.end,
+                                        output,
+                                        kind=self.filter,
+                                        workers=self.workers,
+                                        rows=self.rows,
+                                        max_records=self.max_records if self.workers > 1 else None,
+                                        directory=directory,
+                                        envelopes=sidecar if self.items else None)
+        self.logger.debug('harvested %d items in %d pages from %d windows', stats['items'], stats['pages'], stats['windows'])
+        self.record_count = stats['items']
+        if self.items:
+            luigi.LocalTarget(envelopes).move(self.output().path + '.envelopes')
+        else:
+            os.remove(envelopes)
+        luigi.LocalTarget(stopover).move(self.output().path)
+        shutil.rmtree(directory)
 
     def output(self):
         return luigi.LocalTarget(path=self.path(ext='ldj.gz'), format=Gzip)
@@ -201,15 +214,30 @@ class CrossrefHarvest(luigi.WrapperTask, CrossrefTask):
 class CrossrefChunkItems(CrossrefTask):
     """
     Extract the message items, per chunk.
+
+    With stream set, the items are split off the responses during the
+    harvest already and the harvested file is only linked here, without a
+    separate jq pass. To use this for all chunks, set stream in the
+    [CrossrefChunkItems] section of luigi.cfg.
     """
     begin = luigi.DateParameter()
     end = luigi.DateParameter()
     filter = luigi.Parameter(default='deposit', description='index, deposit, update')
+    stream = luigi.BoolParameter(significant=False, description='split items while harvesting')
 
     def requires(self):
-        return CrossrefHarvestChunkWithCursor(begin=self.begin, end=self.end, filter=self.filter)
+        return CrossrefHarvestChunkWithCursor(begin=self.begin, end=self.end, filter=self.filter, items=self.stream)
 
     def run(self):
+        if self.stream:
+            _, stopover = tempfile.mkstemp(prefix='siskin-', dir=os.path.dirname(self.input().path))
+            os.remove(stopover)
+            try:
+                os.link(self.input().path, stopover)
+            except OSError:
+                shutil.copyfile(self.input().path, stopover)
+            luigi.LocalTarget(stopover).move(self.output().path)
+            return
         output = shellout("unpigz -c {input} | jq -c -r '.message.items[]?' | pigz -c > {output}", input=self.input().path)
         luigi.LocalTarget(output).move(self.output().path)
 
@@ -242,17 +270,70 @@ class CrossrefRawItems(CrossrefTask):
         return luigi.LocalTarget(path=self.path(ext='ldj.gz'), format=Gzip)
 
 
+class CrossrefSnapshotUpdate(CrossrefTask):
+    """
+    Apply harvested chunks to the incremental snapshot store (see
+    siskin.snapshot), as a new generation named by date. Chunks already
+    applied are skipped, so only new chunks are read. The output lists the
+    generation and counts, as key value pairs.
+
+    The store is kept at [crossref] snapshot-store and always holds the
+    latest state, regardless of the date of this task.
+    """
+    begin = luigi.DateParameter(default=datetime.date(2006, 1, 1))
+    date = ClosestDateParameter(default=datetime.date.today())
+    update = luigi.Parameter(default='months', description='days, weeks or months')
+
+    def requires(self):
+        return CrossrefRawItems(begin=self.begin, date=self.date, update=self.update).requires()
+
+    def run(self):
+        stats = collections.Counter()
+        with Snapshot(self.snapshot_store()) as store:
+            generation = store.begin(str(self.date))
+            for target in self.input():
+                stats.update(store.apply(target.path, generation))
+            changed, works = store.count(since=generation - 1), store.count()
+        self.record_count = stats['records.in']
+        self.logger.debug('generation %d: %d works, %d changed, %s', generation, works, changed, dict(stats))
+        with self.output().open('w') as output:
+            output.write_tsv('generation', generation)
+            output.write_tsv('works', works)
+            output.write_tsv('works.changed', changed)
+            for key, value in sorted(stats.items()):
+                output.write_tsv(key, value)
+
+    def snapshot_store(self):
+        return self.config.get('crossref', 'snapshot-store', fallback=os.path.join(self.BASE, self.TAG, 'snapshot.db'))
+
+    def output(self):
+        return luigi.LocalTarget(path=self.path(), format=TSV)
+
+
 class CrossrefUniqItems(CrossrefTask):
     """
     Calculate current snapshot via span-crossref-snapshot.
+
+    With incremental set, the snapshot is written from the snapshot store
+    instead, after applying only the new chunks, see CrossrefSnapshotUpdate.
     """
     begin = luigi.DateParameter(default=datetime.date(2006, 1, 1))
     date = ClosestDateParameter(default=datetime.date.today())
+    incremental = luigi.BoolParameter(significant=False, description='use the snapshot store')
 
     def requires(self):
+        if self.incremental:
+            return CrossrefSnapshotUpdate(begin=self.begin, date=self.closest())
         return CrossrefRawItems(begin=self.begin, date=self.closest())
 
     def run(self):
+        if self.incremental:
+            _, stopover = tempfile.mkstemp(prefix='siskin-', suffix='.ldj.gz')
+            with Snapshot(self.requires().snapshot_store()) as store:
+                with ndjson.open_file(stopover, 'w') as output:
+                    self.record_count = store.export(output)
+            luigi.LocalTarget(stopover).move(self.output().path)
+            return
         output = shellout("span-crossref-snapshot -verbose -z -o {output} {input}", input=self.input().path)
         luigi.LocalTarget(output).move(self.output().path)
 
@@ -260,6 +341,32 @@ class CrossrefUniqItems(CrossrefTask):
         return luigi.LocalTarget(path=self.path(ext='ldj.gz'), format=Gzip)
 
 
+class CrossrefSnapshotDelta(CrossrefTask):
+    """
+    Works changed in the snapshot store since the generation of a given
+    date, e.g. the date of the last export, see CrossrefSnapshotUpdate.
+    """
+    begin = luigi.DateParameter(default=datetime.date(2006, 1, 1))
+    date = ClosestDateParameter(default=datetime.date.today())
+    since = luigi.DateParameter(description='date of an earlier CrossrefSnapshotUpdate')
+
+    def requires(self):
+        return CrossrefSnapshotUpdate(begin=self.begin, date=self.closest())
+
+    def run(self):
+        _, stopover = tempfile.mkstemp(prefix='siskin-', suffix='.ldj.gz')
+        with Snapshot(self.requires().snapshot_store()) as store:
+            generation = store.generation(name=str(self.since))
+            if not generation:
+                raise RuntimeError('no snapshot generation for %s' % self.since)
+            with ndjson.open_file(stopover, 'w') as output:
+                self.record_count = store.export(output, since=generation)
+        luigi.LocalTarget(stopover).move(self.output().path)
+
+    def output(self):
+        return luigi.LocalTarget(path=self.path(ext='ldj.gz'), format=Gzip)
+
+
 class CrossrefIntermediateSchema(CrossrefTask):
     """
     Convert to intermediate format via span.
@@ -272,11 +379,13 @@ class CrossrefIntermediateSchema(CrossrefTask):
 
     @timed
     def run(self):
-        output = shellout("span-import -i crossref <(unpigz -c {input}) | pigz -c > {output}", input=self.input().get('file').path)
+        output = shellout("span-import -i crossref <(unpigz -c {input}) | {compress} > {output}",
+                          input=self.input().get('file').path,
+                          compress=self.compress_command())
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(ext='ldj.gz'), format=Gzip)
+        return self.compressed_target(ext='ldj')
 
 
 class CrossrefCollections(CrossrefTask):
@@ -291,7 +400,8 @@ class CrossrefCollections(CrossrefTask):
 
     @timed
     def run(self):
-        output = shellout("""jq -rc '.["finc.mega_collection"][]?' <(unpigz -c {input}) | LC_ALL=C sort -S35% -u > {output}""",
+        output = shellout("""jq -rc '.["finc.mega_collection"][]?' <({cat} {input}) | LC_ALL=C sort -S35% -u > {output}""",
+                          cat=cat_command(self.input().get('input').path),
                           input=self.input().get('input').path)
         luigi.LocalTarget(output).move(self.output().path)
 
@@ -311,7 +421,8 @@ class CrossrefCollectionsCount(CrossrefTask):
 
     @timed
     def run(self):
-        output = shellout("""jq -rc '.["finc.mega_collection"][]?' <(unpigz -c {input}) | LC_ALL=C sort -S35% > {output}""",
+        output = shellout("""jq -rc '.["finc.mega_collection"][]?' <({cat} {input}) | LC_ALL=C sort -S35% > {output}""",
+                          cat=cat_command(self.input().get('input').path),
                           input=self.input().get('input').path)
 
         groups = {}  # Map collection name to its size.
@@ -395,6 +506,16 @@ class CrossrefCollectionsDifference(CrossrefTask):
         return luigi.LocalTarget(path=self.path(), format=TSV)
 
 
+class CrossrefProjections(IntermediateSchemaProjections, CrossrefTask):
+    """
+    DOI, ISSN, prefix, collection and format lists in one pass.
+    """
+    date = ClosestDateParameter(default=datetime.date.today())
+
+    def requires(self):
+        return CrossrefIntermediateSchema(date=self.date)
+
+
 class CrossrefDOIList(CrossrefTask):
     """
     A list of Crossref DOIs.
@@ -402,20 +523,14 @@ class CrossrefDOIList(CrossrefTask):
     date = ClosestDateParameter(default=datetime.date.today())
 
     def requires(self):
-        return {'input': CrossrefIntermediateSchema(date=self.date), 'jq': Executable(name='jq', message='https://github.com/stedolan/jq')}
+        return CrossrefProjections(date=self.date)
 
-    @timed
     def run(self):
-        _, stopover = tempfile.mkstemp(prefix='siskin-')
-        # process substitution sometimes results in a broken pipe, so extract beforehand
-        output = shellout("unpigz -c {input} > {output}", input=self.input().get('input').path)
-        shellout("""jq -r '.doi?' {input} | grep -o "10.*" 2> /dev/null | LC_ALL=C sort -S50% > {output} """, input=output, output=stopover)
-        os.remove(output)
-        output = shellout("""sort -S50% -u {input} > {output} """, input=stopover)
+        output = shellout("cp {input} {output}", input=self.input().get('doi').path)
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(), format=TSV)
+        return luigi.LocalTarget(path=self.path(ext='c.tsv'), format=TSV)
 
 
 class CrossrefISSNList(CrossrefTask):
@@ -449,11 +564,11 @@ class CrossrefUniqISSNList(CrossrefTask):
 
     @timed
     def run(self):
-        output = shellout("sort -u {input} > {output}", input=self.input().path)
+        output = shellout("LC_ALL=C sort -u {input} > {output}", input=self.input().path)
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(), format=TSV)
+        return luigi.LocalTarget(path=self.path(ext='c.tsv'), format=TSV)
 
 
 class CrossrefDOIAndISSNList(CrossrefTask):
@@ -468,7 +583,7 @@ class CrossrefDOIAndISSNList(CrossrefTask):
     @timed
     def run(self):
         _, stopover = tempfile.mkstemp(prefix='siskin-')
-        temp = shellout("unpigz -c {input} > {output}", input=self.input().get('input').path)
+        temp = shellout("{cat} {input} > {output}", cat=cat_command(self.input().get('input').path), input=self.input().get('input').path)
         output = shellout("""jq -r '[.doi?, .["rft.issn"][]?, .["rft.eissn"][]?] | @csv' {input} | LC_ALL=C sort -S50% > {output} """,
                           input=temp,
                           output=stopover)
@@ -579,6 +694,7 @@ class CrossrefPrefixMapping(CrossrefTask):
     Current format: PREFIX CANONICAL-NAME CURRENT-AMSL-MEGACOLLECTION
     """
     date = luigi.DateParameter(default=datetime.date.today())
+    workers = luigi.IntParameter(default=4, significant=False, description='number of worker processes')
 
     def requires(self):
         return {
@@ -602,36 +718,32 @@ class CrossrefPrefixMapping(CrossrefTask):
 
         self.logger.debug("found %d mappings from prefix to name", len(namemap))
 
-        result = set()
-
-        with self.input().get('data').open() as handle:
-            for i, line in enumerate(handle):
-                if i % 1000000 == 0:
-                    self.logger.debug("[...] at %d", i)
-                doc = json.loads(line.decode('utf-8').strip())
-                doi = doc.get("doi")
-                if not doi:
-                    self.logger.warn("document without doi: %s", line)
-                    continue
-                prefix, _ = doi.split("/", 1)
-
-                # Most records will have a single collection name.
-                for mega_collection in doc.get("finc.mega_collection", []):
-                    name = namemap.get(prefix)
-
-                    if name is None:
-                        # Cache canonical names, if we missed it.
-                        resp = requests.get("https://api.crossref.org/members/%s" % prefix).json()
-                        namemap[prefix] = resp["message"]["primary-name"]
-                        name = namemap.get(prefix, "UNDEFINED")
-                        self.logger.debug("namemap now contains %d entries, added %s, %s", len(namemap), prefix, namemap[prefix])
-
-                    try:
-                        name = name.decode('utf-8')
-                    except AttributeError as err:
-                        pass  # XXX: python 2/3 compat
-                    entry = tuple(v for v in (prefix, name, mega_collection))
-                    result.add(entry)  # Unique.
+        # Collect unique (prefix, collection) pairs in parallel, names are
+        # resolved afterwards, since there are only a few thousand prefixes.
+        with tempfile.TemporaryFile() as pairs:
+            stats = ndjson.transform(self.input().get('data').path,
+                                     pairs,
+                                     prefix_collection_pairs,
+                                     workers=self.workers,
+                                     batch_size=100000,
+                                     ordered=False,
+                                     batch=True)
+            self.record_count = stats['records.in']
+            self.logger.debug(stats)
+            pairs.seek(0)
+            unique = set(tuple(line.decode('utf-8').rstrip('\n').split('\t', 1)) for line in pairs)
+
+        # Only prefixes missing from the list are looked up, concurrently,
+        # and kept in a cache, so the join itself needs no requests.
+        unknown = set(prefix for prefix, _ in unique if prefix not in namemap)
+        if unknown:
+            cache = crossrefapi.MemberCache(self.config.get('crossref', 'member-cache', fallback=os.path.join(self.BASE, '.crossref', 'members.tsv')),
+                                            ttl=self.config.getint('crossref', 'member-cache-ttl', fallback=2592000))
+            resolved = cache.resolve(crossrefapi.CrossrefClient(), unknown, workers=self.workers)
+            namemap.update((prefix, name) for prefix, name in resolved.items() if name)
+            self.logger.debug("resolved %d of %d unknown prefixes", sum(1 for name in resolved.values() if name), len(unknown))
+
+        result = set((prefix, namemap.get(prefix, "UNDEFINED"), mega_collection) for prefix, mega_collection in unique)
 
         with self.output().open('w') as output:
             self.logger.debug("output at %s", output.name)
@@ -23,8 +23,10 @@
 # @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
 
 import datetime
+import json
 
 import luigi
+from gluish.format import Gzip
 from gluish.intervals import monthly
 from gluish.parameter import ClosestDateParameter
 from gluish.utils import shellout
@@ -50,11 +52,15 @@ class DBLPTask(DefaultTask):
 
 
 class DBLPDownload(DBLPTask):
-    """ Download file. """
+    """ Download file, along with the DTD, which defines the entities used. """
     url = luigi.Parameter(default='http://dblp.uni-trier.de/xml/dblp.xml.gz', significant=False)
+    dtd = luigi.Parameter(default='http://dblp.uni-trier.de/xml/dblp.dtd', significant=False)
     date = ClosestDateParameter(default=datetime.date.today())
 
     def run(self):
+        # The XML references the DTD relative to its own location.
+        output = shellout("curl --fail -L {url} > {output}", url=self.dtd)
+        luigi.LocalTarget(output).move(self.path(filename='dblp.dtd'))
         output = shellout("curl --fail -L {url} | unpigz -c > {output}", url=self.url)
         luigi.LocalTarget(output).move(self.output().path)
 
@@ -62,20 +68,67 @@ class DBLPDownload(DBLPTask):
         return luigi.LocalTarget(path=self.path(ext='xml'))
 
 
-class DBLPIntermediateSchema(DBLPTask):
+def article_to_intermediate_schema(elem):
+    """
+    Convert a DBLP article element into an intermediate schema document, or
+    None, if the article has no title. DBLP has no source id yet, so finc.id
+    and finc.source_id are not set.
+    """
+    def text(e):
+        return ''.join(e.itertext()).strip()
+
+    title = elem.find('title')
+    if title is None or not text(title):
+        return None
+    links = [text(e) for e in elem.findall('ee')] + [text(e) for e in elem.findall('url')]
+    doc = {
+        'finc.format': 'ElectronicArticle',
+        'finc.record_id': elem.get('key'),
+        'ris.type': 'JOUR',
+        'rft.genre': 'article',
+        'rft.atitle': text(title),
+        'rft.jtitle': elem.findtext('journal', default=''),
+        'rft.volume': elem.findtext('volume', default=''),
+        'rft.issue': elem.findtext('number', default=''),
+        'rft.pages': elem.findtext('pages', default=''),
+        'authors': [{
+            'rft.au': text(author)
+        } for author in elem.findall('author')],
+        'url': [link for link in links if link.startswith('http')],
+    }
+    year = elem.findtext('year')
+    if year:
+        doc.update({'rft.date': '%s-01-01' % year, 'x.date': '%s-01-01T00:00:00Z' % year})
+    for link in links:
+        if link.startswith(('https://doi.org/', 'http://doi.org/')):
+            doc['doi'] = link.split('doi.org/', 1)[1]
+            break
+    return doc
+
 
+class DBLPIntermediateSchema(DBLPTask):
+    """
+    Convert DBLP articles to intermediate schema. The XML dump is parsed in
+    chunks by a number of worker processes.
+    """
     date = ClosestDateParameter(default=datetime.date.today())
+    workers = luigi.IntParameter(default=4, significant=False, description='number of parser processes')
 
     def requires(self):
         return DBLPDownload(date=self.date)
 
     def run(self):
-        # https://stackoverflow.com/a/60747245/89391
-        for blob in xmlstream(self.input().path, "article"):
-            print(len(blob))
+        with self.output().open('w') as output:
+            for doc in xmlstream(self.input().path,
+                                 'article',
+                                 output='element',
+                                 func=article_to_intermediate_schema,
+                                 workers=self.workers,
+                                 load_dtd=True):
+                output.write(json.dumps(doc).encode('utf-8') + b'\n')
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(ext='ndj.gz'))
+        return luigi.LocalTarget(path=self.path(ext='ndj.gz'), format=Gzip)
 
 
 class DBLPDOIList(DBLPTask):
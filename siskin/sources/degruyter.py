@@ -42,7 +42,7 @@ from gluish.format import TSV
 from gluish.parameter import ClosestDateParameter
 from gluish.utils import shellout
 from siskin.benchmark import timed
-from siskin.common import Executable, FTPMirror
+from siskin.common import Executable, FTPMirror, IntermediateSchemaProjections
 from siskin.sources.amsl import AMSLFilterConfig
 from siskin.task import DefaultTask
 
@@ -215,6 +215,16 @@ class DegruyterExport(DegruyterTask):
         return luigi.LocalTarget(path=self.path(ext=extensions.get(self.format, 'gz')))
 
 
+class DegruyterProjections(IntermediateSchemaProjections, DegruyterTask):
+    """
+    DOI, ISSN, prefix, collection and format lists in one pass.
+    """
+    date = ClosestDateParameter(default=datetime.date.today())
+
+    def requires(self):
+        return DegruyterIntermediateSchema(date=self.date)
+
+
 class DegruyterISSNList(DegruyterTask):
     """
     List of ISSNs.
@@ -222,18 +232,14 @@ class DegruyterISSNList(DegruyterTask):
     date = ClosestDateParameter(default=datetime.date.today())
 
     def requires(self):
-        return DegruyterIntermediateSchema(date=self.date)
+        return DegruyterProjections(date=self.date)
 
-    @timed
     def run(self):
-        _, stopover = tempfile.mkstemp(prefix='siskin-')
-        shellout("""jq -r '.["rft.issn"][]?' <(unpigz -c {input}) 2> /dev/null >> {output} """, input=self.input().path, output=stopover)
-        shellout("""jq -r '.["rft.eissn"][]?' <(unpigz -c {input}) 2> /dev/null >> {output} """, input=self.input().path, output=stopover)
-        output = shellout("""sort -u {input} > {output} """, input=stopover)
+        output = shellout("cp {input} {output}", input=self.input().get('issn').path)
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(), format=TSV)
+        return luigi.LocalTarget(path=self.path(ext='c.tsv'), format=TSV)
 
 
 class DegruyterDOIList(DegruyterTask):
@@ -243,16 +249,11 @@ class DegruyterDOIList(DegruyterTask):
     date = ClosestDateParameter(default=datetime.date.today())
 
     def requires(self):
-        return {'input': DegruyterIntermediateSchema(date=self.date), 'jq': Executable(name='jq', message='https://github.com/stedolan/jq')}
+        return DegruyterProjections(date=self.date)
 
-    @timed
     def run(self):
-        _, stopover = tempfile.mkstemp(prefix='siskin-')
-        shellout("""jq -r '.doi' <(unpigz -c {input}) | grep -v "null" | grep -o "10.*" 2> /dev/null > {output} """,
-                 input=self.input().get('input').path,
-                 output=stopover)
-        output = shellout("""sort -u {input} > {output} """, input=stopover)
+        output = shellout("cp {input} {output}", input=self.input().get('doi').path)
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(), format=TSV)
+        return luigi.LocalTarget(path=self.path(ext='c.tsv'), format=TSV)
@@ -35,7 +35,6 @@ import itertools
 import json
 import operator
 import os
-import tempfile
 import time
 from builtins import map, range
 
@@ -47,6 +46,7 @@ from gluish.intervals import monthly
 from gluish.parameter import ClosestDateParameter
 from gluish.utils import shellout
 from siskin.benchmark import timed
+from siskin.common import IntermediateSchemaProjections
 from siskin.task import DefaultTask
 from siskin.utils import load_set_from_file, load_set_from_target
 
@@ -196,6 +196,16 @@ class DOAJIntermediateSchema(DOAJTask):
         return luigi.LocalTarget(path=self.path(ext='ldj.gz'))
 
 
+class DOAJProjections(IntermediateSchemaProjections, DOAJTask):
+    """
+    DOI, ISSN, prefix, collection and format lists in one pass.
+    """
+    date = ClosestDateParameter(default=datetime.date.today())
+
+    def requires(self):
+        return DOAJIntermediateSchema(date=self.date)
+
+
 class DOAJISSNList(DOAJTask):
     """
     A list of DOAJ ISSNs.
@@ -203,18 +213,14 @@ class DOAJISSNList(DOAJTask):
     date = ClosestDateParameter(default=datetime.date.today())
 
     def requires(self):
-        return {'input': DOAJIntermediateSchema(date=self.date), 'jq': Executable(name='jq', message='http://git.io/NYpfTw')}
+        return DOAJProjections(date=self.date)
 
-    @timed
     def run(self):
-        _, stopover = tempfile.mkstemp(prefix='siskin-')
-        shellout("""jq -r '.["rft.issn"][]?' <(unpigz -c {input}) >> {output} """, input=self.input().get('input').path, output=stopover)
-        shellout("""jq -r '.["rft.eissn"][]?' <(unpigz -c {input}) >> {output} """, input=self.input().get('input').path, output=stopover)
-        output = shellout("""sort -u {input} > {output} """, input=stopover)
+        output = shellout("cp {input} {output}", input=self.input().get('issn').path)
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(), format=TSV)
+        return luigi.LocalTarget(path=self.path(ext='c.tsv'), format=TSV)
 
 
 class DOAJDOIList(DOAJTask):
@@ -224,19 +230,14 @@ class DOAJDOIList(DOAJTask):
     date = ClosestDateParameter(default=datetime.date.today())
 
     def requires(self):
-        return {
-            'input': DOAJIntermediateSchema(date=self.date),
-            'jq': Executable(name='jq', message='http://git.io/NYpfTw'),
-        }
+        return DOAJProjections(date=self.date)
 
-    @timed
     def run(self):
-        output = shellout("""jq -r '.doi' <(unpigz -c {input}) | grep -v "null" | grep -o "10.*" 2> /dev/null | sort -u > {output} """,
-                          input=self.input().get('input').path)
+        output = shellout("cp {input} {output}", input=self.input().get('doi').path)
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(), format=TSV)
+        return luigi.LocalTarget(path=self.path(ext='c.tsv'), format=TSV)
 
 
 class DOAJDownloadDump(DOAJTask):
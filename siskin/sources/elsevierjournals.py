@@ -39,16 +39,14 @@ backlog-dir = /path/to/dir
 """
 
 import datetime
-import os
 import tempfile
 from builtins import str
 
 import luigi
-from gluish.common import Executable
 from gluish.format import TSV, Gzip
 from gluish.utils import shellout
 from siskin.benchmark import timed
-from siskin.common import FTPMirror
+from siskin.common import FTPMirror, IntermediateSchemaProjections
 from siskin.sources.amsl import AMSLFilterConfig
 from siskin.task import DefaultTask
 from siskin.utils import iterfiles
@@ -187,6 +185,16 @@ class ElsevierJournalsExport(ElsevierJournalsTask):
         return luigi.LocalTarget(path=self.path(ext=extensions.get(self.format, 'gz')))
 
 
+class ElsevierJournalsProjections(IntermediateSchemaProjections, ElsevierJournalsTask):
+    """
+    DOI, ISSN, prefix, collection and format lists in one pass.
+    """
+    date = luigi.DateParameter(default=datetime.date.today())
+
+    def requires(self):
+        return ElsevierJournalsIntermediateSchema(date=self.date)
+
+
 class ElsevierJournalsDOIList(ElsevierJournalsTask):
     """
     A list of Elsevier journals DOIs.
@@ -194,17 +202,10 @@ class ElsevierJournalsDOIList(ElsevierJournalsTask):
     date = luigi.DateParameter(default=datetime.date.today())
 
     def requires(self):
-        return {'input': ElsevierJournalsIntermediateSchema(date=self.date), 'jq': Executable(name='jq', message='https://github.com/stedolan/jq')}
+        return ElsevierJournalsProjections(date=self.date)
 
-    @timed
     def run(self):
-        _, stopover = tempfile.mkstemp(prefix='siskin-')
-        # process substitution sometimes results in a broken pipe, so extract
-        # beforehand
-        output = shellout("unpigz -c {input} > {output}", input=self.input().get('input').path)
-        shellout("""jq -r '.doi?' {input} | grep -o "10.*" 2> /dev/null | LC_ALL=C sort -S50% > {output} """, input=output, output=stopover)
-        os.remove(output)
-        output = shellout("""sort -S50% -u {input} > {output} """, input=stopover)
+        output = shellout("cp {input} {output}", input=self.input().get('doi').path)
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
@@ -213,19 +214,15 @@ class ElsevierJournalsDOIList(ElsevierJournalsTask):
 
 class ElsevierJournalsISSNList(ElsevierJournalsTask):
     """
-    A list of Elsevier journals DOIs.
+    A list of Elsevier journals ISSNs.
     """
     date = luigi.DateParameter(default=datetime.date.today())
 
     def requires(self):
-        return {'input': ElsevierJournalsIntermediateSchema(date=self.date), 'jq': Executable(name='jq', message='https://github.com/stedolan/jq')}
+        return ElsevierJournalsProjections(date=self.date)
 
-    @timed
     def run(self):
-        _, output = tempfile.mkstemp(prefix='siskin-')
-        shellout("""jq -c -r '.["rft.issn"][]?' <(unpigz -c {input}) >> {output} """, input=self.input().get('input').path, output=output)
-        shellout("""jq -c -r '.["rft.eissn"][]?' <(unpigz -c {input}) >> {output} """, input=self.input().get('input').path, output=output)
-        output = shellout("""sort -u {input} > {output} """, input=output)
+        output = shellout("cp {input} {output}", input=self.input().get('issn').path)
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
@@ -33,8 +33,10 @@ ftp-pattern = *
 
 import collections
 import datetime
+import functools
 import itertools
 import json
+import logging
 import os
 import pipes
 import re
@@ -47,12 +49,61 @@ from gluish.format import TSV, Gzip
 from gluish.intervals import weekly
 from gluish.parameter import ClosestDateParameter
 from gluish.utils import shellout
+from siskin import ndjson
 from siskin.benchmark import timed
-from siskin.common import Executable, FTPMirror
+from siskin.common import Executable, FTPMirror, IntermediateSchemaProjections
 from siskin.sources.amsl import AMSLFilterConfig, AMSLService
 from siskin.task import DefaultTask
 from siskin.utils import SetEncoder, load_set_from_file, nwise
 
+logger = logging.getLogger('siskin')
+
+
+def assign_collections(doc, stats, mapping=None, jstor_to_tcid=None, tcid_to_mega_collection=None):
+    """
+    Replace the generic JSTOR collection with collection names and technical
+    collection identifiers, based on the ISSN of a record, refs #11467.
+    """
+    issns, names = set(), set()
+
+    for issn in doc.get('rft.issn', []):
+        issns.add(issn)
+    for issn in doc.get('rft.eissn', []):
+        issns.add(issn)
+
+    for issn in issns:
+        for name in mapping.get(issn, []):
+            names.add(name)
+
+    if len(names) > 0:
+        # Translate JSTOR names to technical collection id.
+        amsl_names = [jstor_to_tcid.get(name) for name in names]
+        # Check validity against AMSL names.
+        clean_names = [name for name in amsl_names if name in tcid_to_mega_collection]
+        clean_names = clean_names + [tcid_to_mega_collection[tcid] for tcid in clean_names]
+
+        # The clean_names list has both TCID and mega_collection.
+        doc['finc.mega_collection'] = clean_names
+
+        if len(doc['finc.mega_collection']) == 0:
+            stats["err.collection.not.in.amsl"] += 1
+    else:
+        # As of 01/2020, there are two rough types of stable
+        # JSTOR URLs, one which has many (or most) OA content
+        # (24695). We check for this pattern to make these
+        # records accessible. And discard the other 13328, e.g.
+        # https://www.jstor.org/stable/10.5250/femigermstud.35.0147.
+        assumed_oa_pattern = r'http[s]?://www.jstor.org/stable/[0-9]+$'
+        if any((re.search(assumed_oa_pattern, url) for url in doc.get('url', []))):
+            # TODO(miku): These names are not official yet.
+            doc['finc.mega_collection'] = ['Open JSTOR Collection', 'sid-55-col-jstoropen']  # Maybe, https://www.jstor.org/stable/26167842.
+            stats["assumed_oa"] += 1
+        else:
+            logger.warning("JSTOR record without issn or issn mapping and likely not open access neither: %s, %s", doc.get("finc.id"),
+                           doc.get('url'))
+            stats["err.name"] += 1
+    return doc
+
 
 class JstorTask(DefaultTask):
     """ Jstor base. """
@@ -487,6 +538,7 @@ class JstorIntermediateSchema(JstorTask):
     """
 
     date = ClosestDateParameter(default=datetime.date.today())
+    workers = luigi.IntParameter(default=4, significant=False, description='number of worker processes')
 
     def requires(self):
         return {
@@ -514,61 +566,15 @@ class JstorIntermediateSchema(JstorTask):
         with self.input().get('mapping').open() as mapfile:
             mapping = json.load(mapfile)
 
-        counter = collections.Counter()
-
-        with self.input().get('file').open() as handle:
-            with self.output().open('w') as output:
-                for i, line in enumerate(handle):
-                    if i % 100000 == 0:
-                        self.logger.debug("[jstor] processed %d lines", i)
-                    doc = json.loads(line)
-                    issns, names = set(), set()
-
-                    for issn in doc.get('rft.issn', []):
-                        issns.add(issn)
-                    for issn in doc.get('rft.eissn', []):
-                        issns.add(issn)
-
-                    for issn in issns:
-                        for name in mapping.get(issn, []):
-                            names.add(name)
-
-                    if len(names) > 0:
-                        # Translate JSTOR names to technical collection id.
-                        amsl_names = [jstor_to_tcid.get(name) for name in names]
-                        # Check validity against AMSL names.
-                        clean_names = [name for name in amsl_names if name in tcid_to_mega_collection]
-                        clean_names = clean_names + [tcid_to_mega_collection[tcid] for tcid in clean_names]
-
-                        # The clean_names list has both TCID and mega_collection.
-                        doc['finc.mega_collection'] = clean_names
-
-                        if len(doc['finc.mega_collection']) == 0:
-                            # self.logger.warn("no collection name given to %s: %s", doc["finc.id"], names)
-                            counter["err.collection.not.in.amsl"] += 1
-                    else:
-                        # As of 01/2020, there are two rough types of stable
-                        # JSTOR URLs, one which has many (or most) OA content
-                        # (24695). We check for this pattern to make these
-                        # records accessible. And discard the other 13328, e.g.
-                        # https://www.jstor.org/stable/10.5250/femigermstud.35.0147.
-                        assumed_oa_pattern = r'http[s]?://www.jstor.org/stable/[0-9]+$'
-                        if any((re.search(assumed_oa_pattern, url) for url in doc.get('url', []))):
-                            # TODO(miku): These names are not official yet.
-                            doc['finc.mega_collection'] = ['Open JSTOR Collection', 'sid-55-col-jstoropen']  # Maybe, https://www.jstor.org/stable/26167842.
-                            counter["assumed_oa"] += 1
-                        else:
-                            self.logger.warn("JSTOR record without issn or issn mapping and likely not open access neither: %s, %s", doc.get("finc.id"),
-                                             doc.get('url'))
-                            counter["err.name"] += 1
-
-                    line = json.dumps(doc)
-                    if isinstance(line, six.string_types):
-                        line = line.encode('utf-8')
-                    output.write(line)
-                    output.write(b"\n")
-
-        self.logger.debug(counter)
+        func = functools.partial(assign_collections,
+                                 mapping=mapping,
+                                 jstor_to_tcid=jstor_to_tcid,
+                                 tcid_to_mega_collection=tcid_to_mega_collection)
+        with self.output().open('w') as output:
+            stats = ndjson.transform(self.input().get('file').path, output, func, workers=self.workers)
+
+        self.record_count = stats['records.in']
+        self.logger.debug(stats)
 
     def output(self):
         return luigi.LocalTarget(path=self.path(ext='ldj.gz'), format=Gzip)
@@ -602,6 +608,16 @@ class JstorExport(JstorTask):
         return luigi.LocalTarget(path=self.path(ext=extensions.get(self.format, 'gz')))
 
 
+class JstorProjections(IntermediateSchemaProjections, JstorTask):
+    """
+    DOI, ISSN, prefix, collection and format lists in one pass.
+    """
+    date = ClosestDateParameter(default=datetime.date.today())
+
+    def requires(self):
+        return JstorIntermediateSchema(date=self.date)
+
+
 class JstorISSNList(JstorTask):
     """
     A list of JSTOR ISSNs.
@@ -609,18 +625,14 @@ class JstorISSNList(JstorTask):
     date = ClosestDateParameter(default=datetime.date.today())
 
     def requires(self):
-        return JstorIntermediateSchema(date=self.date)
+        return JstorProjections(date=self.date)
 
-    @timed
     def run(self):
-        _, stopover = tempfile.mkstemp(prefix='siskin-')
-        shellout("""jq -r '.["rft.issn"][]?' <(unpigz -c {input}) 2> /dev/null >> {output} """, input=self.input().path, output=stopover)
-        shellout("""jq -r '.["rft.eissn"][]?' <(unpigz -c {input}) 2> /dev/null >> {output} """, input=self.input().path, output=stopover)
-        output = shellout("""sort -u {input} > {output} """, input=stopover)
+        output = shellout("cp {input} {output}", input=self.input().get('issn').path)
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(), format=TSV)
+        return luigi.LocalTarget(path=self.path(ext='c.tsv'), format=TSV)
 
 
 class JstorDOIList(JstorTask):
@@ -630,13 +642,11 @@ class JstorDOIList(JstorTask):
     date = ClosestDateParameter(default=datetime.date.today())
 
     def requires(self):
-        return JstorIntermediateSchema(date=self.date)
+        return JstorProjections(date=self.date)
 
-    @timed
     def run(self):
-        output = shellout("""jq -r '.doi' <(unpigz -c {input}) | grep -v null > {output} """, input=self.input().path)
-        output = shellout("""sort -u {input} > {output} """, input=output)
+        output = shellout("cp {input} {output}", input=self.input().get('doi').path)
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(), format=TSV)
+        return luigi.LocalTarget(path=self.path(ext='c.tsv'), format=TSV)
@@ -30,7 +30,6 @@ https://is.gd/8DFvOo (GBV).
 
 import datetime
 import glob
-import json
 import os
 
 import luigi
@@ -38,11 +37,19 @@ from gluish.format import Gzip
 from gluish.intervals import monthly
 from gluish.parameter import ClosestDateParameter
 from gluish.utils import shellout
+from siskin import ndjson
 from siskin.conversions import olc_to_intermediate_schema
 from siskin.task import DefaultTask
 from siskin.utils import sha1obj
 
 
+def convert_record(doc, stats):
+    """
+    Convert a single OLC record, to be used with ndjson.transform.
+    """
+    return olc_to_intermediate_schema(doc)
+
+
 class OLCTask(DefaultTask):
     """
     OLC base task.
@@ -92,20 +99,15 @@ class OLCIntermediateSchema(OLCTask):
     Sample convertion.
     """
     date = ClosestDateParameter(default=datetime.date.today())
+    workers = luigi.IntParameter(default=4, significant=False, description='number of worker processes')
 
     def requires(self):
         return OLCDump(date=self.date)
 
     def run(self):
-        with self.input().open() as file:
-            with self.output().open('w') as output:
-                for i, line in enumerate(file):
-                    if i % 100000 == 0:
-                        self.logger.debug("@{}".format(i))
-                    doc = json.loads(line)
-                    result = olc_to_intermediate_schema(doc)
-                    output.write(bytes(json.dumps(result), encoding="utf-8"))
-                    output.write(b"\n")
+        with self.output().open('w') as output:
+            stats = ndjson.transform(self.input().path, output, convert_record, workers=self.workers)
+        self.record_count = stats['records.in']
 
     def output(self):
         return luigi.LocalTarget(path=self.path(ext='ndj.gz'), format=Gzip)
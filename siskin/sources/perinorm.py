@@ -22,8 +22,9 @@
 #
 # @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
 
+import collections
 import datetime
-import json
+import functools
 import re
 import tarfile
 
@@ -32,10 +33,23 @@ from gluish.format import TSV, Gzip
 from gluish.intervals import monthly
 from gluish.parameter import ClosestDateParameter
 from gluish.utils import shellout
+from siskin import ndjson
 from siskin.common import FTPMirror
 from siskin.task import DefaultTask
 
 
+def attach_institutions(doc, stats, attachments=None):
+    """
+    Set institutions by collection name, attachments maps a collection name to
+    a list of ISIL.
+    """
+    for k, isils in attachments.items():
+        if doc["mega_collection"][0] == k:
+            doc["institution"] = isils
+            stats[k] += 1
+    return doc
+
+
 class PerinormTask(DefaultTask):
     """
     Base task for Perinorm, refs #16140.
@@ -78,6 +92,7 @@ class PerinormExport(PerinormTask):
     """
 
     date = luigi.DateParameter(default=PerinormTask.current["date"])
+    workers = luigi.IntParameter(default=4, significant=False, description="number of worker processes")
 
     def requires(self):
         return PerinormPaths(date=self.date)
@@ -103,17 +118,17 @@ class PerinormExport(PerinormTask):
             "Perinorm (VDI-Richtlinien)": ["DE-Gla1", "DE-Zi4"],
         }
 
+        func = functools.partial(attach_institutions, attachments=attachments)
+        stats = collections.Counter()
         with self.output().open("wb") as output:
             tar = tarfile.open(path, "r:gz")
             for member in tar.getmembers():
                 f = tar.extractfile(member)
-                for line in f:
-                    doc = json.loads(line)
-                    for k, isils in attachments.items():
-                        if doc["mega_collection"][0] == k:
-                            doc["institution"] = isils
-                    output.write(json.dumps(doc).encode("utf-8"))
-                    output.write(b"\n")
+                if f is None:
+                    continue
+                stats.update(ndjson.transform(f, output, func, workers=self.workers))
+        self.record_count = stats["records.in"]
+        self.logger.debug(stats)
 
     def output(self):
         return luigi.LocalTarget(path=self.path(ext="ndj.gz"), format=Gzip)
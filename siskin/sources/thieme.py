@@ -34,7 +34,6 @@ oai = https://example.com/oai/provider
 """
 
 import datetime
-import tempfile
 
 import luigi
 from gluish.common import Executable
@@ -42,6 +41,7 @@ from gluish.format import TSV
 from gluish.intervals import weekly
 from gluish.parameter import ClosestDateParameter
 from gluish.utils import shellout
+from siskin.common import IntermediateSchemaProjections
 from siskin.decorator import deprecated
 from siskin.sources.amsl import AMSLFilterConfig
 from siskin.task import DefaultTask
@@ -129,20 +129,27 @@ class ThiemeExport(ThiemeTask):
         return luigi.LocalTarget(path=self.path(ext='ldj.gz'))
 
 
+class ThiemeProjections(IntermediateSchemaProjections, ThiemeTask):
+    """
+    DOI, ISSN, prefix, collection and format lists in one pass.
+    """
+    date = luigi.DateParameter(default=datetime.date.today())
+
+    def requires(self):
+        return ThiemeIntermediateSchema(date=self.date)
+
+
 class ThiemeISSNList(ThiemeTask):
     """
-    A list of Elsevier journals DOIs.
+    A list of Thieme ISSNs.
     """
     date = luigi.DateParameter(default=datetime.date.today())
 
     def requires(self):
-        return {'input': ThiemeIntermediateSchema(date=self.date), 'jq': Executable(name='jq', message='https://github.com/stedolan/jq')}
+        return ThiemeProjections(date=self.date)
 
     def run(self):
-        _, output = tempfile.mkstemp(prefix='siskin-')
-        shellout("""jq -c -r '.["rft.issn"][]?' <(unpigz -c {input}) >> {output} """, input=self.input().get('input').path, output=output)
-        shellout("""jq -c -r '.["rft.eissn"][]?' <(unpigz -c {input}) >> {output} """, input=self.input().get('input').path, output=output)
-        output = shellout("""sort -u {input} > {output} """, input=output)
+        output = shellout("cp {input} {output}", input=self.input().get('issn').path)
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
@@ -31,6 +31,11 @@ default-sender = my@mail.com
 default-replyto = my@mail.com
 error-email = a@c.com, d@e.com
 home = /path/to/dir
+dedup = DOAJDownloadDump, IEEEBacklogIntermediateSchema
+compression = gzip
+zstd = AIIntermediateSchema, AILicensing
+index = AIExport
+lookup = AILicensing, AIExport
 
 [amsl]
 
@@ -43,15 +48,19 @@ import logging
 import os
 import re
 import socket
+import sqlite3
 import tempfile
 import traceback
+import zlib
 
 import luigi
 from gluish.task import BaseTask
 from gluish.utils import shellout
-from siskin import __version__
+from siskin import __version__, blocks, lookup, metrics
+from siskin.cas import ArtifactStore
 from siskin.configuration import Config
 from siskin.mail import send_mail
+from siskin.seekable import SeekableZstd
 
 config = Config.instance()
 
@@ -67,8 +76,25 @@ class DefaultTask(BaseTask):
 
     A command line parameter named --stamp is used to optionally update
     timestamps in AMSL electronic resource management system.
+
+    If DEDUPLICATE is set or the task is listed in "core.dedup", finished
+    outputs are stored content addressed and identical files are hardlinked,
+    see siskin.cas.
+
+    Tasks using compressed_target write gzip or seekable zstd, depending on
+    COMPRESSION, the "core.zstd" list of tasks or "core.compression".
+
+    If INDEX is set or the task is listed in "core.index", a block index is
+    written next to compressed outputs, see siskin.blocks.
+
+    If the task is listed in "core.lookup", a lookup database for the fields
+    in LOOKUP_FIELDS is written next to its outputs, see siskin.lookup.
     """
     BASE = config.get('core', 'home', fallback=os.path.join(tempfile.gettempdir(), 'siskin-data'))
+    DEDUPLICATE = False
+    COMPRESSION = None
+    INDEX = False
+    LOOKUP_FIELDS = ()
 
     stamp = luigi.BoolParameter(default=False, description="update processing time of source via AMSL API", significant=False)
 
@@ -126,6 +152,105 @@ class DefaultTask(BaseTask):
         except Exception as err:
             self.logger.debug("failed to send error email: %s", err)
 
+    def compression(self):
+        """
+        Return the compression for compressed outputs, "gzip" or "zstd".
+        """
+        if self.COMPRESSION:
+            return self.COMPRESSION
+        families = [v.strip() for v in config.get('core', 'zstd', fallback='').split(',')]
+        if self.task_family in families:
+            return 'zstd'
+        return config.get('core', 'compression', fallback='gzip')
+
+    def compressed_target(self, ext='ldj'):
+        """
+        Return a local target with compressed format, the extension (if any)
+        is suffixed with .gz or .zst.
+        """
+        if self.compression() == 'zstd':
+            suffix, format = 'zst', SeekableZstd
+        else:
+            suffix, format = 'gz', blocks.BlockedGzip
+        return luigi.LocalTarget(path=self.path(ext='%s.%s' % (ext, suffix) if ext else suffix), format=format)
+
+    def compress_command(self):
+        """
+        Return a shell command, that compresses stdin to stdout in the
+        configured format, e.g. "span-tag ... | {compress} > {output}".
+        """
+        if self.compression() == 'zstd':
+            return 'taskzstd'
+        return blocks.compress_command()
+
+    def index_outputs(self):
+        """
+        Write a block index for compressed local file outputs, if enabled
+        for this task. Failures are logged, but do not fail the task.
+        """
+        families = [v.strip() for v in config.get('core', 'index', fallback='').split(',')]
+        if not self.INDEX and self.task_family not in families:
+            return
+        for target in luigi.task.flatten(self.output()):
+            if not isinstance(target, luigi.LocalTarget) or not os.path.isfile(target.path):
+                continue
+            if not blocks.is_indexable(target.path):
+                continue
+            try:
+                index = blocks.build_index(target.path)
+                blocks.write_index(target.path, index)
+            except (IOError, OSError, RuntimeError, zlib.error) as err:
+                self.logger.warn("could not index %s: %s", target.path, err)
+            else:
+                self.logger.debug("wrote index with %d blocks for %s", len(index), target.path)
+
+    def deduplicate(self):
+        """
+        Store local file outputs content addressed, if enabled for this task.
+        Failures are logged, but do not fail the task.
+
+        Deduplicated outputs become hardlinks to the stored object and share
+        its inode, which is made read-only, so the output files lose their
+        write bits as well. Replace such a file (as luigi does when a task is
+        rerun) instead of modifying it in place, otherwise every other output
+        with the same content changes, too.
+        """
+        families = [v.strip() for v in config.get('core', 'dedup', fallback='').split(',')]
+        if not self.DEDUPLICATE and self.task_family not in families:
+            return
+        store = ArtifactStore(root=os.path.join(self.BASE, '.cas'))
+        for target in luigi.task.flatten(self.output()):
+            if not isinstance(target, luigi.LocalTarget) or not os.path.isfile(target.path):
+                continue
+            try:
+                store.add(target.path)
+            except (OSError, RuntimeError) as err:
+                self.logger.warn("could not deduplicate %s: %s", target.path, err)
+
+    def lookup_fields(self):
+        """
+        Return the fields to build a lookup database for.
+        """
+        return self.LOOKUP_FIELDS
+
+    def build_lookups(self):
+        """
+        Write a lookup database for local file outputs, if enabled for this
+        task. Failures are logged, but do not fail the task.
+        """
+        families = [v.strip() for v in config.get('core', 'lookup', fallback='').split(',')]
+        if self.task_family not in families or not self.lookup_fields():
+            return
+        for target in luigi.task.flatten(self.output()):
+            if not isinstance(target, luigi.LocalTarget) or not os.path.isfile(target.path):
+                continue
+            try:
+                count = lookup.build_lookup(target.path, self.lookup_fields())
+            except (IOError, OSError, RuntimeError, sqlite3.Error, zlib.error) as err:
+                self.logger.warn("could not build lookup for %s: %s", target.path, err)
+            else:
+                self.logger.debug("wrote lookup for %d records of %s", count, target.path)
+
     def on_success(self):
         """
         Try to send a datestamp to AMSL, but only if a couple of prerequisites are met:
@@ -145,9 +270,16 @@ class DefaultTask(BaseTask):
 
             OK
 
+        Before that, outputs are deduplicated and indexed, if enabled (see
+        deduplicate, index_outputs and build_lookups).
+
         Note that if a subclass overwrites `on_success` this method is not
         called, so you have to call it manually.
         """
+        self.deduplicate()
+        self.index_outputs()
+        self.build_lookups()
+
         if not self.stamp:
             return
         if not hasattr(self, 'TAG'):
@@ -175,3 +307,26 @@ class DefaultTask(BaseTask):
             return
         else:
             self.logger.debug("successfully stamped: %s", sid)
+
+
+@DefaultTask.event_handler(luigi.Event.START)
+def measure_start(task):
+    """
+    Start measuring a task run, unless its run method is already timed.
+    """
+    if not getattr(task.run, 'timed', False):
+        task._measurement = metrics.Measurement()
+
+
+@DefaultTask.event_handler(luigi.Event.SUCCESS)
+def measure_success(task):
+    measurement = getattr(task, '_measurement', None)
+    if measurement is not None:
+        metrics.record(measurement.finish(task=task))
+
+
+@DefaultTask.event_handler(luigi.Event.FAILURE)
+def measure_failure(task, exception):
+    measurement = getattr(task, '_measurement', None)
+    if measurement is not None:
+        metrics.record(measurement.finish(task=task, status='failure'))
@@ -0,0 +1,69 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test merging partition outputs.
+"""
+
+import gzip
+import subprocess
+
+import pytest
+
+from siskin import seekable
+from siskin.workflows import aipartition
+from siskin.workflows.aipartition import merge_files
+
+
+@pytest.fixture
+def no_shellout(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('unexpected shellout')
+
+    monkeypatch.setattr(aipartition, 'shellout', fail)
+
+
+def test_merge_gzip(tmpdir, no_shellout):
+    paths = []
+    for i in range(3):
+        paths.append(str(tmpdir.join('%d.ldj.gz' % i)))
+        with gzip.open(paths[-1], 'wb') as output:
+            output.write(b'%d\n' % i)
+    merged = str(tmpdir.join('merged.gz'))
+    merge_files(paths, merged)
+    assert gzip.open(merged).read() == b'0\n1\n2\n'
+    assert len(open(merged, 'rb').read()) == sum(len(open(path, 'rb').read()) for path in paths)
+
+
+def test_merge_zstd(tmpdir, no_shellout):
+    paths = []
+    for i in range(3):
+        paths.append(str(tmpdir.join('%d.ldj.zst' % i)))
+        with seekable.SeekableWriter(open(paths[-1], 'wb'), frame_size=4) as output:
+            output.write(b'%d\n%d\n' % (i, i))
+    merged = str(tmpdir.join('merged.zst'))
+    merge_files(paths, merged)
+    reader = seekable.SeekableReader(merged)
+    assert len(reader.frames) == 3
+    assert reader.read() == b'0\n0\n1\n1\n2\n2\n'
+    assert subprocess.check_output(['zstd', '-q', '-d', '-c', merged]) == b'0\n0\n1\n1\n2\n2\n'
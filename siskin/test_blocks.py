@@ -0,0 +1,113 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test block index.
+"""
+
+import gzip
+import pickle
+import shutil
+
+import pytest
+
+from siskin import blocks
+from siskin.ndjson import transform
+from siskin.seekable import SeekableWriter
+
+LINES = [('{"i": %d, "x": "%s"}\n' % (i, 'y' * (i % 50))).encode('utf-8') for i in range(20000)]
+DATA = b''.join(LINES)
+
+
+def write(path, block_size=20000):
+    if path.endswith('.gz'):
+        writer = blocks.BlockedGzipWriter(open(path, 'wb'), block_size=block_size)
+    else:
+        writer = SeekableWriter(open(path, 'wb'), frame_size=block_size)
+    with writer:
+        for line in LINES:
+            writer.write(line)
+    return path
+
+
+@pytest.fixture(params=['gz', 'zst'])
+def compressed(request, tmpdir):
+    if request.param == 'zst' and not shutil.which('zstd'):
+        pytest.skip('zstd executable required')
+    return write(str(tmpdir.join('data.ldj.%s' % request.param)))
+
+
+def test_blocked_gzip_is_gzip(tmpdir):
+    path = write(str(tmpdir.join('data.ldj.gz')))
+    assert gzip.decompress(open(path, 'rb').read()) == DATA
+
+
+def test_index(compressed):
+    index = blocks.build_index(compressed)
+    assert len(index) > 10
+    assert sum(b.records for b in index) == len(LINES)
+    assert index[5].record == sum(b.records for b in index[:5])
+    assert blocks.read_index(compressed) is None
+    assert blocks.load_index(compressed) == index
+    assert blocks.read_index(compressed) == index
+    # An index of a file with different size is ignored.
+    with open(compressed, 'ab') as output:
+        output.write(b'\x00')
+    assert blocks.read_index(compressed) is None
+
+
+def test_lines(compressed):
+    assert list(blocks.lines(compressed, 12345, 12350)) == LINES[12345:12350]
+    assert list(blocks.lines(compressed, 19998)) == LINES[19998:]
+    assert list(blocks.lines(compressed, 0, 3)) == LINES[:3]
+    assert list(blocks.lines(compressed, 30000)) == []
+
+
+def test_split(compressed):
+    parts = blocks.split(compressed, 4)
+    assert len(parts) == 4
+    assert [line for part in parts for line in part] == LINES
+    assert parts[1].record == parts[0].records
+    part = pickle.loads(pickle.dumps(parts[2]))
+    assert list(part) == list(parts[2])
+    assert len(blocks.split(compressed, 1000)) == len(blocks.load_index(compressed))
+
+
+def test_split_transform(compressed, tmpdir):
+    part = blocks.split(compressed, 3)[1]
+    output = str(tmpdir.join('out.ldj'))
+    stats = transform(part, output, lambda doc, stats: doc['i'], workers=0)
+    assert stats['records.in'] == part.records
+    assert int(open(output).readline()) == part.record
+
+
+def test_single_member_and_unterminated(tmpdir):
+    path = str(tmpdir.join('single.ldj.gz'))
+    with open(path, 'wb') as output:
+        output.write(gzip.compress(DATA))
+        output.write(gzip.compress(b'{"a": 1}\n{"b"'))
+        output.write(gzip.compress(b': 2}'))
+    index = blocks.build_index(path)
+    assert [b.records for b in index] == [20000, 2]
+    assert list(blocks.lines(path, 20001)) == [b'{"b": 2}']
+    assert len(blocks.split(path, 4)) == 2
@@ -0,0 +1,63 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2015 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test static task registry.
+"""
+
+import json
+import os
+import tempfile
+
+from siskin.cacheutils import get_task_registry, resolve_tasks, scan_classes
+
+
+def test_scan_classes():
+    with tempfile.NamedTemporaryFile('w', suffix='.py', delete=False) as handle:
+        handle.write("import luigi\n\nclass A(luigi.Task):\n    pass\n\nclass B(A, object):\n    pass\n\ndef f():\n    class C(A):\n        pass\n")
+    try:
+        assert scan_classes(handle.name) == [['A', ['luigi.Task']], ['B', ['A', 'object']]]
+    finally:
+        os.remove(handle.name)
+
+
+def test_resolve_tasks():
+    files = {
+        'm1': {'classes': [['Base', ['luigi.Task']], ['Other', ['object']]]},
+        'm2': {'classes': [['Derived', ['Base']], ['Deeper', ['Derived']], ['helper', ['Base']]]},
+    }
+    assert resolve_tasks(files) == {'Base': 'm1', 'Derived': 'm2', 'Deeper': 'm2'}
+
+
+def test_get_task_registry():
+    path = os.path.join(tempfile.mkdtemp(), 'registry.json')
+    registry = get_task_registry(path=path)
+    assert registry['CrossrefHarvest'] == 'siskin.sources.crossref'
+    assert registry['AIExport'] == 'siskin.workflows.ai'
+    assert registry['FTPMirror'] == 'siskin.common'
+    assert 'Config' not in registry
+
+    with open(path) as handle:
+        cached = json.load(handle)
+    assert cached['tasks'] == registry
+    assert get_task_registry(path=path) == registry
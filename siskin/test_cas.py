@@ -0,0 +1,103 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test content addressed storage.
+"""
+
+import os
+import stat
+
+from siskin.cas import ArtifactStore, ResultCache, fingerprint
+from siskin.utils import compare_files
+
+
+def write(path, data):
+    with open(path, 'wb') as output:
+        output.write(data)
+    return path
+
+
+def test_compare_files(tmpdir):
+    a = write(os.path.join(str(tmpdir), 'a'), b'\x00\xff' * 1000)
+    b = write(os.path.join(str(tmpdir), 'b'), b'\x00\xff' * 1000)
+    c = write(os.path.join(str(tmpdir), 'c'), b'\x00\xff' * 999 + b'\x00\xfe')
+    d = write(os.path.join(str(tmpdir), 'd'), b'\x00')
+    assert compare_files(a, a)
+    assert compare_files(a, b)
+    assert not compare_files(a, c)
+    assert not compare_files(a, d)
+    assert compare_files(a, c, blocksize=1) is False
+
+
+def test_artifact_store(tmpdir):
+    store = ArtifactStore(root=os.path.join(str(tmpdir), '.cas'))
+    a = write(os.path.join(str(tmpdir), 'date-2021-01-04.tsv'), b'same')
+    b = write(os.path.join(str(tmpdir), 'date-2021-01-11.tsv'), b'same')
+    c = write(os.path.join(str(tmpdir), 'other.tsv'), b'other')
+
+    assert store.add(a) == store.add(b)
+    assert store.add(a) == store.add(b)
+    store.add(c)
+    assert os.path.samefile(a, b)
+    assert not os.path.samefile(a, c)
+    with open(b, 'rb') as handle:
+        assert handle.read() == b'same'
+
+    stats = store.report()
+    assert stats['objects'] == 2
+    assert stats['links'] == 3
+    assert stats['saved'] == 4
+    assert stats['orphans'] == 0
+    assert store.gc() == []
+    assert not os.stat(b).st_mode & stat.S_IWUSR
+
+    os.remove(a)
+    os.remove(b)
+    assert store.report()['orphans'] == 1
+    assert len(store.gc(dry_run=True)) == 1
+    assert len(store.gc()) == 1
+    assert store.report()['objects'] == 1
+
+
+def test_result_cache(tmpdir):
+    cache = ResultCache(root=os.path.join(str(tmpdir), 'results'))
+    a = write(os.path.join(str(tmpdir), 'input-1'), b'input')
+    b = write(os.path.join(str(tmpdir), 'input-2'), b'input')
+    key = fingerprint([a], command='span-tag')
+    assert key == fingerprint([b], command='span-tag')
+    assert key != fingerprint([b], command='span-tag -D')
+    assert key != fingerprint([b, b], command='span-tag')
+
+    output = os.path.join(str(tmpdir), 'output-1')
+    assert not cache.get(key, output)
+    cache.put(key, write(output, b'result'))
+    reused = os.path.join(str(tmpdir), 'output-2')
+    assert cache.get(key, reused)
+    assert os.path.samefile(output, reused)
+
+    assert cache.gc() == []
+    os.remove(output)
+    os.remove(reused)
+    assert len(cache.gc()) == 1
+    assert not cache.get(key, reused)
@@ -0,0 +1,69 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test common tasks.
+"""
+
+import gzip
+import json
+
+import luigi
+from siskin.common import IntermediateSchemaProjections
+from siskin.task import DefaultTask
+
+
+class Upstream(luigi.ExternalTask):
+    path = luigi.Parameter()
+
+    def output(self):
+        return luigi.LocalTarget(path=self.path)
+
+
+def test_intermediate_schema_projections(tmpdir):
+    docs = [
+        {'doi': 'https://doi.org/10.1/b', 'rft.issn': ['1234-5678'], 'finc.mega_collection': ['A'], 'finc.source_id': '1', 'finc.format': 'Article'},
+        {'doi': '10.1/a', 'rft.eissn': ['1234-5678', '2345-6789'], 'finc.mega_collection': ['A', 'B'], 'finc.source_id': '1', 'finc.format': 'Article'},
+        {'doi': '10.2/c', 'finc.source_id': '1', 'finc.format': 'Book'},
+        {'finc.source_id': '1', 'finc.format': 'Book'},
+    ]
+    path = str(tmpdir.join('is.ldj.gz'))
+    with gzip.open(path, 'wt') as handle:
+        for doc in docs:
+            handle.write(json.dumps(doc) + '\n')
+
+    class Projections(IntermediateSchemaProjections, DefaultTask):
+        BASE = str(tmpdir)
+        TAG = 'test'
+
+        def requires(self):
+            return Upstream(path=path)
+
+    task = Projections(workers=0)
+    assert luigi.build([task], local_scheduler=True)
+    contents = {name: open(target.path).read().splitlines() for name, target in task.output().items()}
+    assert contents['doi'] == ['10.1/a', '10.1/b', '10.2/c']
+    assert contents['issn'] == ['1234-5678', '2345-6789']
+    assert contents['prefix'] == ['10.1\t2', '10.2\t1']
+    assert contents['collection'] == ['A\t2', 'B\t1']
+    assert contents['format'] == ['1\tArticle\t2', '1\tBook\t2']
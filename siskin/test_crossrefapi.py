@@ -0,0 +1,257 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test crossref API client and concurrent harvesting against a fake API.
+"""
+
+import datetime
+import gzip
+import http.server
+import io
+import json
+import re
+import threading
+import urllib.parse
+
+import pytest
+
+from siskin.crossrefapi import (CrossrefClient, MemberCache, Window, date_filter, harvest, harvest_window, plan_windows, split_response)
+
+START = datetime.date(2021, 1, 1)
+
+# Ten works per day in January, except 200 on January 20th.
+WORKS = [{'DOI': '10.1/%d-%d' % (day, i), 'deposited': {'date-time': '%sT00:00:%02dZ' % (START + datetime.timedelta(days=day), i % 60)}}
+         for day in range(31) for i in range(200 if day == 19 else 10)]
+
+
+@pytest.fixture
+def api():
+    """
+    A fake /works endpoint, supporting deposit date filters, rows and
+    cursors, sorted by deposit date. The very first request fails with HTTP
+    500. Cursors issued before state["expired"] is set fail with HTTP 400.
+    """
+    state = {'requests': [], 'expired': None}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            state['requests'].append(self.path)
+            if len(state['requests']) == 1:
+                self.send_response(500)
+                self.end_headers()
+                return
+            params = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+            begin, end = re.match(r'from-deposit-date:([0-9-]+),until-deposit-date:([0-9-]+)', params['filter']).groups()
+            works = [w for w in WORKS if begin <= w['deposited']['date-time'][:10] <= end]
+            cursor = params.get('cursor', '*')
+            if cursor != '*' and state['expired'] and not cursor.startswith(state['expired']):
+                self.send_response(400)
+                self.end_headers()
+                return
+            offset = 0 if cursor == '*' else int(cursor.split(':')[-1])
+            rows = int(params.get('rows', 20))
+            message = {'total-results': len(works), 'items': works[offset:offset + rows], 'next-cursor': '%s:%d' % (state['expired'] or '', offset + rows)}
+            body = json.dumps({'status': 'ok', 'message': message}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('X-Rate-Limit-Limit', '500')
+            self.send_header('X-Rate-Limit-Interval', '1s')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%s' % server.server_port, state
+    server.shutdown()
+
+
+def client_for(url, rate=1000):
+    return CrossrefClient(api_url=url, mailto='test@example.com', rate=rate, max_tries=3)
+
+
+def items(data):
+    return [item['DOI'] for line in gzip.decompress(data).splitlines() for item in json.loads(line)['message']['items']]
+
+
+def test_client(api):
+    url, state = api
+    client = client_for(url)
+    assert client.count(date_filter(START, START)) == 10
+    assert 'mailto=test%40example.com' in state['requests'][-1]
+    assert len(state['requests']) == 2
+    assert client.bucket.rate == 500
+
+
+def test_plan_windows(api):
+    url, _ = api
+    windows = plan_windows(client_for(url), START, datetime.date(2021, 1, 31), max_records=100)
+    assert sum(w.count for w in windows) == len(WORKS)
+    assert windows[0].begin == START and windows[-1].end == datetime.date(2021, 1, 31)
+    for a, b in zip(windows, windows[1:]):
+        assert a.end + datetime.timedelta(days=1) == b.begin
+    assert Window(datetime.date(2021, 1, 20), datetime.date(2021, 1, 20), 200) in windows
+    assert all(w.count <= 100 for w in windows if w.begin != w.end)
+
+
+def test_harvest_window(api, tmpdir):
+    url, _ = api
+    path = str(tmpdir.join('window.gz'))
+    stats = harvest_window(client_for(url), Window(START, START + datetime.timedelta(days=2), 30), path, rows=7)
+    assert stats == {'pages': 5, 'items': 30}
+    with open(path, 'rb') as handle:
+        assert items(handle.read()) == [w['DOI'] for w in WORKS[:30]]
+    assert json.load(open(path + '.checkpoint'))['done']
+    # Finished windows are not harvested again.
+    assert harvest_window(None, Window(START, START + datetime.timedelta(days=2), 30), path, rows=7) == stats
+
+
+class Failing(CrossrefClient):
+    """
+    A client, that fails after a number of requests.
+    """
+    def __init__(self, url, after):
+        super(Failing, self).__init__(api_url=url, rate=1000, max_tries=3)
+        self.after = after
+
+    def get(self, path, params=None):
+        self.after -= 1
+        if self.after < 0:
+            raise RuntimeError('connection lost')
+        return super(Failing, self).get(path, params)
+
+
+def test_harvest_window_resume(api, tmpdir):
+    url, state = api
+    client = client_for(url)
+    window = Window(START, datetime.date(2021, 1, 5), 50)
+    path = str(tmpdir.join('window.gz'))
+    with pytest.raises(RuntimeError):
+        harvest_window(Failing(url, 4), window, path, rows=6)
+    checkpoint = json.load(open(path + '.checkpoint'))
+    assert checkpoint['pages'] == 4 and checkpoint['items'] == 24
+    # Simulate a partially written page after the checkpoint.
+    with open(path, 'ab') as output:
+        output.write(b'\x1f\x8b\x08garbage')
+
+    requests = len(state['requests'])
+    stats = harvest_window(client, window, path, rows=6)
+    assert stats == {'pages': 9, 'items': 50}
+    assert len(state['requests']) - requests == 6
+    with open(path, 'rb') as handle:
+        assert items(handle.read()) == [w['DOI'] for w in WORKS[:50]]
+
+
+def test_harvest_window_expired_cursor(api, tmpdir):
+    url, state = api
+    client = client_for(url)
+    window = Window(START, datetime.date(2021, 1, 5), 50)
+    path = str(tmpdir.join('window.gz'))
+    with pytest.raises(RuntimeError):
+        harvest_window(Failing(url, 3), window, path, rows=4)
+    assert json.load(open(path + '.checkpoint'))['last'] == '2021-01-02'
+    state['expired'] = 'new'
+    harvest_window(client, window, path, rows=4)
+    with open(path, 'rb') as handle:
+        harvested = items(handle.read())
+    # Items of January 2nd are harvested twice.
+    assert set(harvested) == set(w['DOI'] for w in WORKS[:50])
+    assert len(harvested) == 50 + 2
+
+
+def test_harvest(api, tmpdir):
+    url, _ = api
+    path = str(tmpdir.join('harvest.gz'))
+    with open(path, 'wb') as output:
+        stats = harvest(client_for(url), START, datetime.date(2021, 1, 31), output, workers=4, rows=50, max_records=60)
+    assert stats['items'] == len(WORKS)
+    assert stats['windows'] > 4
+    with open(path, 'rb') as handle:
+        assert items(handle.read()) == [w['DOI'] for w in WORKS]
+
+
+def test_harvest_resume(api, tmpdir):
+    url, _ = api
+    client = client_for(url)
+    directory = str(tmpdir.join('harvest'))
+    with pytest.raises(RuntimeError):
+        harvest(Failing(url, 20), START, datetime.date(2021, 1, 31), io.BytesIO(), workers=2, rows=50, max_records=60, directory=directory)
+    output = io.BytesIO()
+    stats = harvest(client, START, datetime.date(2021, 1, 31), output, workers=2, rows=50, max_records=60, directory=directory)
+    assert stats['items'] == len(WORKS)
+    assert items(output.getvalue()) == [w['DOI'] for w in WORKS]
+
+
+def test_split_response():
+    body = b'{"status": "ok", "message": {"total-results": 3, "items": [{"DOI": "a"}, {"DOI": "b",\n "x": [1, {"y": "]}"}]}\n, {"DOI":"c"}], "next-cursor": "X"}}'
+    envelope = {}
+    assert [json.loads(item)['DOI'] for item in split_response(body, envelope)] == ['a', 'b', 'c']
+    assert envelope == {'status': 'ok', 'message': {'total-results': 3, 'items': 3, 'next-cursor': 'X'}}
+    envelope = {}
+    assert list(split_response('{"message": {"items": []}}', envelope)) == []
+    assert envelope == {'message': {'items': 0}}
+    with pytest.raises(ValueError):
+        list(split_response(b'{"message": {"items": [{"DOI": "a"} {"DOI": "b"}]}}', {}))
+
+
+def test_harvest_split(api, tmpdir):
+    url, _ = api
+    client = client_for(url)
+    directory = str(tmpdir.join('harvest'))
+    with pytest.raises(RuntimeError):
+        harvest(Failing(url, 12), START, datetime.date(2021, 1, 31), io.BytesIO(), workers=2, rows=50, max_records=60, directory=directory,
+                envelopes=io.BytesIO())
+    output, envelopes = io.BytesIO(), io.BytesIO()
+    stats = harvest(client, START, datetime.date(2021, 1, 31), output, workers=2, rows=50, max_records=60, directory=directory, envelopes=envelopes)
+    assert stats['items'] == len(WORKS)
+    assert [json.loads(line)['DOI'] for line in gzip.decompress(output.getvalue()).splitlines()] == [w['DOI'] for w in WORKS]
+    pages = [json.loads(line) for line in envelopes.getvalue().splitlines()]
+    assert len(pages) == stats['pages']
+    assert sum(page['message']['items'] for page in pages) == len(WORKS)
+    assert pages[0]['cursor'] == '*' and 'next-cursor' in pages[0]['message']
+
+
+def test_member_cache(tmpdir):
+    requested = []
+
+    class Client(object):
+        def get(self, path, params=None):
+            requested.append(path)
+            if path.endswith('/10.9'):
+                raise ValueError('404 on %s' % path)
+            return json.dumps({'message': {'primary-name': 'Member %s' % path.split('/')[-1]}}).encode('utf-8')
+
+    path = str(tmpdir.join('cache', 'members.tsv'))
+    cache = MemberCache(path)
+    assert cache.resolve(Client(), ['10.1', '10.2', '10.9', '10.1']) == {'10.1': 'Member 10.1', '10.2': 'Member 10.2', '10.9': None}
+    assert len(requested) == 3
+    # Unknown prefixes are cached, too.
+    assert MemberCache(path).resolve(Client(), ['10.1', '10.9']) == {'10.1': 'Member 10.1', '10.9': None}
+    assert len(requested) == 3
+    # Stale entries are looked up again.
+    assert MemberCache(path, ttl=-1).resolve(Client(), ['10.2', '10.3']) == {'10.2': 'Member 10.2', '10.3': 'Member 10.3'}
+    assert sorted(requested[3:]) == ['/members/10.2', '/members/10.3']
@@ -0,0 +1,85 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703,W0621
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test task query daemon.
+"""
+
+import os
+import tempfile
+import threading
+
+import pytest
+
+from siskin import daemon
+
+
+@pytest.fixture
+def server():
+    path = os.path.join(tempfile.mkdtemp(), 'siskin.sock')
+    srv = daemon.Server(path)
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+    thread.join()
+
+
+def test_query_in_process():
+    path = os.path.join(tempfile.mkdtemp(), 'missing.sock')
+    assert 'AMSLService' in daemon.query('names', path=path)
+    assert daemon.query('output', ['AMSLService'], path=path).endswith('.json.gz')
+    with pytest.raises(RuntimeError):
+        daemon.query('output', ['NoSuchTask'], path=path)
+
+
+def test_query_daemon(server):
+    assert daemon.send('ping', path=server.path)['result'] == os.getpid()
+    output = daemon.query('output', ['AMSLService'], path=server.path)
+    assert daemon.query('dir', ['AMSLService'], path=server.path) == os.path.dirname(output)
+    assert daemon.query('status', ['AMSLService'], path=server.path) == {'done': os.path.exists(output), 'output': output}
+    assert 'AMSLService' in daemon.query('deps', ['AMSLService'], path=server.path)
+    assert daemon.send('output', ['NoSuchTask'], path=server.path)['error']
+    with pytest.raises(RuntimeError):
+        daemon.query('output', ['NoSuchTask'], path=server.path)
+
+
+def test_untrusted_socket(server):
+    os.chmod(server.path, 0o666)
+    with pytest.raises(OSError):
+        daemon.send('ping', path=server.path)
+    # Queries are answered in process.
+    assert daemon.query('output', ['AMSLService'], path=server.path).endswith('.json.gz')
+    with pytest.raises(RuntimeError):
+        daemon.serve(path=server.path)
+
+
+def test_private_dir(monkeypatch, tmpdir):
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    monkeypatch.setattr(tempfile, 'gettempdir', lambda: str(tmpdir))
+    directory = daemon.private_dir()
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+    os.chmod(directory, 0o755)
+    with pytest.raises(RuntimeError):
+        daemon.private_dir()
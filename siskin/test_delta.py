@@ -0,0 +1,61 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test comparing files by id.
+"""
+
+import gzip
+import io
+import json
+
+from siskin.delta import diff
+
+
+def write(path, docs):
+    with gzip.open(str(path), 'wb') as output:
+        for doc in docs:
+            output.write(json.dumps(doc).encode('utf-8') + b'\n')
+    return str(path)
+
+
+def test_diff(tmpdir):
+    old = [{'id': 'ai-%d' % i, 'title': 't%d' % i} for i in range(1000)]
+    new = [dict(doc) for doc in old if doc['id'] not in ('ai-5', 'ai-50')]
+    new[10]['title'] = 'changed'
+    new[900]['title'] = 'changed'
+    changed = [new[10]['id'], new[900]['id']]
+    new.append({'id': 'ai-5a', 'title': 'added'})
+    new.insert(0, {'id': 'ai-0000', 'title': 'added'})
+    upserts, deletes = io.BytesIO(), io.BytesIO()
+    stats = diff(write(tmpdir.join('old.gz'), old), write(tmpdir.join('new.gz'), new), upserts, deletes, directory=str(tmpdir))
+    assert stats['records.old'] == 1000 and stats['records.new'] == 1000
+    assert stats['upserts'] == 4 and stats['upserts.new'] == 2 and stats['upserts.changed'] == 2
+    assert stats['deletes'] == 2 and stats['unchanged'] == 996
+    # Upserts are written in file order.
+    assert [json.loads(line)['id'] for line in upserts.getvalue().splitlines()] == ['ai-0000'] + changed + ['ai-5a']
+    assert deletes.getvalue() == b'ai-5\nai-50\n'
+    # Identical files have no differences.
+    upserts, deletes = io.BytesIO(), io.BytesIO()
+    stats = diff(str(tmpdir.join('new.gz')), str(tmpdir.join('new.gz')), upserts, deletes)
+    assert stats['unchanged'] == 1000 and not upserts.getvalue() and not deletes.getvalue()
@@ -0,0 +1,98 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test facet checks against a stub solr.
+"""
+
+import http.server
+import json
+import threading
+import urllib.parse
+
+import pytest
+
+from siskin.facetqa import FacetQA
+
+AUTHORS = ['Author %04d' % i for i in range(250)] + ['x' * 80]
+YEARS = ['1999', '2020', '1004', 'n.d.']
+
+
+@pytest.fixture
+def solr():
+    """
+    A stub solr core with facets for a single source, reporting index
+    generation 7.
+    """
+    requested = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            params = dict(urllib.parse.parse_qsl(url.query))
+            requested.append(url.path)
+            if url.path.endswith('/replication'):
+                body = {'indexversion': 123, 'generation': 7}
+            else:
+                values = {'author_facet': AUTHORS, 'publishDateSort': YEARS}.get(params['facet.field'], [])
+                if params['q'] != 'source_id:48':
+                    values = []
+                offset, limit = int(params['facet.offset']), int(params['facet.limit'])
+                flat = []
+                for value in sorted(values)[offset:offset + limit]:
+                    flat.extend([value, 1])
+                body = {'facet_counts': {'facet_fields': {params['facet.field']: flat}}}
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%s/solr/biblio' % server.server_port, requested
+    server.shutdown()
+
+
+def test_facetqa(solr, tmpdir):
+    url, requested = solr
+    qa = FacetQA(url, workers=3, page_size=100, cache_dir=str(tmpdir))
+    assert qa.generation == '7'
+    report = list(qa.run(['48', '49'], ['author_facet', 'publishDateSort', 'format']))
+    findings = sorted((e['field'], e['value']) for e in report if e['type'] == 'finding')
+    assert findings == [('author_facet', 'x' * 80), ('publishDateSort', '1004'), ('publishDateSort', 'n.d.')]
+    facets = dict(((e['source_id'], e['field']), e) for e in report if e['type'] == 'facet')
+    assert len(facets) == 6
+    assert facets[('48', 'author_facet')]['values'] == 251 and facets[('48', 'author_facet')]['pages'] == 3
+    assert report[-1]['type'] == 'summary' and report[-1]['findings'] == 3
+    assert report[-1]['requests'] == 8 and report[-1]['requests.cached'] == 0
+
+    # Same generation, all responses are cached.
+    del requested[:]
+    report = list(FacetQA(url, workers=3, page_size=100, cache_dir=str(tmpdir)).run(['48', '49'], ['author_facet', 'publishDateSort', 'format']))
+    assert report[-1]['requests'] == 0 and report[-1]['requests.cached'] == 8
+    assert all(path.endswith('/replication') for path in requested)
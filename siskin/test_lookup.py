@@ -0,0 +1,74 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test key lookup.
+"""
+
+import json
+
+import pytest
+
+from siskin import blocks
+from siskin.lookup import build_lookup, has_lookup, lookup
+
+DOCS = [{
+    'finc.id': 'ai-49-%d' % i,
+    'finc.record_id': 'r%d' % i,
+    'doi': '10.1/%d' % (i // 2),
+    'x.labels': ['DE-15'] if i % 3 == 0 else [],
+} for i in range(5000)]
+
+
+@pytest.fixture(params=['ldj', 'ldj.gz'])
+def path(request, tmpdir):
+    path = str(tmpdir.join('data.%s' % request.param))
+    lines = [json.dumps(doc).encode('utf-8') + b'\n' for doc in DOCS]
+    lines.insert(100, b'not json\n')
+    if path.endswith('.gz'):
+        with blocks.BlockedGzipWriter(open(path, 'wb'), block_size=10000) as writer:
+            writer.write(b''.join(lines))
+    else:
+        with open(path, 'wb') as output:
+            output.write(b''.join(lines))
+    return path
+
+
+def test_lookup(path):
+    assert not has_lookup(path)
+    with pytest.raises(RuntimeError):
+        lookup(path, 'ai-49-1')
+    assert build_lookup(path, ['finc.id', 'doi', 'finc.record_id', 'x.labels']) == 5001
+    assert has_lookup(path)
+
+    result = lookup(path, 'ai-49-4321')
+    assert [(field, json.loads(record)) for field, record in result] == [('finc.id', DOCS[4321])]
+    assert [json.loads(r)['finc.id'] for _, r in lookup(path, '10.1/2000')] == ['ai-49-4000', 'ai-49-4001']
+    assert lookup(path, 'r17', fields=['finc.record_id'])[0][1].endswith(b'\n')
+    assert lookup(path, 'r17', fields=['doi']) == []
+    assert len(lookup(path, 'DE-15')) == 1667
+    assert lookup(path, 'missing') == []
+
+    with open(path, 'ab') as output:
+        output.write(b'\n')
+    assert not has_lookup(path)
@@ -0,0 +1,71 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test task metrics.
+"""
+
+import os
+
+import luigi
+
+from siskin import metrics
+
+
+class Sample(luigi.Task):
+    n = luigi.IntParameter()
+    verbose = luigi.BoolParameter(significant=False)
+
+    def output(self):
+        return luigi.LocalTarget(path=__file__)
+
+
+def test_percentile():
+    assert metrics.percentile([], 50) is None
+    assert metrics.percentile([3, 1, 2], 50) == 2
+    assert metrics.percentile(list(range(1, 101)), 90) == 90
+    assert metrics.percentile([1, 2], 100) == 2
+
+
+def test_record_load(tmpdir):
+    path = os.path.join(str(tmpdir), 'sub', 'metrics.jsonl')
+    entry = metrics.Measurement().finish(task=Sample(n=1))
+    assert entry['task'] == 'Sample'
+    assert entry['params'] == {'n': '1'}
+    assert entry['output_bytes'] == os.path.getsize(__file__)
+    assert entry['process_maxrss'] > 0 and 'maxrss' not in entry
+    metrics.record(entry, path=path)
+    metrics.record(metrics.Measurement().finish(), path=path)
+    assert len(metrics.load(path=path)) == 2
+    assert metrics.load(path=path, task='Sample') == [entry]
+
+
+def test_summarize():
+    entries = [{'task': 'A', 'time': i, 'wall': 10.0 if i < 5 else 20.0} for i in range(8)]
+    entries.append({'task': 'A', 'time': 9, 'wall': 100.0, 'status': 'failure'})
+    summary = metrics.summarize(entries)
+    assert len(summary) == 1
+    assert summary[0]['runs'] == 8
+    assert summary[0]['ratio'] == 2.0
+    assert summary[0]['regressed']
+    assert not metrics.summarize(entries, threshold=3)[0]['regressed']
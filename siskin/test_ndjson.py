@@ -0,0 +1,78 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test parallel NDJSON processing.
+"""
+
+import gzip
+import io
+import json
+
+from siskin.ndjson import transform
+
+
+def label(doc, stats):
+    if doc['id'] % 3 == 0:
+        stats['skipped'] += 1
+        return None
+    doc['label'] = 'x'
+    return doc
+
+
+def ids(docs, stats):
+    return [str(doc['id']) for doc in docs]
+
+
+def lines(n):
+    return [json.dumps({'id': i}).encode('utf-8') + b'\n' for i in range(n)]
+
+
+def test_transform_in_process():
+    output = io.BytesIO()
+    stats = transform(lines(10), output, label, workers=0, batch_size=3)
+    docs = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [doc['id'] for doc in docs] == [1, 2, 4, 5, 7, 8]
+    assert all(doc['label'] == 'x' for doc in docs)
+    assert stats == {'records.in': 10, 'records.out': 6, 'skipped': 4}
+
+
+def test_transform_ordered_workers(tmpdir):
+    path = str(tmpdir.join('input.ndj.gz'))
+    with gzip.open(path, 'wb') as handle:
+        handle.writelines(lines(1000))
+    target = str(tmpdir.join('output.ndj.gz'))
+    stats = transform(path, target, label, workers=2, batch_size=7)
+    with gzip.open(target) as handle:
+        result = [json.loads(line)['id'] for line in handle]
+    assert result == [i for i in range(1000) if i % 3]
+    assert stats['records.in'] == 1000
+    assert stats['skipped'] == 334
+
+
+def test_transform_unordered_batch():
+    output = io.BytesIO()
+    stats = transform(lines(100) + [b'\n'], output, ids, workers=2, batch_size=9, ordered=False, batch=True)
+    assert sorted(int(v) for v in output.getvalue().split()) == list(range(100))
+    assert stats['records.in'] == 100
+    assert stats['records.out'] == 100
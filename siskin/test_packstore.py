@@ -0,0 +1,87 @@
+# pylint: disable=C0111,C0301
+
+import os
+import time
+
+from siskin.packstore import PackStore
+
+
+def test_pack_store_put_get(tmpdir):
+    store = PackStore(str(tmpdir))
+    assert store.get("a") is None
+    assert "a" not in store
+    store.put("a", b"hello")
+    store.put("b", b"world")
+    assert store.get("a") == b"hello"
+    assert store.get("b") == b"world"
+    assert "a" in store
+    assert len(store) == 2
+    assert store.size() == 10
+    store.put("a", b"hi")
+    assert store.get("a") == b"hi"
+    store.remove("a")
+    assert store.get("a") is None
+    assert len(store) == 1
+
+
+def test_pack_store_segments(tmpdir):
+    store = PackStore(str(tmpdir), segment_size=8)
+    for i in range(5):
+        store.put("k%d" % i, b"x" * 8)
+    segments = [name for name in os.listdir(str(tmpdir)) if name.endswith(".pack")]
+    assert len(segments) == 5
+    for i in range(4):
+        store.remove("k%d" % i)
+    store.compact()
+    segments = [name for name in os.listdir(str(tmpdir)) if name.endswith(".pack")]
+    assert len(segments) == 1
+    assert store.get("k4") == b"x" * 8
+
+
+def test_pack_store_lru_eviction(tmpdir):
+    store = PackStore(str(tmpdir), max_size=100, segment_size=30)
+    for i in range(5):
+        store.put("k%d" % i, b"x" * 20)
+    assert store.get("k0") is not None
+    store.put("k5", b"x" * 20)
+    assert store.size() <= 100
+    assert store.get("k0") is not None
+    assert store.get("k1") is None
+
+
+def test_pack_store_ttl(tmpdir):
+    store = PackStore(str(tmpdir), ttl=60)
+    store.put("a", b"hello")
+    assert "a" in store
+    store.conn.execute("UPDATE entries SET created = ?", (time.time() - 120, ))
+    assert "a" not in store
+    assert store.get("a") is None
+    store.evict()
+    assert len(store) == 0
+
+
+def test_pack_store_ttl_without_max_size(tmpdir):
+    store = PackStore(str(tmpdir), ttl=60, segment_size=8)
+    store.put("a", b"x" * 8)
+    store.conn.execute("UPDATE entries SET created = ?", (time.time() - 120, ))
+    store.put("b", b"y" * 8)
+    assert len(store) == 2
+    store._evicted -= store.evict_interval + 1
+    store.put("c", b"z" * 8)
+    assert len(store) == 2
+    assert "a" not in store
+    segments = [name for name in os.listdir(str(tmpdir)) if name.endswith(".pack")]
+    assert len(segments) == 2
+
+
+def test_pack_store_running_size(tmpdir, monkeypatch):
+    store = PackStore(str(tmpdir), max_size=1000)
+    store.put("a", b"x" * 10)
+    calls = []
+    size = store.size
+    monkeypatch.setattr(store, "size", lambda: calls.append(1) or size())
+    store.put("b", b"x" * 20)
+    store.put("a", b"x" * 5)
+    store.remove("b")
+    assert calls == []
+    assert store._size == size() == 5
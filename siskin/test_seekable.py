@@ -0,0 +1,102 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test seekable zstd files.
+"""
+
+import shutil
+import subprocess
+
+import pytest
+
+import luigi
+from siskin.ndjson import open_file
+from siskin.seekable import (SeekableReader, SeekableWriter, SeekableZstdFormat, concat, is_seekable)
+
+pytestmark = pytest.mark.skipif(not shutil.which('zstd'), reason='zstd executable required')
+
+LINES = [('%06d %s\n' % (i, 'x' * (i % 97))).encode('utf-8') for i in range(5000)]
+DATA = b''.join(LINES)
+
+
+def write(path, frame_size=10000):
+    with SeekableWriter(open(path, 'wb'), frame_size=frame_size, workers=2) as writer:
+        for line in LINES:
+            writer.write(line)
+    return path
+
+
+def test_roundtrip(tmpdir):
+    path = write(str(tmpdir.join('data.zst')))
+    reader = SeekableReader(path)
+    assert len(reader.frames) > 10
+    assert reader.size == len(DATA)
+    # Frames end at line boundaries.
+    assert all(DATA[f.doffset + f.dsize - 1:f.doffset + f.dsize] == b'\n' for f in reader.frames)
+    assert b''.join(reader.chunks(workers=3)) == DATA
+    assert b''.join(reader.chunks(workers=1)) == DATA
+    with reader.open() as handle:
+        assert list(handle) == LINES
+    # Any zstd decompressor can read the file.
+    assert subprocess.check_output(['zstd', '-q', '-d', '-c', path]) == DATA
+
+
+def test_read_range(tmpdir):
+    reader = SeekableReader(write(str(tmpdir.join('data.zst'))))
+    for offset, size in ((0, 10), (9995, 20), (len(DATA) - 3, 100), (12345, 40000)):
+        assert reader.read(offset, size) == DATA[offset:offset + size]
+    assert reader.read(len(DATA) + 10, 5) == b''
+
+
+def test_not_seekable(tmpdir):
+    path = str(tmpdir.join('plain.zst'))
+    subprocess.run(['zstd', '-q', '-o', path], input=DATA, check=True)
+    assert not is_seekable(path)
+    with pytest.raises(RuntimeError):
+        SeekableReader(path)
+    with open_file(path) as handle:
+        assert handle.read() == DATA
+
+
+def test_luigi_target_and_open_file(tmpdir):
+    target = luigi.LocalTarget(path=str(tmpdir.join('target.ldj.zst')), format=SeekableZstdFormat(frame_size=5000))
+    with target.open('w') as output:
+        for line in LINES:
+            output.write(line)
+    assert is_seekable(target.path)
+    with target.open() as handle:
+        assert handle.read() == DATA
+    with open_file(target.path) as handle:
+        assert list(handle) == LINES
+
+
+def test_concat(tmpdir):
+    a, b = write(str(tmpdir.join('a.zst'))), write(str(tmpdir.join('b.zst')), frame_size=30000)
+    path = str(tmpdir.join('ab.zst'))
+    with open(path, 'wb') as output:
+        concat([a, b], output)
+    reader = SeekableReader(path)
+    assert len(reader.frames) == len(SeekableReader(a).frames) + len(SeekableReader(b).frames)
+    assert reader.read(len(DATA) - 10, 20) == DATA[-10:] + DATA[:10]
+    assert subprocess.check_output(['zstd', '-q', '-d', '-c', path]) == DATA + DATA
@@ -0,0 +1,73 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test incremental crossref snapshot.
+"""
+
+import gzip
+import io
+import json
+
+from siskin.snapshot import Snapshot
+
+
+def work(doi, day, title):
+    return {'DOI': doi, 'deposited': {'date-time': '2021-01-%02dT00:00:00Z' % day}, 'title': [title]}
+
+
+def write(path, docs):
+    with gzip.open(str(path), 'wb') as output:
+        for doc in docs:
+            output.write(json.dumps(doc).encode('utf-8') + b'\n')
+    return str(path)
+
+
+def exported(store, since=None):
+    output = io.BytesIO()
+    count = store.export(output, since=since)
+    docs = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert count == len(docs)
+    return dict((doc['DOI'], doc['title'][0]) for doc in docs)
+
+
+def test_snapshot(tmpdir):
+    first = write(tmpdir.join('1.ldj.gz'), [work('10.1/a', 1, 'a1'), work('10.1/b', 1, 'b1'), work('10.1/b', 2, 'b2'), {'title': ['no doi']}])
+    second = write(tmpdir.join('2.ldj.gz'), [work('10.1/A', 3, 'a3'), work('10.1/b', 1, 'b-old'), work('10.1/c', 3, 'c3')])
+    with Snapshot(str(tmpdir.join('store', 'snapshot.db'))) as store:
+        g1 = store.begin('2021-01-01')
+        stats = store.apply(first, g1)
+        assert stats['records.in'] == 4 and stats['records.new'] == 2
+        assert stats['records.skipped.no.doi'] == 1
+        assert exported(store) == {'10.1/a': 'a1', '10.1/b': 'b2'}
+        # Applied chunks are skipped.
+        assert store.apply(first, g1) == {'chunks.skipped': 1}
+
+        g2 = store.begin('2021-02-01')
+        assert g2 == g1 + 1 and store.begin('2021-02-01') == g2
+        stats = store.apply(second, g2)
+        assert stats['records.updated'] == 1 and stats['records.skipped.older'] == 1 and stats['records.new'] == 1
+        assert exported(store) == {'10.1/A': 'a3', '10.1/b': 'b2', '10.1/c': 'c3'}
+        assert exported(store, since=g1) == {'10.1/A': 'a3', '10.1/c': 'c3'}
+        assert store.count() == 3 and store.count(since=g1) == 2
+        assert store.generation(name='2021-01-01') == g1 and store.generation() == g2
@@ -0,0 +1,102 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test solr bulk indexing against a stub update handler.
+"""
+
+import http.server
+import json
+import threading
+import urllib.parse
+
+import pytest
+
+from siskin.solr import Indexer
+
+
+@pytest.fixture
+def solr():
+    """
+    A stub update handler, which answers every third request with HTTP 503
+    and rejects documents with id "bad".
+    """
+    state = {'docs': [], 'deletes': [], 'commits': [], 'requests': 0}
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            params = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+            with lock:
+                state['requests'] += 1
+                busy = state['requests'] % 3 == 0
+            if busy:
+                self.send_response(503)
+                self.send_header('Retry-After', '0')
+                self.end_headers()
+                return
+            if isinstance(body, list) and any(doc.get('id') == 'bad' for doc in body):
+                self.send_response(400)
+                self.end_headers()
+                return
+            with lock:
+                if isinstance(body, list):
+                    state['docs'].extend(body)
+                if 'delete' in body:
+                    state['deletes'].extend(body['delete'])
+                if 'commit' in body or params.get('softCommit'):
+                    state['commits'].append('soft' if params.get('softCommit') else 'hard')
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%s/solr/ai' % server.server_port, state
+    server.shutdown()
+
+
+def test_indexer(solr):
+    url, state = solr
+    lines = [json.dumps({'id': 'ai-%d' % i}).encode('utf-8') + b'\n' for i in range(1000)] + [b'\n']
+    indexer = Indexer(url, batch_size=64, workers=4, commit='soft')
+    indexer.index(iter(lines))
+    indexer.delete(['ai-1', 'ai-2'])
+    stats = indexer.finish()
+    assert stats['docs'] == 1000 and stats['batches'] == 16 and stats['deletes'] == 2
+    assert stats['throttled'] > 0 and stats['throttled'] == stats['retries']
+    assert sorted(doc['id'] for doc in state['docs']) == sorted('ai-%d' % i for i in range(1000))
+    assert state['deletes'] == ['ai-1', 'ai-2']
+    assert state['commits'] == ['soft']
+
+
+def test_indexer_errors(solr):
+    url, _ = solr
+    with pytest.raises(RuntimeError):
+        Indexer(url, workers=2).index([b'{"id": "ok"}', b'{"id": "bad"}'])
+    with pytest.raises(ValueError):
+        Indexer(url, commit='sometimes')
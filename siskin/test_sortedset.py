@@ -0,0 +1,77 @@
+# coding: utf-8
+# pylint: disable=C0103,W0232,C0301,W0703
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Test compact sorted sets.
+"""
+
+import os
+
+import pytest
+
+from siskin.sortedset import SortedSet, pack_issn, unpack_issn
+
+
+def test_sorted_set(tmpdir):
+    with SortedSet.build(os.path.join(str(tmpdir), 'a'), ['c', 'a', 'b', 'a', u'ä']) as s:
+        assert len(s) == 4
+        assert list(s) == ['a', 'b', 'c', u'ä']
+        assert 'a' in s and u'ä' in s and b'b' in s
+        assert 'x' not in s and '' not in s
+
+    with SortedSet.build(os.path.join(str(tmpdir), 'empty'), []) as s:
+        assert len(s) == 0
+        assert 'a' not in s
+        assert list(s) == []
+
+
+def test_sorted_set_presorted(tmpdir):
+    with pytest.raises(ValueError):
+        SortedSet.build(os.path.join(str(tmpdir), 'a'), ['b', 'a'], presorted=True)
+
+
+def test_sorted_set_merge(tmpdir):
+    a = SortedSet.build(os.path.join(str(tmpdir), 'a'), ['1', '2', '3', '5'])
+    b = SortedSet.build(os.path.join(str(tmpdir), 'b'), ['0', '2', '5', '6'])
+    assert list(a.intersection(b)) == ['2', '5']
+    assert list(a.difference(b)) == ['1', '3']
+    assert list(b.difference(a)) == ['0', '6']
+
+
+def test_issn():
+    issns = ['0000-0019', '1234-5678', '1234-567X', '9999-999X']
+    assert [unpack_issn(pack_issn(v)) for v in issns] == issns
+    assert sorted(pack_issn(v) for v in issns) == [pack_issn(v) for v in sorted(issns)]
+    assert pack_issn('1234567x') == pack_issn('1234-567X')
+    assert pack_issn('9999-999X') < 1 << 32
+    with pytest.raises(ValueError):
+        pack_issn('1234-56789')
+
+
+def test_sorted_set_issn(tmpdir):
+    with SortedSet.build(os.path.join(str(tmpdir), 'a'), ['2049-3630', '0000-0019', '2049-3630'], issn=True) as s:
+        assert len(s) == 2
+        assert list(s) == ['0000-0019', '2049-3630']
+        assert '20493630' in s
+        assert '2049-3631' not in s
+        assert 'not an issn' not in s
@@ -1,16 +1,21 @@
 # pylint: disable=C0111,C0301
 
+import gzip
+import http.server
 import io
 import json
 import os
 import tempfile
+import threading
+import time
 
+import pytest
 import requests
 
 import marcx
 import pymarc
 import responses
-from siskin.utils import (SetEncoder, URLCache, dictcheck, get_task_import_cache, load_set, nwise, random_string, scrape_html_listing, xmlstream)
+from siskin.utils import (SetEncoder, TokenBucket, URLCache, dictcheck, get_task_import_cache, load_set, load_sorted_set, merge_sorted, nwise, overlap_counts, random_string, scrape_html_listing, xmlstream, xmlstream_chunks)
 
 
 def test_set_encoder_dumps():
@@ -63,6 +68,33 @@ def test_load_set():
     os.remove(tf.name)
 
 
+def test_load_sorted_set(tmpdir):
+    s = load_sorted_set(io.StringIO(u"3\n1\n\n2\n1\n"))
+    assert list(s) == ["1", "2", "3"]
+    assert "2" in s
+    assert not os.path.exists(s.path)
+    s.close()
+
+    path = os.path.join(str(tmpdir), "issn.set")
+    s = load_sorted_set(io.StringIO(u"2049-3630\n0000-0019\n"), func=lambda v: v.upper(), path=path, issn=True)
+    assert list(s) == ["0000-0019", "2049-3630"]
+    assert os.path.exists(path)
+    s.close()
+
+
+def test_merge_sorted():
+    assert list(merge_sorted([])) == []
+    assert list(merge_sorted([io.StringIO(u"a\nb\nb\n"), io.StringIO(u"\nb\nc\n")])) == [("a", (0, )), ("b", (0, 1)), ("c", (1, ))]
+    with pytest.raises(RuntimeError):
+        list(merge_sorted([io.StringIO(u"b\na\n")]))
+
+
+def test_overlap_counts():
+    sizes, counts = overlap_counts([io.StringIO(u"a\nb\nd\n"), io.StringIO(u"b\nc\nd\n"), io.StringIO(u"d\n")], k=3)
+    assert sizes == [3, 3, 1]
+    assert counts == {(0, 1): 2, (0, 2): 1, (1, 2): 1, (0, 1, 2): 1}
+
+
 def test_get_cache_file(tmpdir):
     cache = URLCache(directory=str(tmpdir))
     fn = cache.get_cache_file("http://x.com")
@@ -131,3 +163,193 @@ def test_xmlstream():
     filename = handle.name
     assert [v for v in xmlstream(filename, "b")] == [b'<b>C</b>', b'<b>C</b>']
     os.remove(filename)
+
+
+def test_xmlstream_leading_comment(tmpdir):
+    filename = str(tmpdir.join('comment.xml'))
+    with open(filename, 'w') as handle:
+        handle.write("""<?xml version="1.0"?><!-- c --><?pi x?><a><b>C</b><!-- d --><b>D</b></a>""")
+    assert list(xmlstream(filename, "b")) == [b'<b>C</b>', b'<b>D</b>']
+    assert list(xmlstream(filename, "a")) == [b'<a><b>C</b><!-- d --><b>D</b></a>']
+
+
+def test_xmlstream_dict():
+    with tempfile.NamedTemporaryFile('w', delete=False) as handle:
+        handle.write("""<a xmlns="x"><b k="1"><c>D</c><c>E</c></b><x/><b>F</b></a>""")
+
+    filename = handle.name
+    assert list(xmlstream(filename, "b", output="dict")) == [{'b': {'@k': '1', 'c': ['D', 'E']}}, {'b': 'F'}]
+    os.remove(filename)
+
+
+def test_xmlstream_workers():
+    with tempfile.NamedTemporaryFile('w', delete=False) as handle:
+        handle.write('<?xml version="1.0"?>\n<a>\n')
+        for i in range(500):
+            handle.write('<b n="%s"><c>%s</c></b>\n<d/>\n' % (i, i))
+        handle.write('</a>\n')
+
+    filename = handle.name
+    expected = list(xmlstream(filename, "b"))
+    assert len(expected) == 500
+    assert list(xmlstream(filename, "b", workers=2, chunk_size=512)) == expected
+    os.remove(filename)
+
+
+def test_xmlstream_workers_frame(tmpdir):
+    filename = str(tmpdir.join('frame.xml'))
+    with open(filename, 'w') as handle:
+        handle.write('<?xml version="1.0"?>\n<!-- <x> --><a xmlns="u"><h>%s</h><list>\n' % ('<i/>' * 1000))
+        for i in range(500):
+            handle.write('<b n="%s"><c>%s</c></b>\n' % (i, i))
+        handle.write('</list><t>%s</t></a>\n' % ('<i/>' * 1000))
+
+    header, trailer, chunks = xmlstream_chunks(filename, 'b', chunk_size=512)
+    assert header == b'<?xml version="1.0"?>\n<a xmlns="u"><list>'
+    assert trailer == b'</list></a>'
+    assert len(chunks) > 2
+    expected = list(xmlstream(filename, "b"))
+    assert len(expected) == 500
+    assert list(xmlstream(filename, "b", workers=2, chunk_size=512)) == expected
+
+
+def test_xmlstream_workers_error(tmpdir):
+    filename = str(tmpdir.join('broken.xml'))
+    with open(filename, 'w') as handle:
+        handle.write('<a>' + '<b>x</b>' * 200 + '<b>x</c>' + '<b>x</b>' * 200 + '</a>')
+    with pytest.raises(RuntimeError):
+        list(xmlstream(filename, "b", workers=2, chunk_size=512))
+
+
+def test_url_cache_remove(tmpdir):
+    cache = URLCache(directory=str(tmpdir))
+    fn = cache.get_cache_file("http://x.com")
+    with open(fn, "w") as handle:
+        handle.write("hello")
+    assert cache.is_cached("http://x.com")
+    cache.remove("http://x.com")
+    assert not cache.is_cached("http://x.com")
+    cache.remove("http://x.com")
+
+
+def test_url_cache_read_without_meta(tmpdir):
+    cache = URLCache(directory=str(tmpdir))
+    fn = cache.get_cache_file("http://x.com")
+    with open(fn, "wb") as handle:
+        handle.write("hellö".encode("utf-8"))
+    assert cache._read("http://x.com") == "hellö"
+    # A compressed body, whose metadata is missing.
+    with open(fn, "wb") as handle:
+        handle.write(gzip.compress(b"hello"))
+    assert cache._read("http://x.com") == "hello"
+    with open(fn, "wb") as handle:
+        handle.write(b"\xff\xfe")
+    assert cache._read("http://x.com") is None
+
+
+@responses.activate
+def test_url_cache_pack_backend(tmpdir):
+    responses.add(responses.GET, 'http://fake.com/1', body='hello', status=200)
+    cache = URLCache(directory=str(tmpdir), backend="pack")
+    assert not cache.is_cached('http://fake.com/1')
+    assert cache.get('http://fake.com/1') == 'hello'
+    assert cache.is_cached('http://fake.com/1')
+    assert cache.get('http://fake.com/1') == 'hello'
+    assert len(responses.calls) == 1
+    cache.remove('http://fake.com/1')
+    assert not cache.is_cached('http://fake.com/1')
+    with pytest.raises(RuntimeError):
+        cache.get_cache_file('http://fake.com/1')
+
+
+@pytest.fixture
+def http_server():
+    """
+    A local HTTP server, which returns the path as body and records requested paths.
+    """
+    requested = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            requested.append((self.path, self.headers.get('If-None-Match')))
+            if self.path.startswith('/missing'):
+                self.send_response(404)
+                self.end_headers()
+                return
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = self.path.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', '"v1"')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%s' % server.server_port, requested
+    server.shutdown()
+
+
+def test_url_cache_get_many(tmpdir, http_server):
+    base, requested = http_server
+    cache = URLCache(directory=str(tmpdir))
+    urls = ['%s/%d' % (base, i) for i in range(20)]
+    cache.get(urls[0])
+    cache.get(urls[1])
+    assert len(requested) == 2
+
+    result = dict(cache.get_many(urls, workers=4))
+    assert len(result) == 20
+    for i, url in enumerate(urls):
+        assert result[url] == '/%d' % i
+    assert len(requested) == 20
+
+    result = dict(cache.get_many(urls, workers=4))
+    assert len(result) == 20
+    assert len(requested) == 20
+    # Body and meta per URL, no temporary files left behind.
+    assert sum(len(files) for _, _, files in os.walk(str(tmpdir))) == 40
+
+
+def test_url_cache_get_many_errors(tmpdir, http_server):
+    base, _ = http_server
+    cache = URLCache(directory=str(tmpdir), max_tries=1)
+    urls = ['%s/%d' % (base, i) for i in range(5)] + ['%s/missing' % base]
+    with pytest.raises(RuntimeError):
+        dict(cache.get_many(urls, workers=2))
+    result = dict(cache.get_many(urls, workers=2, skip_errors=True))
+    assert sorted(result) == sorted(urls[:5])
+
+
+def test_token_bucket():
+    bucket = TokenBucket(50, capacity=1)
+    started = time.time()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.time() - started >= 0.09
+
+
+@pytest.mark.parametrize('backend', ['files', 'pack'])
+def test_url_cache_revalidate(tmpdir, http_server, backend):
+    base, requested = http_server
+    cache = URLCache(directory=str(tmpdir), backend=backend)
+    url = '%s/page' % base
+    assert cache.get(url) == '/page'
+    assert requested == [('/page', None)]
+    assert cache.get(url, max_age=3600) == '/page'
+    assert len(requested) == 1
+    assert cache.get(url, force=True) == '/page'
+    assert requested[-1] == ('/page', '"v1"')
+    fetched, meta = cache._info(url)
+    assert meta['etag'] == '"v1"'
+    assert fetched > time.time() - 60
+    if backend == 'files':
+        with open(cache.get_cache_file(url), 'rb') as handle:
+            assert handle.read(2) == b'\x1f\x8b'
@@ -28,8 +28,13 @@ Various utilities.
 from __future__ import print_function
 
 import base64
+import collections
+import concurrent.futures
 import errno
+import gzip
 import hashlib
+import heapq
+import io
 import itertools
 import json
 import logging
@@ -38,9 +43,12 @@ import os
 import random
 import re
 import string
+import subprocess
 import sys
 import tempfile
-import xml.etree.cElementTree as ET
+import threading
+import time
+import zlib
 
 import requests
 import six
@@ -50,7 +58,12 @@ from six import string_types
 import backoff
 import bs4
 import luigi
+from lxml import etree
 from siskin import __version__
+from siskin.cacheutils import get_task_registry, task_registry_path
+from siskin.configuration import Config
+from siskin.packstore import PackStore
+from siskin.sortedset import SortedSet
 from six.moves.urllib.parse import urlparse
 
 logger = logging.getLogger('siskin')
@@ -171,50 +184,148 @@ def get_task_import_cache():
     (few seconds), so the import cache shortens the startup time of the command
     line tools by only importing the module the given task is in.
 
+    The mapping is built from the source files without importing them and
+    refreshed, if a file changes, see siskin.cacheutils.
+
     It is save to remove the file returned by `taskimportcache` at any time.
     """
-    task_import_cache = None
-    path = os.path.join(tempfile.gettempdir(), 'siskin_task_import_cache_%s' % __version__)
-    if not os.path.exists(path):
-        logger.debug("creating task import cache at %s", path)
-        from siskin.cacheutils import _write_task_import_cache
-        _write_task_import_cache(path)
-
-    with open(path) as handle:
-        try:
-            task_import_cache = json.load(handle)
-        except Exception as err:
-            message = "failed to load task import cache, remove %s, then try again (%s)" % (path, err)
-            raise RuntimeError(message)
-
-    return task_import_cache, path
+    return get_task_registry(), task_registry_path()
 
 
-def load_set(obj, func=lambda v: v):
+def _nonempty_lines(obj):
     """
-    Load a set from a filename, file-like object or a luigi.LocalTarget.
+    Yield stripped, non-empty lines from a filename, file-like object or a
+    luigi.LocalTarget.
     """
-    s = set()
-
     if isinstance(obj, luigi.LocalTarget):
         with obj.open() as handle:
             for line in (line.strip() for line in handle):
-                if not line:
-                    continue
-                s.add(func(line))
+                if line:
+                    yield line
     elif isinstance(obj, string_types):
         with open(obj) as handle:
             for line in (line.strip() for line in handle):
-                if not line:
-                    continue
-                s.add(func(line))
+                if line:
+                    yield line
     else:
         for line in (line.strip() for line in obj):
-            if not line:
-                continue
-            s.add(func(line))
+            if line:
+                yield line
+
+
+def load_set(obj, func=lambda v: v):
+    """
+    Load a set from a filename, file-like object or a luigi.LocalTarget. For
+    very large lists, see load_sorted_set.
+    """
+    return set(func(line) for line in _nonempty_lines(obj))
+
+
+def load_sorted_set(obj, func=lambda v: v, path=None, issn=False):
+    """
+    Like load_set, but return a compact, read-only siskin.sortedset.SortedSet,
+    which is memory mapped and needs only a fraction of the memory of a set.
+    Values are sorted with sort(1), so inputs larger than memory are fine.
+    With issn, values must be ISSNs, which are stored as integers.
+
+    If path is given, the set is kept there and can be opened by other
+    processes with SortedSet(path), otherwise a temporary file is used,
+    which is removed right away and only shared with forked processes.
+
+        >>> dois = load_sorted_set(CrossrefDOIList().output())
+        >>> "10.1016/j.ijhcs.2008.06.001" in dois
+        True
+
+    """
+    fd, tmp = tempfile.mkstemp(prefix='siskin-')
+    with os.fdopen(fd, 'wb') as output:
+        for line in _nonempty_lines(obj):
+            value = func(line)
+            output.write((value if isinstance(value, bytes) else value.encode('utf-8')) + b'\n')
+    try:
+        if issn:
+            with open(tmp, 'rb') as handle:
+                sset = SortedSet.build(path or tmp + '.set', (line.rstrip(b'\n').decode('utf-8') for line in handle), issn=True)
+        else:
+            env = dict(os.environ, LC_ALL='C')
+            subprocess.check_call(['sort', '-u', '-S', '25%', '-o', tmp, tmp], env=env)
+            with open(tmp, 'rb') as handle:
+                sset = SortedSet.build(path or tmp + '.set', (line.rstrip(b'\n') for line in handle), presorted=True)
+    finally:
+        os.remove(tmp)
+    if path is None:
+        sset.close()
+        sset = SortedSet(tmp + '.set', unlink=True)
+    return sset
+
+
+def merge_sorted(objs, names=None):
+    """
+    Merge sorted inputs (filenames, file-like objects or luigi.LocalTarget,
+    as in load_set) in a single pass. Yields tuples (value, members), where
+    members is a tuple of the indices of the inputs containing value. Values
+    are emitted in order, each only once.
+
+    Inputs must be sorted bytewise (LC_ALL=C sort), duplicates are skipped.
+    Raises RuntimeError, if an input is not sorted.
+
+        >>> list(merge_sorted([io.StringIO(u"a\\nb\\n"), io.StringIO(u"b\\nc\\n")]))
+        [('a', (0,)), ('b', (0, 1)), ('c', (1,))]
+
+    """
+    names = names or [str(i) for i in range(len(objs))]
+
+    def tagged(i, obj):
+        previous = None
+        for value in _nonempty_lines(obj):
+            if previous is not None:
+                if value == previous:
+                    continue
+                if value < previous:
+                    raise RuntimeError('input %s not sorted (use LC_ALL=C sort): %r after %r' % (names[i], value, previous))
+            previous = value
+            yield value, i
+
+    current, members = None, []
+    for value, i in heapq.merge(*[tagged(i, obj) for i, obj in enumerate(objs)]):
+        if value != current:
+            if members:
+                yield current, tuple(members)
+            current, members = value, []
+        members.append(i)
+    if members:
+        yield current, tuple(members)
+
+
+def overlap_counts(objs, k=2, names=None):
+    """
+    Count the overlaps between sorted inputs in a single pass (see
+    merge_sorted). Returns the number of values per input and a dictionary
+    mapping each combination of 2 up to k input indices to the number of
+    values contained in all of them. Memory usage does not depend on the size
+    of the inputs.
+
+        >>> sizes, counts = overlap_counts([a, b, c])
+        >>> counts[(0, 2)]
+        123
 
-    return s
+    """
+    signatures = collections.Counter()
+    for _, members in merge_sorted(objs, names=names):
+        signatures[members] += 1
+
+    sizes = [0] * len(objs)
+    counts = collections.OrderedDict()
+    for r in range(2, k + 1):
+        for combination in itertools.combinations(range(len(objs)), r):
+            counts[combination] = 0
+    for members, count in signatures.items():
+        for i in members:
+            sizes[i] += count
+        for r in range(2, min(k, len(members)) + 1):
+            for combination in itertools.combinations(members, r):
+                counts[combination] += count
+    return sizes, counts
 
 
 def load_set_from_target(target, func=lambda v: v):
@@ -256,6 +367,16 @@ class URLCache(object):
     It is not very efficient, as it creates lots of directories.
     > 396140 directories, 334024 files ... ...
 
+    For larger caches, use the "pack" backend, which keeps all content in a
+    few segment files with an index (see siskin.packstore), optionally bounded
+    in size and age. The backend can be set per instance or globally:
+
+        [urlcache]
+
+        backend = pack
+        max-size = 10737418240
+        ttl = 2592000
+
     To clean the cache just remove the cache directory.
 
     >>> cache = URLCache()
@@ -272,11 +393,15 @@ class URLCache(object):
     >>> cache.is_cached("https://www.google.com")
     True
 
-    It is possible to force a download, too:
+    Content is stored gzip compressed, along with the ETag and Last-Modified
+    headers of the response. Cached entries can be refreshed; if the server
+    supports conditional requests, a HTTP 304 will only mark the entry as
+    fresh, without downloading the content again:
 
     >>> page = cache.get("https://www.google.com", force=True)
+    >>> page = cache.get("https://www.google.com", max_age=86400)
     """
-    def __init__(self, directory=None, max_tries=12):
+    def __init__(self, directory=None, max_tries=12, backend=None, max_size=None, ttl=None):
         """
         If `directory` is not explictly given, all files will be stored under
         the temporary directory. Requests can be retried, if they resulted in
@@ -284,17 +409,41 @@ class URLCache(object):
         Server Error), even if it really is a HTTP 503 (Service Unavailable).
         We therefore treat HTTP 500 errors as something to retry on,
         at most `max_tries` times.
+
+        The `backend` can be "files" (default, one file per URL) or "pack".
+        The `max_size` in bytes and `ttl` in seconds only apply to the pack
+        backend.
         """
         self.directory = directory or tempfile.gettempdir()
         self.sess = requests.session()
         self.max_tries = max_tries
 
+        config = Config.instance()
+        self.backend = backend or config.get('urlcache', 'backend', fallback='files')
+        if self.backend not in ('files', 'pack'):
+            raise ValueError('unknown URLCache backend: %s' % self.backend)
+
+        self.store = None
+        if self.backend == 'pack':
+            if max_size is None:
+                max_size = config.getint('urlcache', 'max-size', fallback=None)
+            if ttl is None:
+                ttl = config.getint('urlcache', 'ttl', fallback=None)
+            self.store = PackStore(os.path.join(self.directory, 'pack'), max_size=max_size, ttl=ttl)
+
+    def _digest(self, url):
+        return hashlib.sha1(six.b(url)).hexdigest()
+
     def get_cache_file(self, url):
         """
         Return the cache file path for a URL. This will - as a side effect -
-        create the parent directories, if necessary.
+        create the parent directories, if necessary. Only available for the
+        files backend.
         """
-        digest = hashlib.sha1(six.b(url)).hexdigest()
+        if self.store is not None:
+            raise RuntimeError('the %s backend does not keep a file per URL, use get or remove' % self.backend)
+
+        digest = self._digest(url)
         d0, d1, d2 = digest[:2], digest[2:4], digest[4:6]
         path = os.path.join(self.directory, d0, d1, d2)
 
@@ -309,29 +458,296 @@ class URLCache(object):
         return os.path.join(path, digest)
 
     def is_cached(self, url):
+        if self.store is not None:
+            return self._digest(url) in self.store
         return os.path.exists(self.get_cache_file(url))
 
-    def get(self, url, force=False):
+    def remove(self, url):
+        """
+        Remove a cached URL, e.g. if the cached content turned out to be unusable.
+        """
+        if self.store is not None:
+            self.store.remove(self._digest(url))
+            return
+        path = self.get_cache_file(url)
+        for name in (path, path + '.meta'):
+            try:
+                os.remove(name)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def _info(self, url):
         """
-        Return URL, either from cache or the web.
+        Return a tuple (fetched, meta) for a cached URL or None. Fetched is a
+        timestamp, meta contains encoding and validators of the response.
+        Entries written by older versions have no meta (None) and are stored
+        uncompressed.
+        """
+        if self.store is not None:
+            return self.store.info(self._digest(url))
+        path = self.get_cache_file(url)
+        try:
+            fetched = os.path.getmtime(path)
+        except OSError:
+            return None
+        try:
+            with open(path + '.meta') as handle:
+                return fetched, json.load(handle)
+        except (IOError, OSError, ValueError):
+            return fetched, None
+
+    def _read(self, url):
+        """
+        Return cached content or None.
+        """
+        info = self._info(url)
+        if info is None:
+            return None
+        _, meta = info
+        if self.store is not None:
+            data = self.store.get(self._digest(url))
+        else:
+            try:
+                with open(self.get_cache_file(url), 'rb') as handle:
+                    data = handle.read()
+            except IOError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                return None
+        if data is None:
+            return None
+        if meta is None and not data.startswith(b'\x1f\x8b'):
+            try:
+                return data.decode('utf-8')
+            except UnicodeDecodeError as err:
+                logger.debug("unreadable cache entry for %s: %s", url, err)
+                return None
+        meta = meta or {}
+        try:
+            return gzip.decompress(data).decode(meta.get('encoding') or 'utf-8', errors='replace')
+        except (EOFError, OSError, zlib.error) as err:
+            logger.debug("unreadable cache entry for %s: %s", url, err)
+            return None
+
+    def _is_fresh(self, url, max_age=None):
+        """
+        True, if URL is cached and not older than max_age seconds.
+        """
+        info = self._info(url)
+        if info is None:
+            return False
+        return max_age is None or info[0] >= time.time() - max_age
+
+    def fetch(self, url, bucket=None, revalidate=False):
         """
+        Download URL into the cache, retry on errors. If a TokenBucket is
+        given, every attempt will take a token first.
+
+        The response body is streamed to disk and stored gzip compressed,
+        together with its ETag and Last-Modified headers. With `revalidate`
+        a conditional request is sent for an already cached URL; if the
+        server responds with HTTP 304, only the freshness of the entry is
+        updated.
+        """
+        headers = {}
+        info = self._info(url) if revalidate else None
+        if info is not None and info[1] is not None:
+            if info[1].get('etag'):
+                headers['If-None-Match'] = info[1]['etag']
+            if info[1].get('last_modified'):
+                headers['If-Modified-Since'] = info[1]['last_modified']
+
         @backoff.on_exception(backoff.expo, RuntimeError, max_tries=self.max_tries)
         def fetch(url):
             """
             Nested function, so we can configure number of retries.
             """
-            r = self.sess.get(url, timeout=600)
-            if r.status_code >= 400:
-                raise RuntimeError('%s on %s' % (r.status_code, url))
-            with tempfile.NamedTemporaryFile(delete=False) as output:
-                output.write(r.text.encode('utf-8'))
-            os.rename(output.name, self.get_cache_file(url))
+            if bucket is not None:
+                bucket.acquire()
+            with self.sess.get(url, timeout=600, headers=headers, stream=True) as r:
+                if r.status_code == 304 and headers:
+                    self._touch(url)
+                    return
+                if r.status_code >= 400:
+                    raise RuntimeError('%s on %s' % (r.status_code, url))
+                meta = {
+                    'url': url,
+                    'encoding': r.encoding,
+                    'etag': r.headers.get('ETag'),
+                    'last_modified': r.headers.get('Last-Modified'),
+                }
+                # Next to the cache file, so it can be renamed into place.
+                directory = os.path.dirname(self.get_cache_file(url)) if self.store is None else None
+                with tempfile.NamedTemporaryFile(delete=False, dir=directory) as output:
+                    try:
+                        with gzip.GzipFile(fileobj=output, mode='wb') as compressed:
+                            for chunk in r.iter_content(chunk_size=1 << 16):
+                                compressed.write(chunk)
+                    except BaseException:
+                        os.remove(output.name)
+                        raise
+            self._commit(url, output.name, meta)
+
+        fetch(url)
+
+    def _commit(self, url, filename, meta):
+        """
+        Move a compressed body from a temporary file into the cache. For the
+        files backend, the metadata is replaced first, then the body.
+        """
+        if self.store is not None:
+            try:
+                with open(filename, 'rb') as handle:
+                    self.store.put(self._digest(url), handle, meta=meta)
+            finally:
+                os.remove(filename)
+            return
+        path = self.get_cache_file(url)
+        with tempfile.NamedTemporaryFile('w', delete=False, dir=os.path.dirname(path)) as output:
+            json.dump(meta, output)
+        os.replace(output.name, path + '.meta')
+        os.replace(filename, path)
+
+    def _touch(self, url):
+        """
+        Mark cached URL as fresh.
+        """
+        if self.store is not None:
+            self.store.touch(self._digest(url))
+        else:
+            os.utime(self.get_cache_file(url))
+
+    def get(self, url, force=False, max_age=None):
+        """
+        Return URL, either from cache or the web. With `force`, or if the
+        cached entry is older than `max_age` seconds, the entry is refreshed,
+        via a conditional request, if possible.
+        """
+        if not self.is_cached(url):
+            self.fetch(url)
+        elif force or not self._is_fresh(url, max_age=max_age):
+            self.fetch(url, revalidate=True)
+        body = self._read(url)
+        if body is None:
+            self.fetch(url)
+            body = self._read(url)
+        if body is None:
+            raise RuntimeError('could not cache %s' % url)
+        return body
+
+    def get_many(self, urls, workers=4, rate=None, force=False, max_age=None, skip_errors=False):
+        """
+        Fetch a number of URLs concurrently, yield (url, content) tuples as
+        they complete, so the order is not the order of the input. Cached URLs
+        are yielded immediately, without waiting for a free worker.
+
+        At most `workers` requests run at the same time, over a connection
+        pool of the same size. If `rate` is given, at most `rate` requests
+        per second are sent to a single host. Failed requests are retried, as
+        in `get`; if a URL cannot be fetched at all, the exception is raised,
+        or, with `skip_errors`, logged and the URL is left out. The `force`
+        and `max_age` arguments work as in `get`.
+
+            for url, body in cache.get_many(links, workers=8, rate=4):
+                ...
+        """
+        for prefix in ('http://', 'https://'):
+            adapter = self.sess.get_adapter(prefix)
+            self.sess.mount(prefix, requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=adapter.max_retries))
+
+        buckets, lock = {}, threading.Lock()
+
+        def bucket_for(url):
+            if rate is None:
+                return None
+            host = urlparse(url).netloc
+            with lock:
+                if host not in buckets:
+                    buckets[host] = TokenBucket(rate)
+                return buckets[host]
+
+        def fetch(url):
+            self.fetch(url, bucket=bucket_for(url), revalidate=self.is_cached(url))
+            body = self._read(url)
+            if body is None:
+                raise RuntimeError('could not cache %s' % url)
+            return body
+
+        def completed(futures):
+            for future in futures:
+                try:
+                    body = future.result()
+                except Exception as err:
+                    if not skip_errors:
+                        raise
+                    logger.error('could not fetch %s: %s', future.url, err)
+                    continue
+                yield future.url, body
 
-        if not self.is_cached(url) or force is True:
-            fetch(url)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            try:
+                for url in urls:
+                    body = self._read(url) if not force and self._is_fresh(url, max_age=max_age) else None
+                    if body is not None:
+                        yield url, body
+                        continue
+                    future = executor.submit(fetch, url)
+                    future.url = url
+                    pending.add(future)
+                    if len(pending) < 2 * workers:
+                        continue
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for url, body in completed(done):
+                        yield url, body
+                for url, body in completed(concurrent.futures.as_completed(pending)):
+                    yield url, body
+            finally:
+                for future in pending:
+                    future.cancel()
+
+
+class TokenBucket(object):
+    """
+    A thread-safe token bucket rate limiter. Tokens are added at `rate` per
+    second, up to `capacity`; acquire blocks until a token is available.
 
-        with open(self.get_cache_file(url)) as handle:
-            return handle.read()
+        bucket = TokenBucket(5)
+        for url in urls:
+            bucket.acquire()
+            requests.get(url)
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def update(self, rate):
+        """
+        Change the rate, e.g. to follow limits announced by a server.
+        """
+        with self.lock:
+            self.rate = float(rate)
+            self.capacity = min(self.capacity, max(self.rate, 1.0))
+            self.tokens = min(self.tokens, self.capacity)
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens, wait if necessary.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
 
 
 def scrape_html_listing(url, with_head=False):
@@ -384,31 +800,215 @@ def scrape_html_listing(url, with_head=False):
     return sorted(links)
 
 
-def compare_files(a, b):
+def compare_files(a, b, blocksize=1 << 20):
     """
-    Compare two paths by sha1 checksum. Returns True, if files are
-    byte-identical.
+    Compare two paths byte by byte. Returns True, if files are
+    byte-identical. Files of different size are never read.
     """
-    with open(a) as fa:
-        chka = hashlib.sha1()
+    if os.path.samefile(a, b):
+        return True
+    if os.path.getsize(a) != os.path.getsize(b):
+        return False
+    with open(a, 'rb') as fa, open(b, 'rb') as fb:
         while True:
-            data = fa.read(4096)
-            if not data:
+            da, db = fa.read(blocksize), fb.read(blocksize)
+            if da != db:
+                return False
+            if not da:
+                return True
+
+
+def etree_to_dict(elem):
+    """
+    Convert an element into a dictionary, similar to xmltodict, but without
+    namespaces: attributes are prefixed with "@", text of elements with
+    attributes or children is stored under "#text", repeated children become
+    lists.
+
+        >>> etree_to_dict(etree.fromstring('<a k="1"><b>x</b><b>y</b></a>'))
+        {'a': {'@k': '1', 'b': ['x', 'y']}}
+
+    """
+    def convert(elem):
+        value = dict(('@' + k.rpartition('}')[2], v) for k, v in elem.attrib.items())
+        for child in elem:
+            if not isinstance(child.tag, string_types):
+                continue  # comments, processing instructions
+            name, converted = child.tag.rpartition('}')[2], convert(child)
+            if name not in value:
+                value[name] = converted
+            elif isinstance(value[name], list):
+                value[name].append(converted)
+            else:
+                value[name] = [value[name], converted]
+        text = ((elem.text or '') + ''.join(child.tail or '' for child in elem)).strip()
+        if not value:
+            return text or None
+        if text:
+            value['#text'] = text
+        return value
+
+    return {elem.tag.rpartition('}')[2]: convert(elem)}
+
+
+def _xmlstream_records(source, tag, output='bytes', func=None, load_dtd=False):
+    """
+    Parse source, a filename or a file object, and yield converted records.
+    Processed elements and their preceding siblings are freed.
+    """
+    context = etree.iterparse(source, events=('end', ), tag='{*}%s' % tag, huge_tree=True, load_dtd=load_dtd)
+    for _, elem in context:
+        if output == 'bytes':
+            record = etree.tostring(elem, with_tail=False)
+        elif output == 'dict':
+            record = etree_to_dict(elem)
+        else:
+            record = elem
+        if func is not None:
+            record = func(record)
+        if record is not None:
+            yield record
+        # Free this element and everything parsed before it, all end events
+        # for these elements have been seen already. Siblings of the root
+        # (comments, processing instructions) cannot be deleted and are kept.
+        elem.clear(keep_tail=True)
+        for node in itertools.chain((elem, ), elem.iterancestors()):
+            parent = node.getparent()
+            if parent is None:
                 break
-            chka.update(data)
+            while node.getprevious() is not None:
+                del parent[0]
+    del context
 
-    with open(b) as fb:
-        chkb = hashlib.sha1()
-        while True:
-            data = fb.read(4096)
+
+class _XMLChunk(io.RawIOBase):
+    """
+    A readable file object for a byte range of a file, framed by a header
+    (XML declaration, doctype and opening tags) and a trailer (closing tags).
+    It carries the name of the file, so relative DTD references still resolve.
+    """
+    def __init__(self, filename, start, end, header=b'', trailer=b''):
+        self.name = filename
+        self.handle = open(filename, 'rb')
+        self.handle.seek(start)
+        self.remaining = end - start
+        self.header, self.trailer = header, trailer
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.header:
+            data, self.header = self.header[:len(buffer)], self.header[len(buffer):]
+        elif self.remaining > 0:
+            data = self.handle.read(min(len(buffer), self.remaining))
+            self.remaining -= len(data)
             if not data:
-                break
-            chkb.update(data)
+                self.remaining = 0
+        else:
+            data, self.trailer = self.trailer[:len(buffer)], self.trailer[len(buffer):]
+        buffer[:len(data)] = data
+        return len(data)
 
-    return chka.hexdigest() == chkb.hexdigest()
+    def close(self):
+        self.handle.close()
+        super(_XMLChunk, self).close()
 
 
-def xmlstream(filename, tag):
+def _xmlstream_chunk(filename, start, end, header, trailer, tag, output, func, load_dtd):
+    """
+    Process a single chunk in a worker process, return a list of records.
+    Parse errors are raised as RuntimeError, since lxml errors cannot be
+    pickled.
+    """
+    try:
+        with _XMLChunk(filename, start, end, header=header, trailer=trailer) as chunk:
+            return list(_xmlstream_records(chunk, tag, output=output, func=func, load_dtd=load_dtd))
+    except etree.LxmlError as err:
+        raise RuntimeError('%s (bytes %d-%d): %s' % (filename, start, end, err))
+
+
+# Markup in the part of a document before the first record.
+_XML_MARKUP = re.compile(
+    br"""<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|<!DOCTYPE[^\[>]*(?:\[.*?\]\s*)?>"""
+    br"""|</([^\s>]+)\s*>|<([^\s/>!?]+)(?:[^>"']|"[^"]*"|'[^']*')*?(/?)>""", re.DOTALL)
+
+
+def _xmlstream_frame(data):
+    """
+    Given the bytes before the first record, return a header with the XML
+    declaration, doctype and the opening tags of all elements still open, and
+    a trailer, that closes these elements.
+    """
+    prolog, stack = [], []
+    for match in _XML_MARKUP.finditer(data):
+        token, closing, opening, empty = match.group(0), match.group(1), match.group(2), match.group(3)
+        if opening is not None:
+            if not empty:
+                stack.append((opening, token))
+        elif closing is not None:
+            if not stack or stack[-1][0] != closing:
+                raise ValueError('unbalanced closing tag before first record: %r' % token)
+            stack.pop()
+        elif token.startswith(b'<?xml ') or token.startswith(b'<!DOCTYPE'):
+            prolog.append(token)
+    header = b'\n'.join(prolog + [b''.join(token for _, token in stack)])
+    trailer = b''.join(b'</' + name + b'>' for name, _ in reversed(stack))
+    return header, trailer
+
+
+def _xmlstream_find(handle, pattern, offset, size=1 << 20):
+    """
+    Return the offset of the first match of pattern in a file at or after
+    offset, or None.
+    """
+    overlap = 256
+    while True:
+        handle.seek(offset)
+        data = handle.read(size)
+        match = pattern.search(data)
+        if match:
+            return offset + match.start()
+        if len(data) < size:
+            return None
+        offset += size - overlap
+
+
+def xmlstream_chunks(filename, tag, chunk_size=1 << 26):
+    """
+    Split an XML file into chunks at record boundaries. Returns header,
+    trailer and a list of (start, end) offsets. The header contains the XML
+    declaration, doctype and the opening tags of the elements enclosing the
+    first record, the trailer closes these elements. The last chunk extends
+    to the end of the file and needs no trailer.
+
+    A chunk framed by header and trailer is only a well formed document, if
+    all records are direct children of a single parent, with nothing but
+    records (and whitespace or comments) in between, e.g. a <collection> of
+    <record> elements. If records are spread over several containers, e.g.
+    <ListRecords> on multiple pages, or nested at different depths, chunks
+    can contain unbalanced tags and fail to parse. Record boundaries are
+    found by looking for the tag name, so the tag must not appear in
+    comments or CDATA sections.
+    """
+    name = re.escape(tag.encode('utf-8'))
+    opening = re.compile(br'<(?:[\w.-]+:)?' + name + br'[\s/>]')
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as handle:
+        first = _xmlstream_find(handle, opening, 0)
+        if first is None:
+            return b'', b'', []
+        handle.seek(0)
+        header, trailer = _xmlstream_frame(handle.read(first))
+        chunks, start = [], first
+        while start < size:
+            end = _xmlstream_find(handle, opening, start + chunk_size) if start + chunk_size < size else None
+            chunks.append((start, end or size))
+            start = end or size
+    return header, trailer, chunks
+
+
+def xmlstream(filename, tag, output='bytes', func=None, workers=None, chunk_size=1 << 26, load_dtd=False):
     """
     Given a path to an XML file and a tag name (without namespace), stream
     through the XML, and emit the element denoted by tag for processing, e.g.
@@ -417,25 +1017,42 @@ def xmlstream(filename, tag):
         for snippet in xmlstream("sample.xml", "sometag"):
             print(len(snippet))
 
-    """
-    def strip_ns(tag):
-        if not '}' in tag:
-            return tag
-        return tag.split('}')[1]
+    Output can be "bytes" (serialized element), "dict" (see etree_to_dict) or
+    "element" (an lxml element, only valid until the next record is read).
+    Processed elements are freed, so memory usage stays flat for large files.
 
-    # https://stackoverflow.com/a/13261805, http://effbot.org/elementtree/iterparse.htm
-    context = iter(ET.iterparse(filename, events=(
-        'start',
-        'end',
-    )))
-    try:
-        _, root = next(context)
-    except StopIteration:
-        return
+    If func is given, it is applied to each record, records for which func
+    returns None are dropped. With workers, the file is split into chunks of
+    about chunk_size bytes at record boundaries (see xmlstream_chunks, records
+    must share a single parent element), which are processed in a process
+    pool; records are still emitted in order. In that case, func must be
+    picklable, e.g. a module level function, and "element" output is only
+    allowed together with a func.
 
-    for event, elem in context:
-        if not strip_ns(elem.tag) == tag or event == 'start':
-            continue
+        for doc in xmlstream("dblp.xml", "article", output="dict", workers=4, load_dtd=True):
+            print(doc["article"]["title"])
 
-        yield ET.tostring(elem)
-        root.clear()
+    Set load_dtd, if the document uses entities defined in an external DTD.
+    """
+    if output not in ('bytes', 'dict', 'element'):
+        raise ValueError('output must be one of bytes, dict or element: %s' % output)
+    if not workers:
+        for record in _xmlstream_records(filename, tag, output=output, func=func, load_dtd=load_dtd):
+            yield record
+        return
+    if output == 'element' and func is None:
+        raise ValueError('elements cannot be passed between processes, use bytes, dict or a func')
+
+    header, trailer, chunks = xmlstream_chunks(filename, tag, chunk_size=chunk_size)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for i, (start, end) in enumerate(chunks):
+            # The last chunk already ends with the trailer.
+            pending.append(
+                executor.submit(_xmlstream_chunk, filename, start, end, header, trailer if i < len(chunks) - 1 else b'', tag, output, func, load_dtd))
+            if len(pending) >= 2 * workers:
+                for record in pending.popleft().result():
+                    yield record
+        while pending:
+            for record in pending.popleft().result():
+                yield record
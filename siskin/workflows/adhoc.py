@@ -29,6 +29,7 @@
 
 import datetime
 import json
+import shutil
 import tempfile
 
 import requests
@@ -43,7 +44,7 @@ from siskin.sources.degruyter import DegruyterExport
 from siskin.sources.elsevierjournals import ElsevierJournalsExport
 from siskin.sources.jstor import JstorExport
 from siskin.task import DefaultTask
-from siskin.utils import SetEncoder, load_set_from_target
+from siskin.utils import SetEncoder, URLCache, load_set_from_target
 
 
 class AdhocTask(DefaultTask):
@@ -156,33 +157,45 @@ class K10Matches(AdhocTask):
 
     ai = luigi.Parameter(default="http://localhost:8983/solr/biblio")
     finc = luigi.Parameter(default="http://localhost:8983/solr/biblio")
+    workers = luigi.IntParameter(default=4, significant=False, description='number of concurrent requests')
 
     def run(self):
         r = requests.get("https://is.gd/AW3bCB")
-        with self.output().open("w") as output:
-            for line in r.text.split('\n'):
-                try:
-                    issn, count = line.split(',')
-
-                    results = {}
-
-                    results['ai'] = requests.get("%s/select?q=issn:%s&rows=0&wt=json" % (self.ai, issn))
-                    if results['ai'].status_code != 200:
-                        raise RuntimeError("ai reponded with %s" % rr.status_code)
-
-                    results['finc'] = requests.get("%s/select?q=issn:%s&rows=0&wt=json" % (self.finc, issn))
-                    if results['finc'].status_code != 200:
-                        raise RuntimeError("finc reponded with %s" % rr.status_code)
 
-                    output.write_tsv(
-                        issn,
-                        count,
-                        str(results['ai'].json().get("response").get("numFound")),
-                        str(results['finc'].json().get("response").get("numFound")),
-                    )
-
-                except Exception as exc:
+        rows = []
+        for line in r.text.split('\n'):
+            try:
+                issn, count = line.split(',')
+            except ValueError as exc:
+                self.logger.debug(exc)
+                continue
+            rows.append((issn, count))
+
+        # Counts change with every index update, so only cache for this run.
+        cachedir = tempfile.mkdtemp(prefix='siskin-')
+        cache = URLCache(directory=cachedir, max_tries=3)
+        links = []
+        for issn, _ in rows:
+            links.append("%s/select?q=issn:%s&rows=0&wt=json" % (self.ai, issn))
+            links.append("%s/select?q=issn:%s&rows=0&wt=json" % (self.finc, issn))
+
+        found = {}
+        try:
+            for link, body in cache.get_many(links, workers=self.workers, skip_errors=True):
+                try:
+                    found[link] = str(json.loads(body).get("response").get("numFound"))
+                except (ValueError, AttributeError) as exc:
                     self.logger.debug(exc)
+        finally:
+            shutil.rmtree(cachedir)
+
+        with self.output().open("w") as output:
+            for issn, count in rows:
+                ai = found.get("%s/select?q=issn:%s&rows=0&wt=json" % (self.ai, issn))
+                finc = found.get("%s/select?q=issn:%s&rows=0&wt=json" % (self.finc, issn))
+                if ai is None or finc is None:
+                    continue
+                output.write_tsv(issn, count, ai, finc)
 
     def output(self):
         return luigi.LocalTarget(path=self.path(digest=True), format=TSV)
@@ -50,12 +50,14 @@ import luigi
 import rdflib
 from bs4 import BeautifulSoup
 from gluish.common import Executable
-from gluish.format import TSV, Gzip
+from gluish.format import TSV
 from gluish.intervals import weekly
 from gluish.parameter import ClosestDateParameter
 from gluish.utils import shellout
+from siskin import delta, ndjson, solr
 from siskin.benchmark import timed
 from siskin.database import sqlitedb
+from siskin.seekable import cat_command
 from siskin.sources.amsl import (AMSLFilterConfigFreeze, AMSLFreeContent, AMSLHoldingsFile, AMSLOpenAccessKBART, AMSLService)
 from siskin.sources.base import BaseSingleFile
 from siskin.sources.ceeol import CeeolIntermediateSchema
@@ -74,7 +76,47 @@ from siskin.sources.pqdt import PQDTIntermediateSchema
 from siskin.sources.springer import SpringerIntermediateSchema
 from siskin.sources.thieme import ThiemeIntermediateSchema, ThiemeISSNList
 from siskin.task import DefaultTask
-from siskin.utils import URLCache, load_set_from_target
+from siskin.utils import URLCache, merge_sorted, overlap_counts
+
+
+# Source preferences for DOI deduplication, preferred sources first.
+GROUPCOVER_PREFS = '85 55 89 60 50 105 34 101 53 49 28 48 121'
+
+
+def intermediate_schema_tasks(date):
+    """
+    Return a dictionary from source id to the intermediate schema task of
+    each AI source.
+    """
+    tasks = [
+        CeeolIntermediateSchema(stamp=True),
+        CrossrefIntermediateSchema(date=date, stamp=True),
+        DOAJIntermediateSchema(date=date, stamp=True, format="doaj-oai"),
+        DegruyterIntermediateSchema(date=date, stamp=True),
+        ElsevierJournalsIntermediateSchema(date=date, stamp=True),
+        GenderopenIntermediateSchema(date=date, stamp=True),
+        IEEEIntermediateSchema(date=date, stamp=True),
+        IJOCIntermediateSchema(stamp=True),
+        JstorIntermediateSchema(date=date, stamp=True),
+        LissaIntermediateSchema(date=date, stamp=True),
+        OLCIntermediateSchema(date=date, stamp=True),
+        PQDTIntermediateSchema(stamp=True),
+        ThiemeIntermediateSchema(date=date, stamp=True),
+    ]
+    return collections.OrderedDict((task.TAG, task) for task in tasks)
+
+
+def jour_fixe(date, override=False):
+    """
+    Return the date of the filter config to use for licensing, the 15th of
+    the month (or the month before), unless override is set.
+    """
+    if override:
+        return date
+    jourfixe = datetime.date(date.year, date.month, 15)
+    if date.day < 15:
+        jourfixe = jourfixe + relativedelta(months=-1)
+    return jourfixe
 
 
 class AITask(DefaultTask):
@@ -106,37 +148,37 @@ class AIIntermediateSchema(AITask):
     is put here, will pass along the ISIL attachment and deduplication
     pipeline.
 
-    All inputs must be gzipped, output will be gzipped.
+    All inputs must be gzip or zstd compressed, output will be gzip or
+    seekable zstd, see DefaultTask.compression. A block index is written
+    next to the output, see siskin.blocks.
     """
+    INDEX = True
+    LOOKUP_FIELDS = ('finc.id', 'doi', 'finc.record_id')
 
     date = ClosestDateParameter(default=datetime.date.today())
 
     def requires(self):
-        return [
-            CeeolIntermediateSchema(stamp=True),
-            CrossrefIntermediateSchema(date=self.date, stamp=True),
-            DOAJIntermediateSchema(date=self.date, stamp=True, format="doaj-oai"),
-            DegruyterIntermediateSchema(date=self.date, stamp=True),
-            ElsevierJournalsIntermediateSchema(date=self.date, stamp=True),
-            GenderopenIntermediateSchema(date=self.date, stamp=True),
-            IEEEIntermediateSchema(date=self.date, stamp=True),
-            IJOCIntermediateSchema(stamp=True),
-            JstorIntermediateSchema(date=self.date, stamp=True),
-            LissaIntermediateSchema(date=self.date, stamp=True),
-            OLCIntermediateSchema(date=self.date, stamp=True),
-            PQDTIntermediateSchema(stamp=True),
-            ThiemeIntermediateSchema(date=self.date, stamp=True),
-        ]
+        return list(intermediate_schema_tasks(self.date).values())
 
     @timed
     def run(self):
         """
-        Check, if all files are gzipped before we concatenate.
+        Check, if all files are gzipped (or zstd compressed). Gzip files are
+        concatenated, if the output is gzip as well.
         """
+        magic = {}
         for target in self.input():
             with open(target.path, "rb") as f:
-                if binascii.hexlify(f.read(2)) != b'1f8b':
-                    raise RuntimeError('AIIntermediateSchema requires gzipped inputs, failed: %s' % target.path)
+                magic[target.path] = binascii.hexlify(f.read(4))
+                if magic[target.path][:4] != b'1f8b' and magic[target.path] != b'28b52ffd':
+                    raise RuntimeError('AIIntermediateSchema requires gzip or zstd inputs, failed: %s' % target.path)
+
+        if self.compression() == 'zstd' or any(v[:4] != b'1f8b' for v in magic.values()):
+            output = shellout("({cats}) | {compress} > {output}",
+                              cats='; '.join('%s "%s"' % (cat_command(target.path), target.path) for target in self.input()),
+                              compress=self.compress_command())
+            luigi.LocalTarget(output).move(self.output().path)
+            return
 
         _, stopover = tempfile.mkstemp(prefix='siskin-')
         for target in self.input():
@@ -144,7 +186,7 @@ class AIIntermediateSchema(AITask):
         luigi.LocalTarget(stopover).move(self.output().path)
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(ext='ldj.gz'), format=Gzip)
+        return self.compressed_target(ext='ldj')
 
 
 class AIRedact(AITask):
@@ -159,11 +201,14 @@ class AIRedact(AITask):
     @timed
     def run(self):
         """ A bit slower: `jq 'del(.["x.fulltext"])' input > output` """
-        output = shellout("span-redact <(unpigz -c {input}) | pigz -c > {output}", input=self.input().path)
+        output = shellout("span-redact <({cat} {input}) | {compress} > {output}",
+                          cat=cat_command(self.input().path),
+                          input=self.input().path,
+                          compress=self.compress_command())
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(ext='ldj.gz'), format=Gzip)
+        return self.compressed_target(ext='ldj')
 
 
 class AILicensing(AITask):
@@ -175,19 +220,18 @@ class AILicensing(AITask):
     Example crontab (assuming virtual environment named siskin):
 
         00 12  * * * source $HOME/.virtualenvs/siskin/bin/activate && taskdo AMSLFilterConfigFreeze --local-scheduler
+
+    A block index is written next to the output, see siskin.blocks.
     """
+    INDEX = True
+    LOOKUP_FIELDS = ('finc.id', 'doi', 'finc.record_id')
+
     date = ClosestDateParameter(default=datetime.date.today())
     override = luigi.BoolParameter(description="do not use jour fixe", significant=False)
     drop = luigi.BoolParameter(description="drop records w/o isil")
 
     def requires(self):
-        if self.override:
-            jourfixe = self.date
-        else:
-            jourfixe = datetime.date(self.date.year, self.date.month, 15)
-            if self.date.day < 15:
-                jourfixe = jourfixe + relativedelta(months=-1)
-
+        jourfixe = jour_fixe(self.date, override=self.override)
         self.logger.debug("AILicensing date: %s (override=%s)", jourfixe, self.override)
 
         return {
@@ -199,18 +243,16 @@ class AILicensing(AITask):
         """
         A recent version of span might be required.
         """
-        if self.drop:
-            output = shellout("span-tag -D -unfreeze {config} <(unpigz -c {input}) | pigz -c > {output}",
-                              config=self.input().get('config').path,
-                              input=self.input().get('is').path)
-        else:
-            output = shellout("span-tag -unfreeze {config} <(unpigz -c {input}) | pigz -c > {output}",
-                              config=self.input().get('config').path,
-                              input=self.input().get('is').path)
+        output = shellout("span-tag {drop} -unfreeze {config} <({cat} {input}) | {compress} > {output}",
+                          drop='-D' if self.drop else '',
+                          config=self.input().get('config').path,
+                          cat=cat_command(self.input().get('is').path),
+                          input=self.input().get('is').path,
+                          compress=self.compress_command())
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(ext='ldj.gz'), format=Gzip)
+        return self.compressed_target(ext='ldj')
 
 
 class AILocalData(AITask):
@@ -227,7 +269,8 @@ class AILocalData(AITask):
         """
         Unzip on the fly, extract fields as CSV, sort be third column.
         """
-        output = shellout("""unpigz -c {input} | span-local-data -b {size} | LC_ALL=C sort --ignore-case -S20% -t, -k3 > {output} """,
+        output = shellout("""{cat} {input} | span-local-data -b {size} | LC_ALL=C sort --ignore-case -S20% -t, -k3 > {output} """,
+                          cat=cat_command(self.input().path),
                           size=self.batchsize,
                           input=self.input().path)
         luigi.LocalTarget(output).move(self.output().path)
@@ -247,7 +290,7 @@ class AIInstitutionChanges(AITask):
         return AILocalData(date=self.date)
 
     def run(self):
-        output = shellout("""groupcover -lower -prefs '85 55 89 60 50 105 34 101 53 49 28 48 121' < {input} > {output}""", input=self.input().path)
+        output = shellout("""groupcover -lower -prefs '{prefs}' < {input} > {output}""", prefs=GROUPCOVER_PREFS, input=self.input().path)
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
@@ -258,6 +301,7 @@ class AIIntermediateSchemaDeduplicated(AITask):
     """
     A DOI deduplicated version of the intermediate schema. Experimental.
     """
+    LOOKUP_FIELDS = ('finc.id', 'doi', 'finc.record_id')
     date = ClosestDateParameter(default=datetime.date.today())
 
     def requires(self):
@@ -271,13 +315,15 @@ class AIIntermediateSchemaDeduplicated(AITask):
         Update intermediate schema labels from file. We cut out the ID and the
         ISIL list from the changes.
         """
-        output = shellout("unpigz -c {input} | span-update-labels -b 20000 -f <(cut -d, -f1,4- {file}) | pigz -c > {output}",
+        output = shellout("{cat} {input} | span-update-labels -b 20000 -f <(cut -d, -f1,4- {file}) | {compress} > {output}",
+                          cat=cat_command(self.input().get('file').path),
                           input=self.input().get('file').path,
-                          file=self.input().get('changes').path)
+                          file=self.input().get('changes').path,
+                          compress=self.compress_command())
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(ext='ldj.gz'), format=Gzip)
+        return self.compressed_target(ext='ldj')
 
 
 class AIExport(AITask):
@@ -298,22 +344,130 @@ class AIExport(AITask):
 
     def run(self):
         _, tmp = tempfile.mkstemp(prefix='siskin-')
+        extra = []
 
         if self.format == 'solr5vu3':
-            shellout("""cat "{input}" >> "{output}" """, input=self.input().get("base").path, output=tmp)
-            shellout("""cat "{input}" >> "{output}" """, input=self.input().get("perinorm").path, output=tmp)
+            extra = [self.input().get("base").path, self.input().get("perinorm").path]
         else:
             self.logger.debug('ignoring [126] BASE, since format is: %s', self.format)
 
-        shellout("span-export -o {format} <(unpigz -c {input}) | pigz -c >> {output}", format=self.format, input=self.input().get('ai').path, output=tmp)
+        if self.compression() == 'zstd':
+            # Seekable zstd files cannot be concatenated, compress all at once.
+            shellout("""({extra} span-export -o {format} <({cat} {input})) | {compress} > {output}""",
+                     extra=''.join('%s "%s"; ' % (cat_command(path), path) for path in extra),
+                     format=self.format,
+                     cat=cat_command(self.input().get('ai').path),
+                     input=self.input().get('ai').path,
+                     compress=self.compress_command(),
+                     output=tmp)
+            luigi.LocalTarget(tmp).move(self.output().path)
+            return
+
+        for path in extra:
+            shellout("""cat "{input}" >> "{output}" """, input=path, output=tmp)
+        shellout("span-export -o {format} <({cat} {input}) | {compress} >> {output}",
+                 format=self.format,
+                 cat=cat_command(self.input().get('ai').path),
+                 input=self.input().get('ai').path,
+                 compress=self.compress_command(),
+                 output=tmp)
         luigi.LocalTarget(tmp).move(self.output().path)
 
+    def lookup_fields(self):
+        if self.format == 'solr5vu3':
+            return ('id', 'doi_str_mv', 'record_id')
+        return ()
+
     def output(self):
         extensions = {
-            'solr5vu3': 'ldj.gz',
-            'formeta': 'form.gz',
+            'solr5vu3': 'ldj',
+            'formeta': 'form',
         }
-        return luigi.LocalTarget(path=self.path(ext=extensions.get(self.format, 'gz')))
+        return self.compressed_target(ext=extensions.get(self.format))
+
+
+class AIExportDelta(AITask):
+    """
+    Changes since a previous export, for incremental index updates: new or
+    changed documents (upserts), ids of documents no longer exported
+    (deletes) and counts, compared by id and content, see siskin.delta.
+    """
+    date = ClosestDateParameter(default=datetime.date.today())
+    previous = luigi.DateParameter(description='date of the previous, indexed export')
+
+    def requires(self):
+        return {
+            'previous': AIExport(date=self.previous),
+            'current': AIExport(date=self.date),
+        }
+
+    @timed
+    def run(self):
+        with self.output().get('upserts').open('w') as upserts:
+            with self.output().get('deletes').open('w') as deletes:
+                stats = delta.diff(self.input().get('previous').path,
+                                   self.input().get('current').path,
+                                   upserts,
+                                   deletes,
+                                   field='id',
+                                   directory=os.path.dirname(self.output().get('counts').path))
+        self.record_count = stats['records.new']
+        with self.output().get('counts').open('w') as output:
+            for key, value in sorted(stats.items()):
+                output.write_tsv(key, value)
+
+    def output(self):
+        return {
+            'upserts': self.compressed_target(ext='upserts.ldj'),
+            'deletes': luigi.LocalTarget(path=self.path(ext='deletes.txt'), format=luigi.format.Nop),
+            'counts': luigi.LocalTarget(path=self.path(ext='counts.tsv'), format=TSV),
+        }
+
+
+class AIIndex(AITask):
+    """
+    Index the export into solr, see siskin.solr. The output lists the number
+    of documents indexed and deleted, retries and throughput.
+
+    With previous set to the date of the last indexed export, only changed
+    documents are sent and documents no longer exported are deleted, see
+    AIExportDelta. The update URL is [ai] solr-update-url, if not given.
+    """
+    date = ClosestDateParameter(default=datetime.date.today())
+    previous = luigi.DateParameter(default=None, description='date of the last indexed export')
+
+    url = luigi.Parameter(default='', significant=False, description='solr core or update handler URL')
+    workers = luigi.IntParameter(default=4, significant=False, description='number of concurrent requests')
+    batch_size = luigi.IntParameter(default=2000, significant=False, description='documents per request')
+    commit = luigi.ChoiceParameter(default='hard', choices=solr.COMMIT_POLICIES, significant=False, description='commit at the end: none, soft, hard')
+    commit_within = luigi.OptionalIntParameter(default=None, significant=False, description='ask solr to commit each batch within milliseconds')
+
+    def requires(self):
+        if self.previous:
+            return AIExportDelta(date=self.date, previous=self.previous)
+        return AIExport(date=self.date)
+
+    @timed
+    def run(self):
+        url = self.url or self.config.get('ai', 'solr-update-url')
+        indexer = solr.Indexer(url, batch_size=self.batch_size, workers=self.workers, commit=self.commit, commit_within=self.commit_within)
+        if self.previous:
+            with self.input().get('deletes').open() as handle:
+                indexer.delete(line.decode('utf-8') for line in handle)
+            path = self.input().get('upserts').path
+        else:
+            path = self.input().path
+        with ndjson.open_file(path) as handle:
+            indexer.index(handle)
+        stats = indexer.finish()
+        self.record_count = stats['docs']
+        with self.output().open('w') as output:
+            output.write_tsv('url', url)
+            for key, value in sorted(stats.items()):
+                output.write_tsv(key, value)
+
+    def output(self):
+        return luigi.LocalTarget(path=self.path(), format=TSV)
 
 
 class AIUpdate(AITask, luigi.WrapperTask):
@@ -336,6 +490,10 @@ class AIUpdate(AITask, luigi.WrapperTask):
 class AIDOIStats(AITask):
     """
     DOI overlaps between various sources.
+
+    The lists are merged in one pass and must be sorted bytewise (LC_ALL=C).
+    List tasks sorted that way write *.c.tsv files, so lists sorted in locale
+    order by earlier versions are not reused, but rebuilt.
     """
     date = ClosestDateParameter(default=datetime.date.today())
 
@@ -349,11 +507,11 @@ class AIDOIStats(AITask):
 
     @timed
     def run(self):
+        names = list(self.input().keys())
+        sizes, counts = overlap_counts([self.input().get(name) for name in names], names=names)
         with self.output().open('w') as output:
-            for k1, k2 in itertools.combinations(list(self.input().keys()), 2):
-                s1 = load_set_from_target(self.input().get(k1))
-                s2 = load_set_from_target(self.input().get(k2))
-                output.write_tsv(k1, k2, str(len(s1)), str(len(s2)), str(len(s1.intersection(s2))))
+            for i, j in itertools.combinations(range(len(names)), 2):
+                output.write_tsv(names[i], names[j], str(sizes[i]), str(sizes[j]), str(counts[(i, j)]))
 
     def output(self):
         return luigi.LocalTarget(path=self.path(), format=TSV)
@@ -375,11 +533,11 @@ class AIISSNStats(AITask):
 
     @timed
     def run(self):
+        names = list(self.input().keys())
+        sizes, counts = overlap_counts([self.input().get(name) for name in names], names=names)
         with self.output().open('w') as output:
-            for k1, k2 in itertools.combinations(list(self.input().keys()), 2):
-                s1 = load_set_from_target(self.input().get(k1))
-                s2 = load_set_from_target(self.input().get(k2))
-                output.write_tsv(k1, k2, len(s1), len(s2), len(s1.intersection(s2)))
+            for i, j in itertools.combinations(range(len(names)), 2):
+                output.write_tsv(names[i], names[j], str(sizes[i]), str(sizes[j]), str(counts[(i, j)]))
 
     def output(self):
         return luigi.LocalTarget(path=self.path(), format=TSV)
@@ -401,12 +559,26 @@ class AIISSNOverlaps(AITask):
 
     @timed
     def run(self):
-        with self.output().open('w') as output:
-            for k1, k2 in itertools.combinations(list(self.input().keys()), 2):
-                s1 = load_set_from_target(self.input().get(k1))
-                s2 = load_set_from_target(self.input().get(k2))
-                for issn in sorted(s1.intersection(s2)):
-                    output.write_tsv(k1, k2, issn)
+        """
+        Single pass over all lists; rows are collected per pair in temporary
+        files, to keep the output grouped by pair.
+        """
+        names = list(self.input().keys())
+        pairs = list(itertools.combinations(range(len(names)), 2))
+        files = dict((pair, tempfile.TemporaryFile()) for pair in pairs)
+        try:
+            for issn, members in merge_sorted([self.input().get(name) for name in names], names=names):
+                if isinstance(issn, bytes):
+                    issn = issn.decode('utf-8')
+                for i, j in itertools.combinations(members, 2):
+                    files[(i, j)].write(('%s\t%s\t%s\n' % (names[i], names[j], issn)).encode('utf-8'))
+            with self.output().open('w') as output:
+                for pair in pairs:
+                    files[pair].seek(0)
+                    shutil.copyfileobj(files[pair], output)
+        finally:
+            for handle in files.values():
+                handle.close()
 
     def output(self):
         return luigi.LocalTarget(path=self.path(), format=TSV)
@@ -573,6 +745,8 @@ class AIISSNCoverageCatalogMatches(AITask):
     """
     date = ClosestDateParameter(default=datetime.date.today())
     isil = luigi.Parameter(default='DE-15')
+    workers = luigi.IntParameter(default=4, significant=False, description='number of concurrent requests')
+    rate = luigi.FloatParameter(default=2.0, significant=False, description='requests per second per host')
 
     def requires(self):
         return AICoverageISSN(date=self.date, isil=self.isil)
@@ -585,28 +759,34 @@ class AIISSNCoverageCatalogMatches(AITask):
         adapter = requests.adapters.HTTPAdapter(max_retries=3)
         cache.sess.mount('http://', adapter)
 
+        def catalog_status(body):
+            """ Given a catalog result page, return a status string. """
+            if 'Keine Ergebnisse!' in body:
+                return 'ERR_NOT_IN_CATALOG'
+            soup = BeautifulSoup(body)
+            rs = soup.findAll("div", {"class": "floatleft"})
+            if len(rs) == 0:
+                return 'ERR_LAYOUT'
+            match = re.search(r'Treffer([0-9]+)-([0-9]+)von([0-9]+)', rs[0].text)
+            if match:
+                return 'FOUND_RESULTS_%s' % match.group(3)
+            return 'ERR_NO_MATCH'
+
+        rows = []  # ISSN and link for each input row, in input order.
         with self.input().open() as handle:
-            with self.output().open('w') as output:
-                for i, row in enumerate(handle.iter_tsv(cols=('issn', 'status'))):
-                    if row.status == 'NOT_FOUND':
-                        link = 'https://katalog.ub.uni-leipzig.de/Search/Results?lookfor=%s&type=ISN' % row.issn
-                        self.logger.info('fetch #%05d: %s' % (i, link))
-                        body = cache.get(link)
-                        if 'Keine Ergebnisse!' in body:
-                            output.write_tsv(row.issn, 'ERR_NOT_IN_CATALOG', link)
-                        else:
-                            soup = BeautifulSoup(body)
-                            rs = soup.findAll("div", {"class": "floatleft"})
-                            if len(rs) == 0:
-                                output.write_tsv(row.issn, 'ERR_LAYOUT', link)
-                                continue
-                            first = rs[0]
-                            match = re.search(r'Treffer([0-9]+)-([0-9]+)von([0-9]+)', first.text)
-                            if match:
-                                total = match.group(3)
-                                output.write_tsv(row.issn, 'FOUND_RESULTS_%s' % total, link)
-                            else:
-                                output.write_tsv(row.issn, 'ERR_NO_MATCH', link)
+            for row in handle.iter_tsv(cols=('issn', 'status')):
+                if row.status == 'NOT_FOUND':
+                    rows.append((row.issn, 'https://katalog.ub.uni-leipzig.de/Search/Results?lookfor=%s&type=ISN' % row.issn))
+
+        status = {}
+        links = collections.OrderedDict.fromkeys(link for _, link in rows)
+        for i, (link, body) in enumerate(cache.get_many(links, workers=self.workers, rate=self.rate)):
+            self.logger.info('fetch #%05d: %s', i, link)
+            status[link] = catalog_status(body)
+
+        with self.output().open('w') as output:
+            for issn, link in rows:
+                output.write_tsv(issn, status[link], link)
 
     def output(self):
         return luigi.LocalTarget(path=self.path(), format=TSV)
@@ -615,6 +795,8 @@ class AIISSNCoverageCatalogMatches(AITask):
 class AIISSNCoverageSolrMatches(AITask):
     date = ClosestDateParameter(default=datetime.date.today())
     isil = luigi.Parameter(default='DE-15')
+    workers = luigi.IntParameter(default=4, significant=False, description='number of concurrent requests')
+    rate = luigi.FloatParameter(default=2.0, significant=False, description='requests per second per host')
 
     def requires(self):
         return AICoverageISSN(date=self.date, isil=self.isil)
@@ -630,23 +812,23 @@ class AIISSNCoverageSolrMatches(AITask):
         finc = self.config.get('ai', 'finc-solr')
         ai = self.config.get('ai', 'ai-solr')
 
-        def numFound(link):
-            """ Given a SOLR query URL, return the number of docs found. """
-            body = cache.get(link)
-            content = json.loads(body)
-            return content['response']['numFound']
-
+        rows = []  # Index name, ISSN and SOLR query URL for each input row, in input order.
         with self.input().open() as handle:
-            with self.output().open('w') as output:
-                for i, row in enumerate(handle.iter_tsv(cols=('issn', 'status'))):
-                    if row.status == 'NOT_FOUND':
-                        link = '%s/select?q=institution:%s+AND+issn:%s&wt=json' % (finc, self.isil, row.issn)
-                        self.logger.info('fetch #%05d: %s', i, link)
-                        output.write_tsv('finc', row.issn, numFound(link), link)
-                    else:
-                        link = '%s/select?q=institution:%s+AND+issn:%s&wt=json' % (ai, self.isil, row.issn)
-                        self.logger.info('fetch #%05d: %s', i, link)
-                        output.write_tsv('ai', row.issn, numFound(link), link)
+            for row in handle.iter_tsv(cols=('issn', 'status')):
+                if row.status == 'NOT_FOUND':
+                    rows.append(('finc', row.issn, '%s/select?q=institution:%s+AND+issn:%s&wt=json' % (finc, self.isil, row.issn)))
+                else:
+                    rows.append(('ai', row.issn, '%s/select?q=institution:%s+AND+issn:%s&wt=json' % (ai, self.isil, row.issn)))
+
+        found = {}  # Map link to the number of docs found.
+        links = collections.OrderedDict.fromkeys(link for _, _, link in rows)
+        for i, (link, body) in enumerate(cache.get_many(links, workers=self.workers, rate=self.rate)):
+            self.logger.info('fetch #%05d: %s', i, link)
+            found[link] = json.loads(body)['response']['numFound']
+
+        with self.output().open('w') as output:
+            for name, issn, link in rows:
+                output.write_tsv(name, issn, found[link], link)
 
     def output(self):
         return luigi.LocalTarget(path=self.path(), format=TSV)
@@ -679,16 +861,18 @@ class AIApplyOpenAccessFlag(AITask):
         #12738. Mark sids as open access via -oasid (span 0.1.272 and later).
         """
 
-        output = shellout("""unpigz -c {input} |
+        output = shellout("""{cat} {input} |
                              span-oa-filter -b 25000 -f {kbart} -fc {amslfc} -xsid 48 -oasid 28 -oasid 30 -oasid 34 |
-                             pigz -c > {output}""",
+                             {compress} > {output}""",
+                          cat=cat_command(self.input().get('file').path),
                           input=self.input().get('file').path,
                           kbart=self.input().get('kbart').path,
-                          amslfc=self.input().get('amslfc').path)
+                          amslfc=self.input().get('amslfc').path,
+                          compress=self.compress_command())
         luigi.LocalTarget(output).move(self.output().path)
 
     def output(self):
-        return luigi.LocalTarget(path=self.path(ext='ldj.gz'), format=Gzip)
+        return self.compressed_target(ext='ldj')
 
 
 class AIDOIList(AITask):
@@ -704,7 +888,8 @@ class AIDOIList(AITask):
         return AILicensing(date=self.date)
 
     def run(self):
-        output = shellout(""" unpigz -c {input} | jq -r 'select(.["x.labels"][]? | contains ("{isil}")) | .doi?' > {output} """,
+        output = shellout(""" {cat} {input} | jq -r 'select(.["x.labels"][]? | contains ("{isil}")) | .doi?' > {output} """,
+                          cat=cat_command(self.input().path),
                           input=self.input().path,
                           isil=self.isil)
         luigi.LocalTarget(output).move(self.output().path)
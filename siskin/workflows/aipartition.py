@@ -0,0 +1,389 @@
+# coding: utf-8
+# pylint: disable=C0301,E1101,C0103
+
+# Copyright 2021 by Leipzig University Library, http://ub.uni-leipzig.de
+#                   The Finc Authors, http://finc.info
+#                   Martin Czygan, <martin.czygan@uni-leipzig.de>
+#
+# This file is part of some open source application.
+#
+# Some open source application is free software: you can redistribute
+# it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, either
+# version 3 of the License, or (at your option) any later version.
+#
+# Some open source application is distributed in the hope that it will
+# be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+#
+# @license GPL-3.0+ <http://spdx.org/licenses/GPL-3.0+>
+"""
+Aggregated index workflow, partitioned by source.
+
+AIIntermediateSchema concatenates all sources and every following stage
+runs over everything. Here, open access flagging, licensing, redaction and
+export run per source id (partition) in separate tasks, so luigi workers
+can run them in parallel, and the results are merged at the end:
+
+    $ taskdo AIPartitionedUpdate --workers 8
+
+    AIPartitionOpenAccessFlag (per source)
+      AIPartitionRedact (per source)      -> AIPartitionedRedact (merge)
+      AIPartitionLicensing (per source)   -> AIPartitionedLicensing (merge)
+        AIPartitionLocalData (per source) -> AIPartitionedInstitutionChanges (all sources)
+          AIPartitionExport (per source)  -> AIPartitionedExport (merge)
+
+Partition results are stored by a fingerprint of the input contents, the
+command and the span version (see siskin.cas.ResultCache). If a previous run
+computed the same, its result is reused, so a weekly update only recomputes
+partitions of sources that actually changed. The export of a partition only
+depends on the DOI deduplication changes of its own records.
+"""
+
+import datetime
+import functools
+import os
+import shutil
+import subprocess
+import tempfile
+
+import luigi
+from gluish.parameter import ClosestDateParameter
+from gluish.utils import shellout
+from siskin import seekable
+from siskin.benchmark import timed
+from siskin.cas import ResultCache, fingerprint
+from siskin.seekable import cat_command
+from siskin.sources.amsl import (AMSLFilterConfigFreeze, AMSLFreeContent, AMSLOpenAccessKBART)
+from siskin.sources.base import BaseSingleFile
+from siskin.sources.perinorm import PerinormExport
+from siskin.workflows.ai import (GROUPCOVER_PREFS, AITask, intermediate_schema_tasks, jour_fixe)
+
+
+@functools.lru_cache()
+def span_version():
+    """
+    Return the installed span version or an empty string.
+    """
+    try:
+        return subprocess.check_output(['span-tag', '-v'], stderr=subprocess.STDOUT).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def merge_files(paths, output, compress='pigz -c'):
+    """
+    Merge compressed files into a file at output. Gzip files are concatenated
+    into a gzip output, seekable zstd files into a zstd output; otherwise all
+    data is recompressed with the compress command. The format is taken from
+    the extension, so temporary outputs need the suffix of the target.
+    """
+    if output.endswith('.gz') and all(path.endswith('.gz') for path in paths):
+        with open(output, 'wb') as handle:
+            for path in paths:
+                with open(path, 'rb') as src:
+                    shutil.copyfileobj(src, handle, 1 << 20)
+        return
+    if output.endswith('.zst') and all(path.endswith('.zst') and seekable.is_seekable(path) for path in paths):
+        with open(output, 'wb') as handle:
+            seekable.concat(paths, handle)
+        return
+    shellout("({cats}) | {compress} > {output}",
+             cats='; '.join('%s "%s"' % (cat_command(path), path) for path in paths) or 'true',
+             compress=compress,
+             output=output)
+
+
+class AIPartitionTask(AITask):
+    """
+    Base task for a single source of the AI, with reuse of earlier results.
+    """
+    date = ClosestDateParameter(default=datetime.date.today())
+    source = luigi.Parameter(description='source id, e.g. 49')
+
+    def source_task(self):
+        tasks = intermediate_schema_tasks(self.date)
+        if self.source not in tasks:
+            raise ValueError('not an AI source: %s, choose from: %s' % (self.source, ', '.join(tasks)))
+        return tasks[self.source]
+
+    def run_cached(self, template, files, **kwargs):
+        """
+        Run a shellout template, that writes to {output}, with input files and
+        other arguments. If a result for the same file contents, template,
+        arguments and span version exists, it is reused instead.
+        """
+        key = fingerprint(paths=[files[name] for name in sorted(files)],
+                          task=self.task_family,
+                          template=template,
+                          kwargs=kwargs,
+                          span=span_version())
+        cache = ResultCache()
+        if cache.get(key, self.output().path):
+            self.logger.debug('%s: reused result %s', self, key)
+            return
+        kwargs.update(files)
+        output = shellout(template, **kwargs)
+        luigi.LocalTarget(output).move(self.output().path)
+        cache.put(key, self.output().path)
+
+
+class AIPartitionOpenAccessFlag(AIPartitionTask):
+    """
+    Apply OA-Flag to a single source, see AIApplyOpenAccessFlag.
+    """
+    def requires(self):
+        return {
+            'amslfc': AMSLFreeContent(date=self.date),
+            'kbart': AMSLOpenAccessKBART(date=self.date),
+            'file': self.source_task(),
+        }
+
+    @timed
+    def run(self):
+        self.run_cached("""{cat} {input} |
+                           span-oa-filter -b 25000 -f {kbart} -fc {amslfc} -xsid 48 -oasid 28 -oasid 30 -oasid 34 |
+                           {compress} > {output}""",
+                        files={
+                            'input': self.input().get('file').path,
+                            'kbart': self.input().get('kbart').path,
+                            'amslfc': self.input().get('amslfc').path,
+                        },
+                        cat=cat_command(self.input().get('file').path),
+                        compress=self.compress_command())
+
+    def output(self):
+        return self.compressed_target(ext='ldj')
+
+
+class AIPartitionRedact(AIPartitionTask):
+    """
+    Redact intermediate schema of a single source, see AIRedact.
+    """
+    def requires(self):
+        return AIPartitionOpenAccessFlag(date=self.date, source=self.source)
+
+    @timed
+    def run(self):
+        self.run_cached("span-redact <({cat} {input}) | {compress} > {output}",
+                        files={'input': self.input().path},
+                        cat=cat_command(self.input().path),
+                        compress=self.compress_command())
+
+    def output(self):
+        return self.compressed_target(ext='ldj')
+
+
+class AIPartitionLicensing(AIPartitionTask):
+    """
+    Attach ISILs to records of a single source, see AILicensing.
+    """
+    override = luigi.BoolParameter(description="do not use jour fixe", significant=False)
+    drop = luigi.BoolParameter(description="drop records w/o isil")
+
+    def requires(self):
+        return {
+            'is': AIPartitionOpenAccessFlag(date=self.date, source=self.source),
+            'config': AMSLFilterConfigFreeze(date=jour_fixe(self.date, override=self.override)),
+        }
+
+    @timed
+    def run(self):
+        self.run_cached("span-tag {drop} -unfreeze {config} <({cat} {input}) | {compress} > {output}",
+                        files={
+                            'input': self.input().get('is').path,
+                            'config': self.input().get('config').path,
+                        },
+                        drop='-D' if self.drop else '',
+                        cat=cat_command(self.input().get('is').path),
+                        compress=self.compress_command())
+
+    def output(self):
+        return self.compressed_target(ext='ldj')
+
+
+class AIPartitionLocalData(AIPartitionTask):
+    """
+    Extract source, id, doi and institutions of a single source, sorted by
+    DOI, see AILocalData.
+    """
+    batchsize = luigi.IntParameter(default=25000, significant=False)
+
+    def requires(self):
+        return AIPartitionLicensing(date=self.date, source=self.source, drop=True)
+
+    @timed
+    def run(self):
+        self.run_cached("""{cat} {input} | span-local-data -b {size} | LC_ALL=C sort --ignore-case -S20% -t, -k3 > {output} """,
+                        files={'input': self.input().path},
+                        cat=cat_command(self.input().path),
+                        size=self.batchsize)
+
+    def output(self):
+        return luigi.LocalTarget(path=self.path(ext='csv'))
+
+
+class AIPartitionedInstitutionChanges(AITask):
+    """
+    Calculate institution changes based on DOI duplicates across all
+    sources, see AIInstitutionChanges. The sorted partitions are merged.
+    """
+    date = ClosestDateParameter(default=datetime.date.today())
+
+    def requires(self):
+        return [AIPartitionLocalData(date=self.date, source=source) for source in intermediate_schema_tasks(self.date)]
+
+    @timed
+    def run(self):
+        output = shellout("""LC_ALL=C sort --ignore-case -S20% -t, -k3 -m {inputs} | groupcover -lower -prefs '{prefs}' > {output}""",
+                          inputs=' '.join('"%s"' % target.path for target in self.input()),
+                          prefs=GROUPCOVER_PREFS)
+        luigi.LocalTarget(output).move(self.output().path)
+
+    def output(self):
+        return luigi.LocalTarget(path=self.path(ext='csv'))
+
+
+class AIPartitionExport(AIPartitionTask):
+    """
+    Apply DOI deduplication changes to the licensed records of a single
+    source and export them, see AIIntermediateSchemaDeduplicated and
+    AIExport.
+    """
+    format = luigi.Parameter(default='solr5vu3', description='export format')
+
+    def requires(self):
+        return {
+            'changes': AIPartitionedInstitutionChanges(date=self.date),
+            'file': AIPartitionLicensing(date=self.date, source=self.source, drop=True),
+        }
+
+    @timed
+    def run(self):
+        """
+        Only the changes of records of this source are used, ids start with
+        "ai-SID-".
+        """
+        changes = shellout("""(grep "^ai-{source}-" {input} || true) | cut -d, -f1,4- > {output}""",
+                           source=self.source,
+                           input=self.input().get('changes').path)
+        try:
+            self.run_cached("""{cat} {input} | span-update-labels -b 20000 -f {changes} |
+                               span-export -o {format} | {compress} > {output}""",
+                            files={'input': self.input().get('file').path, 'changes': changes},
+                            cat=cat_command(self.input().get('file').path),
+                            format=self.format,
+                            compress=self.compress_command())
+        finally:
+            os.remove(changes)
+
+    def output(self):
+        extensions = {
+            'solr5vu3': 'ldj',
+            'formeta': 'form',
+        }
+        return self.compressed_target(ext=extensions.get(self.format))
+
+
+class AIPartitionedLicensing(AITask):
+    """
+    All licensed records, merged from partitions; same as AILicensing.
+    """
+    INDEX = True
+    LOOKUP_FIELDS = ('finc.id', 'doi', 'finc.record_id')
+
+    date = ClosestDateParameter(default=datetime.date.today())
+    override = luigi.BoolParameter(description="do not use jour fixe", significant=False)
+    drop = luigi.BoolParameter(description="drop records w/o isil")
+
+    def requires(self):
+        return [
+            AIPartitionLicensing(date=self.date, source=source, override=self.override, drop=self.drop)
+            for source in intermediate_schema_tasks(self.date)
+        ]
+
+    @timed
+    def run(self):
+        _, tmp = tempfile.mkstemp(prefix='siskin-', suffix=os.path.splitext(self.output().path)[1])
+        merge_files([target.path for target in self.input()], tmp, compress=self.compress_command())
+        luigi.LocalTarget(tmp).move(self.output().path)
+
+    def output(self):
+        return self.compressed_target(ext='ldj')
+
+
+class AIPartitionedRedact(AITask):
+    """
+    Redacted records, merged from partitions; same as AIRedact.
+    """
+    date = ClosestDateParameter(default=datetime.date.today())
+
+    def requires(self):
+        return [AIPartitionRedact(date=self.date, source=source) for source in intermediate_schema_tasks(self.date)]
+
+    @timed
+    def run(self):
+        _, tmp = tempfile.mkstemp(prefix='siskin-', suffix=os.path.splitext(self.output().path)[1])
+        merge_files([target.path for target in self.input()], tmp, compress=self.compress_command())
+        luigi.LocalTarget(tmp).move(self.output().path)
+
+    def output(self):
+        return self.compressed_target(ext='ldj')
+
+
+class AIPartitionedExport(AITask):
+    """
+    Export, merged from partitions, including BASE and Perinorm for
+    solr5vu3; same as AIExport.
+    """
+    INDEX = True
+
+    date = ClosestDateParameter(default=datetime.date.today())
+    format = luigi.Parameter(default='solr5vu3', description='export format')
+
+    def requires(self):
+        return {
+            'partitions': [AIPartitionExport(date=self.date, source=source, format=self.format) for source in intermediate_schema_tasks(self.date)],
+            'base': BaseSingleFile(date=self.date),
+            'perinorm': PerinormExport(),
+        }
+
+    @timed
+    def run(self):
+        paths = [target.path for target in self.input().get('partitions')]
+        if self.format == 'solr5vu3':
+            paths = [self.input().get('base').path, self.input().get('perinorm').path] + paths
+        else:
+            self.logger.debug('ignoring [126] BASE, since format is: %s', self.format)
+        _, tmp = tempfile.mkstemp(prefix='siskin-', suffix=os.path.splitext(self.output().path)[1])
+        merge_files(paths, tmp, compress=self.compress_command())
+        luigi.LocalTarget(tmp).move(self.output().path)
+
+    def output(self):
+        extensions = {
+            'solr5vu3': 'ldj',
+            'formeta': 'form',
+        }
+        return self.compressed_target(ext=extensions.get(self.format))
+
+    def lookup_fields(self):
+        if self.format == 'solr5vu3':
+            return ('id', 'doi_str_mv', 'record_id')
+        return ()
+
+
+class AIPartitionedUpdate(AITask, luigi.WrapperTask):
+    """
+    A wrapper task for partitioned updates, see AIUpdate.
+    """
+    date = ClosestDateParameter(default=datetime.date.today())
+
+    def requires(self):
+        return [AIPartitionedExport(date=self.date), AIPartitionedRedact(date=self.date)]
+
+    def output(self):
+        return self.input()